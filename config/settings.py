@@ -13,7 +13,14 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STORIES_DIR = os.path.join(BASE_DIR, "data", "stories")
 LOGS_DIR = os.path.join(BASE_DIR, "logs")
 STATE_FILE = os.path.join(BASE_DIR, "data", "state.json")
+STATE_JOURNAL_FILE = os.path.join(BASE_DIR, "data", "state.journal")
 TEMPLATE_FILE = os.path.join(BASE_DIR, "config", "story_template.md")
+FINGERPRINT_FILE = os.path.join(BASE_DIR, "data", "fingerprints.json")
+SCAN_CACHE_FILE = os.path.join(BASE_DIR, "data", "scan_cache.json")
+VALIDATION_CACHE_FILE = os.path.join(BASE_DIR, "data", "validation_cache.db")
+COLLECTION_PLAN_FILE = os.path.join(BASE_DIR, "data", "collection_plan.json")
+COLLECTION_PLAN_JOURNAL_FILE = os.path.join(BASE_DIR, "data", "collection_plan.journal")
+ID_COUNTER_FILE = os.path.join(BASE_DIR, "data", "id_counter.json")
 
 # 确保目录存在
 for dir_path in [STORIES_DIR, LOGS_DIR]:
@@ -70,12 +77,25 @@ STORY_CATEGORIES = {
 
 # 故事收集设置
 RETRY_COUNT = 3           # 收集失败时的重试次数
+RETRY_BASE_DELAY = 1.0    # 第一次重试前的最长等待时间(秒)，之后每次加倍
+RETRY_MAX_DELAY = 30.0    # 重试等待时间上限(秒)
+COLLECT_RATE_LIMIT = 2.0  # 每个来源(语言+地区)每秒允许的收集请求数
+COLLECT_BURST = 5         # 每个来源允许的突发请求数
+PLAN_CHECKPOINT_INTERVAL = 20  # 收集计划每完成多少个任务记录一次进度
 BATCH_SIZE = 5            # 每批处理的故事数量
 SIMILARITY_THRESHOLD = 0.85  # 故事相似度阈值，超过则视为重复
+ID_BLOCK_SIZE = 50        # 每次从数据库租用的故事ID数量
+
+# 去重索引设置
+MINHASH_NUM_PERM = 128    # MinHash签名长度
+LSH_BANDS = 64            # LSH分段数，每段行数 = MINHASH_NUM_PERM / LSH_BANDS
+# 候选概率约为 1-(1-J^2)^64，阈值 (1/64)^(1/2)≈0.13；SequenceMatcher 相似度0.85 的
+# 故事3-gram Jaccard 约为0.5，此时几乎必然成为候选，低于这个值的故事由后续比较排除
 
 # 保存设置
 BACKUP_COUNT = 3          # 备份文件保留数量
 USE_ATOMIC_WRITE = True   # 使用原子写入操作
+STATE_COMPACT_THRESHOLD = 1000  # 状态日志记录数超过该值时合并到状态文件
 
 # 数据库配置
 DATABASE = {
@@ -0,0 +1,306 @@
+"""
+全库近似重复聚类
+用LSH找出候选故事对，验证相似度后用并查集合并为重复簇，并输出报告
+
+用法: python -m src.cluster_duplicates [--source stories|fingerprints] [--output 报告路径]
+"""
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# 导入配置和工具
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from config.settings import STORIES_DIR, FINGERPRINT_FILE, SIMILARITY_THRESHOLD, STORY_LANGUAGES
+from utils.fingerprint import load_fingerprints, SimilarityChecker, _compare_rule
+from utils.fingerprint_store import open_fingerprint_store, fingerprint_store_path
+from utils.lsh_index import MinHashLSHIndex
+
+DEFAULT_REPORT_FILE = os.path.join(os.path.dirname(STORIES_DIR), 'duplicate_clusters.json')
+
+# 计算签名时每个任务包含的故事数
+SIGNATURE_CHUNK_SIZE = 256
+
+
+class UnionFind:
+    """并查集"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        """查找所在集合的代表元素"""
+        parent = self.parent.setdefault(key, key)
+        if parent == key:
+            return key
+        # 路径减半
+        while parent != self.parent[parent]:
+            self.parent[parent] = self.parent[self.parent[parent]]
+            parent = self.parent[parent]
+        self.parent[key] = parent
+        return parent
+
+    def union(self, key1, key2):
+        """
+        合并两个集合
+
+        Returns:
+            merged: 两个元素原本是否属于不同集合
+        """
+        root1, root2 = self.find(key1), self.find(key2)
+        if root1 == root2:
+            return False
+        self.parent[root2] = root1
+        return True
+
+
+def load_corpus_from_stories_dir(stories_dir=STORIES_DIR):
+    """
+    从故事目录加载全部故事
+
+    Args:
+        stories_dir: 故事目录
+
+    Returns:
+        corpus: {相对路径: 故事数据}
+    """
+    corpus = {}
+    for root, dirs, files in os.walk(stories_dir):
+        for file in files:
+            if not file.endswith('.md'):
+                continue
+
+            filepath = os.path.join(root, file)
+            relative_path = os.path.relpath(filepath, stories_dir)
+            parts = relative_path.split(os.sep)
+
+            # 支持 分类/语言_地区/类型 和 语言/地区/类型 两种目录结构
+            language_code, region = '', ''
+            if len(parts) >= 3:
+                if parts[0] in STORY_LANGUAGES:
+                    language_code, region = parts[0], parts[1]
+                elif '_' in parts[1]:
+                    language_code, region = parts[1].split('_', 1)
+
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+
+            title = file[:-3]
+            for line in content.splitlines():
+                if line.startswith('# '):
+                    title = line[2:].strip()
+                    break
+
+            corpus[relative_path] = {
+                'title': title,
+                'language_code': language_code,
+                'region': region,
+                'story_content': content
+            }
+
+    return corpus
+
+
+def load_corpus_from_fingerprints(filepath=FINGERPRINT_FILE):
+    """
+    从指纹文件加载全部故事，优先使用追加写入的指纹日志
+
+    Args:
+        filepath: 指纹文件路径
+
+    Returns:
+        corpus: {指纹: 故事数据}
+    """
+    if os.path.exists(fingerprint_store_path(filepath)) or not os.path.exists(filepath):
+        with open_fingerprint_store(filepath) as store:
+            return {fp: dict(store[fp]) for fp in store}
+    return load_fingerprints(filepath)
+
+
+def _compute_signatures(args):
+    """
+    在工作进程中计算一批故事的签名
+
+    Args:
+        args: (签名长度, 分段数, [(内容, 语言代码), ...])
+
+    Returns:
+        signatures: 签名列表
+    """
+    num_perm, bands, items = args
+    index = MinHashLSHIndex(num_perm, bands)
+    return [index.signature(content, language) for content, language in items]
+
+
+def build_index(corpus, workers=None):
+    """
+    为语料建立LSH索引
+
+    Args:
+        corpus: {键: 故事数据}
+        workers: 计算签名的进程数，为1时在当前进程内计算
+
+    Returns:
+        index: MinHashLSHIndex
+    """
+    index = MinHashLSHIndex()
+    keys = list(corpus)
+    items = [(corpus[key].get('story_content', ''), corpus[key].get('language_code')) for key in keys]
+    chunks = [
+        (index.num_perm, index.bands, items[start:start + SIGNATURE_CHUNK_SIZE])
+        for start in range(0, len(items), SIGNATURE_CHUNK_SIZE)
+    ]
+
+    if workers == 1 or len(chunks) <= 1:
+        results = list(map(_compute_signatures, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_compute_signatures, chunks))
+
+    position = 0
+    for signatures in results:
+        for signature in signatures:
+            key = keys[position]
+            index.add_signature(key, signature, corpus[key].get('title'))
+            position += 1
+
+    return index
+
+
+def find_duplicate_clusters(corpus, similarity_threshold=SIMILARITY_THRESHOLD, index=None, workers=None):
+    """
+    把语料中的近似重复故事聚类
+
+    候选对来自LSH索引，只有当两个故事尚未处于同一个簇时才计算相似度，
+    因此每个簇的验证次数接近簇大小，而不是簇大小的平方。
+    比较规则与 is_duplicate 相同：不同语言的故事不比较，标题相同视为重复。
+
+    Args:
+        corpus: {键: 故事数据}
+        similarity_threshold: 相似度阈值
+        index: 已建立的LSH索引(可选)
+        workers: 计算签名的进程数
+
+    Returns:
+        (clusters, stats): 簇列表(按大小降序)和统计信息；
+        每个簇为 {'members': [键...], 'edges': [{'source', 'target', 'similarity'}...]}
+    """
+    if index is None:
+        index = build_index(corpus, workers)
+
+    union_find = UnionFind()
+    checker = SimilarityChecker(cache_size=max(len(corpus), 1))
+    edges = []
+    candidate_pairs = 0
+
+    for key in corpus:
+        story = corpus[key]
+        candidates = index.query_signature(index.signatures.get(key), story.get('title'))
+        for other in candidates:
+            if other <= key or other not in corpus:
+                continue
+            candidate_pairs += 1
+            if union_find.find(key) == union_find.find(other):
+                continue
+
+            rule = _compare_rule(story, corpus[other], similarity_threshold)
+            if rule is None:
+                continue
+
+            title_matched, threshold = rule
+            prepared = checker.prepare(story.get('story_content', ''), key=key)
+            prepared_other = checker.prepare(corpus[other].get('story_content', ''), key=other)
+            similarity = checker.similarity(prepared, prepared_other, 0.0 if title_matched else threshold)
+            if title_matched or similarity > threshold:
+                union_find.union(key, other)
+                edges.append({'source': key, 'target': other, 'similarity': round(similarity, 4)})
+
+    groups = {}
+    for key in union_find.parent:
+        groups.setdefault(union_find.find(key), []).append(key)
+
+    clusters = {root: {'members': sorted(members), 'edges': []} for root, members in groups.items()
+                if len(members) > 1}
+    for edge in edges:
+        clusters[union_find.find(edge['source'])]['edges'].append(edge)
+
+    clusters = sorted(clusters.values(), key=lambda cluster: len(cluster['members']), reverse=True)
+    stats = {
+        'stories': len(corpus),
+        'candidate_pairs': candidate_pairs,
+        'verified_pairs': checker.stats['pairs'],
+        'clusters': len(clusters),
+        'duplicate_stories': sum(len(cluster['members']) - 1 for cluster in clusters)
+    }
+    return clusters, stats
+
+
+def write_report(clusters, stats, filepath=DEFAULT_REPORT_FILE, corpus=None):
+    """
+    写入聚类报告
+
+    Args:
+        clusters: 簇列表
+        stats: 统计信息
+        filepath: 报告文件路径
+        corpus: 语料(可选)，提供时在报告中附带标题
+
+    Returns:
+        success: 是否写入成功
+    """
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'stats': stats,
+        'clusters': clusters
+    }
+    if corpus is not None:
+        report['titles'] = {
+            key: corpus[key].get('title', '')
+            for cluster in clusters for key in cluster['members']
+        }
+
+    try:
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return True
+    except Exception:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='全库近似重复故事聚类')
+    parser.add_argument('--source', choices=['stories', 'fingerprints'], default='stories',
+                        help='语料来源: 故事目录或指纹文件')
+    parser.add_argument('--path', help='故事目录或指纹文件路径')
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD, help='相似度阈值')
+    parser.add_argument('--output', default=DEFAULT_REPORT_FILE, help='报告文件路径')
+    parser.add_argument('--workers', type=int, default=None, help='计算签名的进程数')
+    args = parser.parse_args(argv)
+
+    if args.source == 'stories':
+        corpus = load_corpus_from_stories_dir(args.path or STORIES_DIR)
+    else:
+        corpus = load_corpus_from_fingerprints(args.path or FINGERPRINT_FILE)
+
+    clusters, stats = find_duplicate_clusters(corpus, args.threshold, workers=args.workers)
+    if not write_report(clusters, stats, args.output, corpus):
+        print(f"写入报告失败: {args.output}")
+        return 1
+
+    print(f"共 {stats['stories']} 个故事，发现 {stats['clusters']} 个重复簇，"
+          f"{stats['duplicate_stories']} 个重复故事")
+    print(f"报告已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
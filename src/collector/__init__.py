@@ -1,5 +1,10 @@
 """Story collection module"""
 
 from .story_collector import StoryCollector
+from .async_collector import AsyncStoryCollector, collect_stories_async
+from .scheduler import CollectionScheduler, TokenBucket, RateLimitedError
+from .planner import CollectionPlan, generate_plan, run_plan
 
-__all__ = ['StoryCollector'] 
\ No newline at end of file
+__all__ = ['StoryCollector', 'AsyncStoryCollector', 'collect_stories_async',
+           'CollectionScheduler', 'TokenBucket', 'RateLimitedError',
+           'CollectionPlan', 'generate_plan', 'run_plan'] 
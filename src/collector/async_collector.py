@@ -0,0 +1,125 @@
+"""异步故事收集
+
+在一个事件循环中同时进行多个收集任务，等待网络时让出控制权，
+并发数由信号量限制，结果按完成顺序返回
+"""
+
+import asyncio
+import os
+import sys
+import weakref
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from .story_collector import StoryCollector, SIMULATED_LATENCY
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from utils.logger import get_logger
+
+logger = get_logger('async_collector')
+
+# 默认同时进行的收集任务数
+DEFAULT_CONCURRENCY = 16
+
+# 收集任务: (语言代码, 地区, 分类, 类型)
+CollectTask = Tuple[str, str, str, str]
+CollectResult = Tuple[bool, Optional[Dict], str]
+
+
+class AsyncStoryCollector:
+    def __init__(self, collector: Optional[StoryCollector] = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 latency: float = SIMULATED_LATENCY):
+        """初始化异步故事收集器
+
+        Args:
+            collector: 生成故事和分配ID的同步收集器，默认新建
+            concurrency: 同时进行的收集任务数
+            latency: 模拟的网络延迟(秒)
+        """
+        if concurrency < 1:
+            raise ValueError(f"并发数必须大于0: {concurrency}")
+        self.collector = collector or StoryCollector()
+        self.concurrency = concurrency
+        self.latency = latency
+        # 信号量在首次等待时绑定事件循环，每个事件循环使用各自的信号量
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环的信号量"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    async def collect_story(self, language: str, region: str, category: str, story_type: str) -> CollectResult:
+        """收集故事，等待网络时不阻塞其他任务
+
+        Args:
+            language: 语言代码
+            region: 地区
+            category: 分类
+            story_type: 类型
+
+        Returns:
+            Tuple[bool, Optional[Dict], str]: (是否成功, 元数据, 内容)
+        """
+        async with self._semaphore():
+            await asyncio.sleep(self.latency)  # 模拟网络延迟
+            return self.collector._build_story(language, region, category, story_type)
+
+    async def _collect_task(self, task: CollectTask) -> Tuple[CollectTask, CollectResult]:
+        """收集一个任务，异常时返回失败结果而不中断其他任务"""
+        try:
+            return task, await self.collect_story(*task)
+        except Exception as e:
+            logger.error(f"收集故事失败 {task}: {str(e)}")
+            return task, (False, None, '')
+
+    async def collect_stories(self, tasks: Iterable[CollectTask]) -> AsyncIterator[Tuple[CollectTask, CollectResult]]:
+        """并发收集多个故事，按完成顺序返回
+
+        任务按需从 tasks 中取出，同时存在的协程数不超过并发数，
+        因此 tasks 可以是很长的生成器。
+
+        Args:
+            tasks: 可迭代的 (语言代码, 地区, 分类, 类型)
+
+        Yields:
+            (task, (success, metadata, content)): 收集任务及其结果
+        """
+        iterator = iter(tasks)
+        pending = set()
+
+        def fill():
+            for task in iterator:
+                pending.add(asyncio.ensure_future(self._collect_task(task)))
+                if len(pending) >= self.concurrency:
+                    return
+
+        fill()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+                fill()
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+async def collect_stories_async(tasks: Iterable[CollectTask], concurrency: int = DEFAULT_CONCURRENCY,
+                                collector: Optional[StoryCollector] = None) -> AsyncIterator[Tuple[CollectTask, CollectResult]]:
+    """并发收集多个故事，按完成顺序返回
+
+    Args:
+        tasks: 可迭代的 (语言代码, 地区, 分类, 类型)
+        concurrency: 同时进行的收集任务数
+        collector: 同步收集器，默认新建
+
+    Yields:
+        (task, (success, metadata, content)): 收集任务及其结果
+    """
+    async for item in AsyncStoryCollector(collector, concurrency).collect_stories(tasks):
+        yield item
@@ -0,0 +1,79 @@
+"""故事ID分配
+
+按语言从数据库的ID序列中租用一段连续编号，在内存中逐个分配，
+每段只写一次数据库；多个进程各自租用不重叠的区间，不会分配出重复的ID
+"""
+
+import json
+import os
+import sys
+import threading
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from config.settings import BASE_DIR, DATABASE, ID_BLOCK_SIZE
+from src.database.story_db import StoryDatabase
+
+
+class IdAllocator:
+    def __init__(self, db: Optional[StoryDatabase] = None, block_size: int = ID_BLOCK_SIZE,
+                 legacy_counter_file: Optional[str] = None):
+        """初始化ID分配器
+
+        Args:
+            db: 保存ID序列的故事数据库，默认打开项目目录下的 data/database/stories.db
+            block_size: 每次租用的ID数量
+            legacy_counter_file: 旧的ID计数器文件，新序列从其中记录的值之后开始
+        """
+        if block_size < 1:
+            raise ValueError(f"租用数量必须大于0: {block_size}")
+        self.db = db
+        self.block_size = block_size
+        self.legacy_counter_file = legacy_counter_file
+        self._legacy_counters = None
+        self._blocks: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _load_legacy_counters(self) -> Dict[str, int]:
+        """加载旧的ID计数器"""
+        if self._legacy_counters is None:
+            try:
+                with open(self.legacy_counter_file, 'r') as f:
+                    self._legacy_counters = {key: int(value) for key, value in json.load(f).items()}
+            except Exception:
+                self._legacy_counters = {}
+        return self._legacy_counters
+
+    def next_value(self, language: str) -> int:
+        """分配下一个编号
+
+        Args:
+            language: 语言代码
+
+        Returns:
+            int: 编号
+        """
+        with self._lock:
+            block = self._blocks.get(language)
+            if block is None or block[0] > block[1]:
+                if self.db is None:
+                    self.db = StoryDatabase(os.path.join(BASE_DIR, DATABASE['path']))
+                minimum = self._load_legacy_counters().get(language, 0) if self.legacy_counter_file else 0
+                block = list(self.db.lease_id_block(language, self.block_size, minimum))
+                self._blocks[language] = block
+            value = block[0]
+            block[0] += 1
+            return value
+
+    def next_id(self, language: str) -> str:
+        """分配下一个故事ID
+
+        未用完的编号在进程退出后不再使用，因此ID可能不连续。
+
+        Args:
+            language: 语言代码
+
+        Returns:
+            str: 故事ID，如 CN001
+        """
+        return f"{language}{self.next_value(language):03d}"
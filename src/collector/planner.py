@@ -0,0 +1,233 @@
+"""收集计划
+
+把配置中的语言、地区、分类和类型展开为收集任务列表并保存到计划文件；
+完成的任务按批追加到进度日志，中断后重新打开计划时跳过已完成的任务
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import defaultdict, deque
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from config.settings import (
+    STORY_LANGUAGES, STORY_REGIONS, STORY_CATEGORIES, STORY_TYPES,
+    COLLECTION_PLAN_FILE, COLLECTION_PLAN_JOURNAL_FILE, PLAN_CHECKPOINT_INTERVAL
+)
+from src.state_store import fsync_directory, repair_journal_tail
+from utils.logger import get_logger
+
+from .async_collector import CollectTask, CollectResult
+
+logger = get_logger('collection_plan')
+
+
+def language_regions(language: str) -> List[str]:
+    """
+    获取语言对应的地区
+
+    STORY_REGIONS 的值为地区字典时取其键，为字符串时该语言只有这一个地区。
+
+    Args:
+        language: 语言代码
+
+    Returns:
+        List[str]: 地区列表
+    """
+    regions = STORY_REGIONS.get(language)
+    if isinstance(regions, dict):
+        return list(regions)
+    return [regions] if regions else []
+
+
+def generate_plan(languages: Optional[Iterable[str]] = None, categories: Optional[Iterable[str]] = None,
+                  story_types: Optional[Iterable[str]] = None, stories_per_combination: int = 1) -> List[CollectTask]:
+    """
+    展开收集任务：语言 × 地区 × 分类 × 类型
+
+    Args:
+        languages: 语言代码，默认为 STORY_LANGUAGES 全部
+        categories: 分类，默认为 STORY_CATEGORIES 全部
+        story_types: 类型，默认为 STORY_TYPES 全部
+        stories_per_combination: 每个组合收集的故事数
+
+    Returns:
+        List[CollectTask]: (语言代码, 地区, 分类, 类型) 列表
+    """
+    languages = list(languages or STORY_LANGUAGES)
+    categories = list(categories or STORY_CATEGORIES)
+    story_types = list(story_types or STORY_TYPES)
+    return [
+        (language, region, category, story_type)
+        for language in languages
+        for region in language_regions(language)
+        for category in categories
+        for story_type in story_types
+        for _ in range(stories_per_combination)
+    ]
+
+
+def plan_id(tasks: Sequence[CollectTask]) -> str:
+    """计算任务列表的标识，任务列表不同时进度日志不能混用"""
+    return hashlib.md5(json.dumps(tasks, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class CollectionPlan:
+    def __init__(self, tasks: Sequence[CollectTask], plan_file: str = COLLECTION_PLAN_FILE,
+                 journal_file: str = COLLECTION_PLAN_JOURNAL_FILE,
+                 checkpoint_interval: int = PLAN_CHECKPOINT_INTERVAL):
+        """
+        打开收集计划
+
+        计划文件中已有相同的任务列表时接续其进度，否则保存新的计划并重新开始。
+
+        Args:
+            tasks: 收集任务列表
+            plan_file: 计划文件路径
+            journal_file: 进度日志路径，每行记录一批已完成任务的序号
+            checkpoint_interval: 每完成多少个任务写一次进度日志
+        """
+        self.tasks = [tuple(task) for task in tasks]
+        self.plan_file = plan_file
+        self.journal_file = journal_file
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.id = plan_id(self.tasks)
+        self.completed = set()
+        self._unsaved = []
+        self._lock = threading.Lock()
+
+        if self._read_plan_id() == self.id:
+            # 截掉中断时写了一半的行，否则下一批进度会接在它后面而无法解析
+            repair_journal_tail(self.journal_file)
+            self.completed = self._read_journal()
+            logger.info(f"接续收集计划: 已完成 {len(self.completed)}/{len(self.tasks)}")
+        else:
+            self._write_plan()
+
+    def _read_plan_id(self) -> Optional[str]:
+        try:
+            with open(self.plan_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('id')
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    def _write_plan(self):
+        """原子地保存计划；日志中其他计划的记录因标识不同而被忽略"""
+        directory = os.path.dirname(self.plan_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_file = self.plan_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({'id': self.id, 'tasks': self.tasks}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.plan_file)
+        fsync_directory(self.plan_file)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+
+    def _read_journal(self) -> set:
+        """读取本计划已完成的任务序号，忽略中断时写了一半的行"""
+        completed = set()
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get('plan') == self.id:
+                        completed.update(index for index in entry.get('done', []) if 0 <= index < len(self.tasks))
+        except FileNotFoundError:
+            pass
+        return completed
+
+    def pending(self) -> List[Tuple[int, CollectTask]]:
+        """
+        获取未完成的任务
+
+        Returns:
+            List[Tuple[int, CollectTask]]: (序号, 任务) 列表，按计划顺序
+        """
+        with self._lock:
+            return [(index, task) for index, task in enumerate(self.tasks) if index not in self.completed]
+
+    def mark_done(self, index: int):
+        """
+        记录任务完成，累计到 checkpoint_interval 个时写入进度日志
+
+        Args:
+            index: 任务序号
+        """
+        with self._lock:
+            if index in self.completed:
+                return
+            self.completed.add(index)
+            self._unsaved.append(index)
+            if len(self._unsaved) >= self.checkpoint_interval:
+                self._flush()
+
+    def checkpoint(self):
+        """立即写入尚未记录的完成任务"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._unsaved:
+            return
+        line = json.dumps({'plan': self.id, 'done': self._unsaved})
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._unsaved = []
+
+    def progress(self) -> Tuple[int, int]:
+        """
+        Returns:
+            Tuple[int, int]: (已完成数, 任务总数)
+        """
+        return len(self.completed), len(self.tasks)
+
+    def is_complete(self) -> bool:
+        """是否所有任务都已完成"""
+        return len(self.completed) == len(self.tasks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.checkpoint()
+
+
+async def run_plan(plan: CollectionPlan, scheduler) -> AsyncIterator[Tuple[CollectTask, CollectResult]]:
+    """
+    用调度器执行计划中未完成的任务，成功的任务记录为完成
+
+    任务在调用方处理完结果(yield 返回)后才记录为完成，调用方保存故事之前中断时，
+    该任务在下次打开计划时重新执行。失败的任务不记录。结束(包括中断)时写入剩余的进度。
+
+    Args:
+        plan: 收集计划
+        scheduler: 收集调度器，提供 async run(tasks)
+
+    Yields:
+        (task, (success, metadata, content)): 收集任务及其结果，按完成顺序
+    """
+    pending = plan.pending()
+    # 调度器按任务返回结果，同一任务在计划中出现多次时依次对应各个序号
+    indexes = defaultdict(deque)
+    for index, task in pending:
+        indexes[task].append(index)
+
+    try:
+        async for task, result in scheduler.run(task for _, task in pending):
+            index = indexes[task].popleft()
+            yield task, result
+            if result[0]:
+                plan.mark_done(index)
+    finally:
+        plan.checkpoint()
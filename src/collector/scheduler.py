@@ -0,0 +1,205 @@
+"""收集调度
+
+每个来源(语言+地区)一个令牌桶限制请求速率；来源的令牌用完时任务推迟到令牌恢复，
+其间先执行其他来源的任务。失败的任务按指数退避加随机抖动重新排队，最多重试 RETRY_COUNT 次
+"""
+
+import asyncio
+import heapq
+import os
+import random
+import sys
+from typing import AsyncIterator, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from config.settings import RETRY_COUNT, RETRY_BASE_DELAY, RETRY_MAX_DELAY, COLLECT_RATE_LIMIT, COLLECT_BURST
+from utils.logger import get_logger
+
+from .async_collector import AsyncStoryCollector, CollectTask, CollectResult, DEFAULT_CONCURRENCY
+
+logger = get_logger('collect_scheduler')
+
+
+class RateLimitedError(Exception):
+    """来源拒绝请求(限流)，retry_after 为来源要求的等待时间(秒)"""
+
+    def __init__(self, message: str = '', retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 令牌上限，即允许的突发请求数
+        """
+        if rate <= 0 or capacity < 1:
+            raise ValueError(f"无效的令牌桶参数: rate={rate}, capacity={capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = None
+
+    def _refill(self, now: float):
+        if self.updated_at is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, now: float) -> float:
+        """尝试取一个令牌
+
+        Args:
+            now: 当前时间(秒)
+
+        Returns:
+            float: 0表示已取得令牌，否则为令牌恢复前需要等待的时间
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, now: float, seconds: float):
+        """来源要求暂停时清空令牌，在 seconds 秒后才恢复"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY,
+                  rnd: Optional[random.Random] = None) -> float:
+    """计算重试等待时间(指数退避，全抖动)
+
+    Args:
+        attempt: 已失败的次数，从1开始
+        base: 第一次重试的最长等待时间
+        cap: 等待时间上限
+        rnd: 随机数生成器
+
+    Returns:
+        float: 在 [0, min(cap, base * 2^(attempt-1))] 中均匀抽取的等待时间
+    """
+    return (rnd or random).uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def source_of(task: CollectTask) -> Tuple[str, str]:
+    """任务的来源：(语言代码, 地区)"""
+    return task[0], task[1]
+
+
+class CollectionScheduler:
+    def __init__(self, collector: Optional[AsyncStoryCollector] = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 rate: float = COLLECT_RATE_LIMIT, burst: float = COLLECT_BURST,
+                 source_rates: Optional[Dict[Hashable, Tuple[float, float]]] = None,
+                 retry_count: int = RETRY_COUNT, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY, source_key: Callable[[CollectTask], Hashable] = source_of,
+                 rnd: Optional[random.Random] = None):
+        """初始化收集调度器
+
+        Args:
+            collector: 异步收集器，提供 async collect_story，默认新建
+            concurrency: 同时进行的收集任务数
+            rate: 每个来源每秒允许的请求数
+            burst: 每个来源允许的突发请求数
+            source_rates: 个别来源的 (rate, burst)
+            retry_count: 每个任务失败后的最大重试次数
+            base_delay: 第一次重试的最长等待时间(秒)
+            max_delay: 重试等待时间上限(秒)
+            source_key: 从任务得到来源的函数
+            rnd: 计算抖动的随机数生成器
+        """
+        self.collector = collector or AsyncStoryCollector(concurrency=concurrency)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.source_rates = source_rates or {}
+        self.retry_count = retry_count
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.source_key = source_key
+        self.rnd = rnd or random.Random()
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self.stats = {'attempts': 0, 'retries': 0, 'throttled': 0, 'failed': 0}
+
+    def _bucket(self, source: Hashable) -> TokenBucket:
+        bucket = self.buckets.get(source)
+        if bucket is None:
+            rate, burst = self.source_rates.get(source, (self.rate, self.burst))
+            bucket = self.buckets[source] = TokenBucket(rate, burst)
+        return bucket
+
+    async def _attempt(self, task: CollectTask) -> CollectResult:
+        """执行一次收集，失败结果(success为False)按异常处理"""
+        result = await self.collector.collect_story(*task)
+        if not result[0]:
+            raise RuntimeError('收集结果为失败')
+        return result
+
+    async def run(self, tasks: Iterable[CollectTask]) -> AsyncIterator[Tuple[CollectTask, CollectResult]]:
+        """按速率限制执行收集任务，按完成顺序返回
+
+        Args:
+            tasks: 可迭代的 (语言代码, 地区, 分类, 类型)
+
+        Yields:
+            (task, (success, metadata, content)): 收集任务及其结果；重试次数用完仍失败时为 (False, None, '')
+        """
+        loop = asyncio.get_running_loop()
+        # 待执行队列: (可以开始的时间, 序号, 任务, 已失败次数)；序号保证同一时间按加入顺序执行
+        waiting = [(0.0, seq, task, 0) for seq, task in enumerate(tasks)]
+        heapq.heapify(waiting)
+        seq = len(waiting)
+        running = {}
+
+        try:
+            while waiting or running:
+                now = loop.time()
+                # 启动已到时间且来源有令牌的任务；令牌不足的任务推迟，不影响后面其他来源的任务
+                while waiting and waiting[0][0] <= now and len(running) < self.concurrency:
+                    _, _, task, failures = heapq.heappop(waiting)
+                    wait = self._bucket(self.source_key(task)).acquire(now)
+                    if wait > 0:
+                        self.stats['throttled'] += 1
+                        heapq.heappush(waiting, (now + wait, seq, task, failures))
+                        seq += 1
+                        continue
+                    self.stats['attempts'] += 1
+                    running[asyncio.ensure_future(self._attempt(task))] = (task, failures)
+
+                timeout = None
+                if waiting and len(running) < self.concurrency:
+                    timeout = max(0.0, waiting[0][0] - loop.time())
+                if not running:
+                    await asyncio.sleep(timeout or 0)
+                    continue
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for future in done:
+                    task, failures = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        yield task, future.result()
+                        continue
+
+                    failures += 1
+                    now = loop.time()
+                    retry_after = getattr(error, 'retry_after', None)
+                    if isinstance(error, RateLimitedError):
+                        self._bucket(self.source_key(task)).pause(now, retry_after or self.base_delay)
+                    if failures > self.retry_count:
+                        logger.error(f"收集失败，已重试 {self.retry_count} 次 {task}: {str(error)}")
+                        self.stats['failed'] += 1
+                        yield task, (False, None, '')
+                        continue
+
+                    delay = max(retry_after or 0.0, backoff_delay(failures, self.base_delay, self.max_delay, self.rnd))
+                    logger.warning(f"收集失败，{delay:.2f} 秒后第 {failures} 次重试 {task}: {str(error)}")
+                    self.stats['retries'] += 1
+                    heapq.heappush(waiting, (now + delay, seq, task, failures))
+                    seq += 1
+        finally:
+            for future in running:
+                future.cancel()
@@ -2,42 +2,31 @@ from typing import Dict, Tuple, Optional
 import random
 import time
 import os
-import json
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from config.settings import ID_COUNTER_FILE
+
+from .id_allocator import IdAllocator
+
+# 模拟的网络延迟(秒)
+SIMULATED_LATENCY = 1
 
 class StoryCollector:
-    def __init__(self):
-        """初始化故事收集器"""
+    def __init__(self, id_allocator: Optional[IdAllocator] = None):
+        """初始化故事收集器
+        
+        Args:
+            id_allocator: 故事ID分配器，默认按语言从 stories.db 租用编号，
+                并接续旧的 data/id_counter.json 中记录的编号
+        """
         self.collected_stories = []
-        self.id_counter_file = os.path.join('data', 'id_counter.json')
-        self._load_id_counter()
-    
-    def _load_id_counter(self):
-        """加载ID计数器"""
-        try:
-            if os.path.exists(self.id_counter_file):
-                with open(self.id_counter_file, 'r') as f:
-                    self.id_counters = json.load(f)
-            else:
-                self.id_counters = {}
-        except Exception:
-            self.id_counters = {}
-    
-    def _save_id_counter(self):
-        """保存ID计数器"""
-        os.makedirs(os.path.dirname(self.id_counter_file), exist_ok=True)
-        with open(self.id_counter_file, 'w') as f:
-            json.dump(self.id_counters, f)
+        self.id_counter_file = ID_COUNTER_FILE
+        self.id_allocator = id_allocator or IdAllocator(legacy_counter_file=self.id_counter_file)
     
     def _generate_story_id(self, language: str) -> str:
         """生成故事ID"""
-        if language not in self.id_counters:
-            self.id_counters[language] = 0
-        
-        self.id_counters[language] += 1
-        story_id = f"{language}{self.id_counters[language]:03d}"
-        
-        self._save_id_counter()
-        return story_id
+        return self.id_allocator.next_id(language)
     
     def collect_story(self, language: str, region: str, category: str, story_type: str) -> Tuple[bool, Optional[Dict], str]:
         """收集故事
@@ -52,8 +41,21 @@ class StoryCollector:
             Tuple[bool, Optional[Dict], str]: (是否成功, 元数据, 内容)
         """
         # 模拟故事收集过程
-        time.sleep(1)  # 模拟网络延迟
+        time.sleep(SIMULATED_LATENCY)  # 模拟网络延迟
+        return self._build_story(language, region, category, story_type)
+    
+    def _build_story(self, language: str, region: str, category: str, story_type: str) -> Tuple[bool, Optional[Dict], str]:
+        """生成故事并记录到已收集列表
+        
+        Args:
+            language: 语言代码
+            region: 地区
+            category: 分类
+            story_type: 类型
         
+        Returns:
+            Tuple[bool, Optional[Dict], str]: (是否成功, 元数据, 内容)
+        """
         # 生成示例故事
         story_id = self._generate_story_id(language)
         title = self._generate_title(language, region, story_type)
@@ -0,0 +1,225 @@
+"""
+故事数据库查询基准
+生成指定行数的合成 stories.db，记录 search_stories 各过滤组合的查询计划和耗时
+
+用法: python -m src.database.benchmark [--rows 100000] [--db 数据库路径] [--output 报告路径]
+"""
+
+import os
+import sys
+import json
+import random
+import sqlite3
+import argparse
+import tempfile
+import time
+from datetime import datetime
+from itertools import combinations
+
+# 导入配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from config.settings import BASE_DIR, STORY_LANGUAGES, STORY_TYPES
+from src.database.story_db import StoryDatabase
+
+DEFAULT_REPORT_FILE = os.path.join(BASE_DIR, 'data', 'database', 'query_plan_benchmark.json')
+
+# 合成数据的分布：语言按权重抽取，每种语言若干地区
+LANGUAGE_WEIGHTS = {'CN': 40, 'EN': 30, 'JP': 10, 'FR': 10, 'DE': 10}
+REGIONS_PER_LANGUAGE = 20
+SEED_CHUNK_SIZE = 10000
+
+# 分页查询每页的行数
+PAGE_SIZE = 50
+
+FILTER_NAMES = ('language', 'region', 'story_type')
+
+
+def synthetic_stories(rows, seed=0):
+    """
+    生成合成故事
+
+    Args:
+        rows: 故事数
+        seed: 随机种子
+
+    Yields:
+        story_info: 故事信息字典
+    """
+    rnd = random.Random(seed)
+    languages = [code for code in LANGUAGE_WEIGHTS if code in STORY_LANGUAGES] or list(STORY_LANGUAGES)
+    weights = [LANGUAGE_WEIGHTS.get(code, 1) for code in languages]
+    types = list(STORY_TYPES)
+
+    for i in range(rows):
+        language = rnd.choices(languages, weights)[0]
+        region = f"{language}_R{rnd.randrange(REGIONS_PER_LANGUAGE):02d}"
+        yield {
+            'id': f"S{i:07d}",
+            'title': f"Story {i}",
+            'language': language,
+            'region': region,
+            'type': rnd.choice(types),
+            'summary': f"Synthetic story {i} from {region}",
+            'file_path': f"stories/{language}/{region}/{i}.md",
+            'metadata': {'seed': seed, 'index': i}
+        }
+
+
+def seed_database(db, rows, seed=0):
+    """
+    向数据库写入合成故事
+
+    Args:
+        db: StoryDatabase实例
+        rows: 故事数
+        seed: 随机种子
+    """
+    chunk = []
+    for story_info in synthetic_stories(rows, seed):
+        chunk.append(story_info)
+        if len(chunk) >= SEED_CHUNK_SIZE:
+            db.add_stories(chunk)
+            chunk = []
+    if chunk:
+        db.add_stories(chunk)
+
+
+def query_plan(conn, query, params):
+    """
+    获取查询计划
+
+    Returns:
+        plan: 查询计划各步骤的描述
+    """
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+
+
+def measure(func, repeat):
+    """
+    多次执行并统计耗时
+
+    Returns:
+        (median_ms, p95_ms, result): 耗时中位数、95分位数(毫秒)和最后一次的返回值
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return round(median, 3), round(p95, 3), result
+
+
+def run_benchmark(db, repeat=20):
+    """
+    对 search_stories 的每种过滤组合分别测量全部结果和分页两种查询
+
+    Args:
+        db: 已写入数据的StoryDatabase实例
+        repeat: 每个查询的执行次数
+
+    Returns:
+        results: 每个查询的过滤条件、查询计划、返回行数和耗时
+    """
+    conn = db._get_connection()
+    total = conn.execute('SELECT COUNT(*) FROM stories').fetchone()[0]
+    # 以中间一行的取值作为过滤值，保证每种组合都有结果
+    sample = conn.execute(
+        'SELECT id, language, region, type FROM stories ORDER BY id LIMIT 1 OFFSET ?', (total // 2,)
+    ).fetchone()
+    values = {'language': sample[1], 'region': sample[2], 'story_type': sample[3]}
+
+    results = []
+    for size in range(len(FILTER_NAMES) + 1):
+        for names in combinations(FILTER_NAMES, size):
+            filters = {name: values[name] for name in names}
+            for shape, extra in (('all', {}), ('page', {'after_id': sample[0], 'limit': PAGE_SIZE})):
+                kwargs = dict(filters, **extra)
+                query, params = db._search_query(**kwargs)
+                median, p95, stories = measure(lambda: db.search_stories(**kwargs), repeat)
+                results.append({
+                    'filters': filters,
+                    'shape': shape,
+                    'rows': len(stories),
+                    'median_ms': median,
+                    'p95_ms': p95,
+                    'plan': query_plan(conn, query, params)
+                })
+    return results
+
+
+def write_report(report, filepath=DEFAULT_REPORT_FILE):
+    """
+    写入基准报告
+
+    Returns:
+        success: 是否写入成功
+    """
+    try:
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return True
+    except Exception:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='故事数据库查询计划和耗时基准')
+    parser.add_argument('--rows', type=int, default=100000, help='合成故事数')
+    parser.add_argument('--db', help='数据库路径(默认使用临时文件，已存在且有数据时不再写入)')
+    parser.add_argument('--repeat', type=int, default=20, help='每个查询的执行次数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', default=DEFAULT_REPORT_FILE, help='报告文件路径')
+    args = parser.parse_args(argv)
+
+    temp_dir = None
+    db_path = args.db
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, 'stories.db')
+
+    try:
+        with StoryDatabase(db_path) as db:
+            if db.get_story_count()['total'] == 0:
+                started = time.perf_counter()
+                seed_database(db, args.rows, args.seed)
+                print(f"写入 {args.rows} 个合成故事，用时 {time.perf_counter() - started:.1f} 秒")
+
+            results = run_benchmark(db, args.repeat)
+            indexes = [row[0] for row in db._get_connection().execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'stories' AND sql IS NOT NULL"
+            )]
+            total = db.get_story_count()['total']
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'sqlite_version': sqlite3.sqlite_version,
+        'rows': total,
+        'indexes': indexes,
+        'results': results
+    }
+
+    for result in results:
+        filters = ', '.join(result['filters']) or '-'
+        print(f"{filters:<30} {result['shape']:<5} {result['rows']:>7} 行 "
+              f"中位数 {result['median_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms  "
+              f"{' | '.join(result['plan'])}")
+
+    if not write_report(report, args.output):
+        print(f"写入报告失败: {args.output}")
+        return 1
+    print(f"报告已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
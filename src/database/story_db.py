@@ -1,12 +1,121 @@
 import sqlite3
-from typing import Dict, List, Optional
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import json
 from pathlib import Path
 
+# 连接参数：WAL模式下读不阻塞写，NORMAL同步级别只在检查点时fsync
+BUSY_TIMEOUT = 5.0
+CACHE_SIZE_KB = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+
+# 批量写入的逐行结果
+OUTCOME_INSERTED = 'inserted'
+OUTCOME_UPDATED = 'updated'
+OUTCOME_SKIPPED = 'skipped'
+OUTCOME_INVALID = 'invalid'
+OUTCOME_FAILED = 'failed'
+
+# 查询已存在ID时每条语句的最大参数数
+ID_LOOKUP_CHUNK = 500
+
+# 组合索引，按 search_stories/iter_stories 的过滤组合选择(见 src/database/benchmark.py)：
+# 等值过滤列在前，末尾的id用于按ID分页时直接按索引顺序读取，不再排序
+STORY_INDEXES = (
+    ('idx_language_region_type', ('language', 'region', 'type', 'id')),  # 语言、语言+地区、三者
+    ('idx_language_type', ('language', 'type', 'id')),                   # 语言+类型
+    ('idx_region_type', ('region', 'type', 'id')),                       # 地区、地区+类型
+    ('idx_type_id', ('type', 'id'))                                      # 类型
+)
+# 被组合索引的前缀取代的单列索引
+LEGACY_INDEXES = ('idx_language', 'idx_region', 'idx_type')
+
+# 从元数据提升为独立列的字段：(元数据键/列名, 列类型)。
+# 写入时从 metadata 取值，metadata 中仍保留原值
+PROMOTED_METADATA = (
+    ('category', 'TEXT'),
+    ('original_title', 'TEXT'),
+    ('collected_at', 'TIMESTAMP')
+)
+
+STORY_COLUMNS = ('id', 'title', 'language', 'region', 'type', 'summary', 'file_path', 'metadata', 'content') + tuple(
+    column for column, _ in PROMOTED_METADATA
+)
+
+# 全文检索：trigram分词对中文和拉丁文字都按3字符子串索引，短于3个字符的词改用LIKE匹配
+FTS_TOKENIZER = 'trigram'
+FTS_MIN_TERM_LENGTH = 3
+# bm25权重，依次对应标题、简介、正文
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+SNIPPET_TOKENS = 16
+SEARCH_FILTERS = ('language', 'region', 'type', 'category', 'original_title')
+# 范围过滤：过滤键 -> 条件
+RANGE_FILTERS = {
+    'collected_after': 'collected_at >= ?',
+    'collected_before': 'collected_at < ?'
+}
+
+# iter_stories 每次查询读取的行数
+ITER_BATCH_SIZE = 1000
+
+# 统计表中的维度：(维度名, stories表的列, get_story_count 返回的键)
+STAT_DIMENSIONS = (
+    ('language', 'language', 'by_language'),
+    ('type', 'type', 'by_type'),
+    ('region', 'region', 'by_region')
+)
+
+# 数据库结构迁移：(版本号, 方法名)，按版本依次执行，当前版本记录在 PRAGMA user_version
+MIGRATIONS = (
+    (1, '_migrate_promote_metadata'),
+    (2, '_migrate_id_sequences'),
+)
+
+
+class LazyMetadata(Mapping):
+    """故事元数据，首次访问时才解析JSON
+    
+    不是 dict 子类，json.dumps 前需要先用 dict() 转换。
+    """
+    
+    __slots__ = ('_raw', '_value')
+    
+    def __init__(self, raw: Optional[str]):
+        self._raw = raw
+        self._value = None
+    
+    @property
+    def value(self):
+        """解析后的元数据"""
+        if self._value is None:
+            self._value = json.loads(self._raw) if self._raw else {}
+        return self._value
+    
+    def __getitem__(self, key):
+        return self.value[key]
+    
+    def __iter__(self):
+        return iter(self.value)
+    
+    def __len__(self):
+        return len(self.value)
+    
+    def __repr__(self):
+        return f"LazyMetadata({self._raw!r})"
+
+
+_INSERT_SQL = f'''
+    INSERT INTO stories ({', '.join(STORY_COLUMNS)})
+    VALUES ({', '.join('?' * len(STORY_COLUMNS))})
+'''
+
 class StoryDatabase:
     def __init__(self, db_path: str = "data/database/stories.db"):
         """初始化故事数据库
         
+        每个线程复用一个长连接，连接在首次使用时创建并设置WAL等参数。
+        
         Args:
             db_path: 数据库文件路径
         """
@@ -14,11 +123,64 @@ class StoryDatabase:
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         
         self.db_path = db_path
+        self._local = threading.local()
+        # 各线程的 (线程, 连接)，线程结束后其连接在下次创建连接时关闭
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self._init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        """创建并配置新连接
+        
+        连接只在创建它的线程中使用；关闭 check_same_thread 是为了让 close()
+        和清理已结束线程的连接时可以在其他线程中关闭它。
+        """
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        # INSERT OR REPLACE 删除旧行时默认不触发 DELETE 触发器，统计表和全文索引会残留旧数据
+        conn.execute('PRAGMA recursive_triggers=ON')
+        return conn
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接
+        
+        Returns:
+            sqlite3.Connection: 当前线程复用的连接
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                finished = [item for item in self._connections if not item[0].is_alive()]
+                self._connections = [item for item in self._connections if item[0].is_alive()]
+                self._connections.append((threading.current_thread(), conn))
+            for _, finished_conn in finished:
+                finished_conn.close()
+        return conn
+    
+    def close(self):
+        """关闭所有线程的连接，调用时其他线程不应再使用数据库"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            conn.close()
+        self._local = threading.local()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
     def _init_database(self):
         """初始化数据库表结构"""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._get_connection()
+        with conn:
             cursor = conn.cursor()
             
             # 创建故事表
@@ -32,16 +194,221 @@ class StoryDatabase:
                     summary TEXT NOT NULL,
                     file_path TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    metadata TEXT
+                    metadata TEXT,
+                    content TEXT
                 )
             ''')
             
+            # 旧数据库没有正文列
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(stories)')]
+            if 'content' not in columns:
+                cursor.execute('ALTER TABLE stories ADD COLUMN content TEXT')
+            
+            self._migrate(conn)
+            
             # 创建索引
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_language ON stories(language)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_region ON stories(region)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_type ON stories(type)')
+            for name, columns in STORY_INDEXES:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON stories({", ".join(columns)})')
+            for name in LEGACY_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS {name}')
             
-            conn.commit()
+            self.fts_enabled = self._init_full_text_index(cursor)
+            self._init_stats(cursor)
+    
+    def get_schema_version(self) -> int:
+        """获取数据库结构版本"""
+        return self._get_connection().execute('PRAGMA user_version').fetchone()[0]
+    
+    def _migrate(self, conn: sqlite3.Connection):
+        """执行未完成的结构迁移，每个迁移在单独的事务中完成"""
+        for version, name in MIGRATIONS:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # 取得写锁后再检查版本，避免多个进程重复迁移
+                if cursor.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+                getattr(self, name)(cursor)
+                cursor.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def _migrate_promote_metadata(self, cursor: sqlite3.Cursor):
+        """迁移1：把常用的元数据字段提升为独立列，回填已有数据并建立索引"""
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(stories)')]
+        for column, column_type in PROMOTED_METADATA:
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE stories ADD COLUMN {column} {column_type}')
+        
+        assignments = ', '.join(
+            f"{column} = json_extract(metadata, '$.{column}')" for column, _ in PROMOTED_METADATA
+        )
+        cursor.execute(f'''
+            UPDATE stories SET {assignments}
+            WHERE json_valid(metadata) AND json_type(metadata) = 'object'
+        ''')
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_category ON stories(category, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_original_title ON stories(original_title)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_collected_at ON stories(collected_at, id)')
+    
+    def _migrate_id_sequences(self, cursor: sqlite3.Cursor):
+        """迁移2：创建ID序列表，每个序列记录已分配出去的最大值"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS id_sequences (
+                name TEXT PRIMARY KEY,
+                last_value INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+    
+    def lease_id_block(self, name: str, size: int, minimum: int = 0) -> Tuple[int, int]:
+        """从ID序列中租用一段连续的值
+        
+        递增在一条语句中完成，多个线程或进程同时租用时得到的区间互不重叠。
+        
+        Args:
+            name: 序列名，如语言代码
+            size: 区间长度
+            minimum: 区间之前至少已经分配到的值，用于接续旧的计数器
+        
+        Returns:
+            Tuple[int, int]: 区间的第一个和最后一个值
+        """
+        if size < 1:
+            raise ValueError(f"区间长度必须大于0: {size}")
+        with self._get_connection() as conn:
+            last_value = conn.execute('''
+                INSERT INTO id_sequences (name, last_value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET last_value = max(last_value, ?) + ?
+                RETURNING last_value
+            ''', (name, minimum + size, minimum, size)).fetchone()[0]
+        return last_value - size + 1, last_value
+    
+    def _init_full_text_index(self, cursor: sqlite3.Cursor) -> bool:
+        """创建全文索引及同步触发器
+        
+        索引以 stories 表为外部内容表，只保存倒排索引，触发器在增删改时同步。
+        
+        Returns:
+            bool: 全文索引是否可用(SQLite未编译FTS5或不支持trigram时不可用)
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stories_fts'"
+        ).fetchone()
+        if not exists:
+            try:
+                cursor.execute(f'''
+                    CREATE VIRTUAL TABLE stories_fts USING fts5(
+                        title, summary, content,
+                        content='stories', content_rowid='rowid',
+                        tokenize='{FTS_TOKENIZER}'
+                    )
+                ''')
+            except sqlite3.OperationalError:
+                return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stories_fts_insert AFTER INSERT ON stories BEGIN
+                INSERT INTO stories_fts(rowid, title, summary, content)
+                VALUES (new.rowid, new.title, new.summary, new.content);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stories_fts_delete AFTER DELETE ON stories BEGIN
+                INSERT INTO stories_fts(stories_fts, rowid, title, summary, content)
+                VALUES ('delete', old.rowid, old.title, old.summary, old.content);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stories_fts_update AFTER UPDATE OF title, summary, content ON stories BEGIN
+                INSERT INTO stories_fts(stories_fts, rowid, title, summary, content)
+                VALUES ('delete', old.rowid, old.title, old.summary, old.content);
+                INSERT INTO stories_fts(rowid, title, summary, content)
+                VALUES (new.rowid, new.title, new.summary, new.content);
+            END
+        ''')
+        
+        # 为建立索引前已有的故事补建索引
+        if not exists:
+            cursor.execute("INSERT INTO stories_fts(stories_fts) VALUES ('rebuild')")
+        return True
+    
+    def rebuild_full_text_index(self):
+        """重建全文索引(例如VACUUM改变了rowid之后)"""
+        if not self.fts_enabled:
+            return
+        with self._get_connection() as conn:
+            conn.execute("INSERT INTO stories_fts(stories_fts) VALUES ('rebuild')")
+    
+    def _init_stats(self, cursor: sqlite3.Cursor):
+        """创建统计表及维护触发器
+        
+        统计表保存 总数 和 各语言/类型/地区 的故事数，由触发器在增删改时增量更新。
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'story_stats'"
+        ).fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS story_stats (
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (dimension, value)
+            ) WITHOUT ROWID
+        ''')
+        
+        def increment(row, delta, include_total):
+            values = [f"('{dimension}', {row}.{column}, {delta})" for dimension, column, _ in STAT_DIMENSIONS]
+            if include_total:
+                values.insert(0, f"('total', '', {delta})")
+            return f'''
+                INSERT INTO story_stats (dimension, value, count) VALUES {', '.join(values)}
+                ON CONFLICT (dimension, value) DO UPDATE SET count = count + excluded.count;
+            '''
+        
+        cleanup = "DELETE FROM story_stats WHERE count <= 0 AND dimension != 'total';"
+        columns = ', '.join(column for _, column, _ in STAT_DIMENSIONS)
+        
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS story_stats_insert AFTER INSERT ON stories BEGIN
+                {increment('new', 1, True)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS story_stats_delete AFTER DELETE ON stories BEGIN
+                {increment('old', -1, True)}
+                {cleanup}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS story_stats_update AFTER UPDATE OF {columns} ON stories BEGIN
+                {increment('old', -1, False)}
+                {increment('new', 1, False)}
+                {cleanup}
+            END
+        ''')
+        
+        # 统计表新建时按已有数据计算
+        if not exists:
+            self._fill_stats(cursor)
+    
+    def _fill_stats(self, cursor: sqlite3.Cursor):
+        """清空统计表并按 stories 表重新计算"""
+        cursor.execute('DELETE FROM story_stats')
+        cursor.execute("INSERT INTO story_stats (dimension, value, count) SELECT 'total', '', COUNT(*) FROM stories")
+        for dimension, column, _ in STAT_DIMENSIONS:
+            cursor.execute(f'''
+                INSERT INTO story_stats (dimension, value, count)
+                SELECT '{dimension}', {column}, COUNT(*) FROM stories GROUP BY {column}
+            ''')
+    
+    def rebuild_stats(self):
+        """重新计算统计表，用于修复与 stories 表不一致的统计"""
+        with self._get_connection() as conn:
+            self._fill_stats(conn.cursor())
     
     def add_story(self, story_info: Dict[str, str]) -> bool:
         """添加新故事到数据库
@@ -56,38 +423,141 @@ class StoryDatabase:
                 - summary: 简介
                 - file_path: 文件路径
                 - metadata: 额外元数据(可选)
+                - content: 故事正文(可选，用于全文检索)
         
         Returns:
             bool: 是否添加成功
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # 处理可选的元数据
-                metadata = json.dumps(story_info.get('metadata', {}))
-                
-                cursor.execute('''
-                    INSERT INTO stories 
-                    (id, title, language, region, type, summary, file_path, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    story_info['id'],
-                    story_info['title'],
-                    story_info['language'],
-                    story_info['region'],
-                    story_info['type'],
-                    story_info['summary'],
-                    story_info['file_path'],
-                    metadata
-                ))
+                cursor.execute(_INSERT_SQL, self._story_params(story_info))
                 
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Error adding story to database: {e}")
             return False
     
+    @staticmethod
+    def _story_params(story_info: Dict[str, str]) -> Tuple:
+        """把故事信息转换为插入参数，缺少必填字段时抛出KeyError"""
+        metadata = story_info.get('metadata', {})
+        # iter_stories 返回的 LazyMetadata 等映射类型先转换为字典
+        if isinstance(metadata, Mapping):
+            metadata = dict(metadata)
+        promoted = metadata if isinstance(metadata, dict) else {}
+        return (
+            story_info['id'],
+            story_info['title'],
+            story_info['language'],
+            story_info['region'],
+            story_info['type'],
+            story_info['summary'],
+            story_info['file_path'],
+            json.dumps(metadata),
+            story_info.get('content')
+        ) + tuple(promoted.get(column) for column, _ in PROMOTED_METADATA)
+    
+    def _existing_ids(self, cursor: sqlite3.Cursor, story_ids: List[str]) -> set:
+        """查询已存在的故事ID"""
+        existing = set()
+        for start in range(0, len(story_ids), ID_LOOKUP_CHUNK):
+            chunk = story_ids[start:start + ID_LOOKUP_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f'SELECT id FROM stories WHERE id IN ({placeholders})', chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+    
+    def _write_stories(self, stories: Iterable[Dict[str, str]], upsert: bool) -> List[Tuple[Optional[str], str]]:
+        """在一个事务中批量写入故事
+        
+        Args:
+            stories: 故事信息字典
+            upsert: ID已存在时是否更新
+        
+        Returns:
+            List[Tuple[Optional[str], str]]: 与输入顺序一致的 (故事ID, 结果)
+        """
+        outcomes = []
+        rows = []
+        row_positions = []
+        for story_info in stories:
+            try:
+                params = self._story_params(story_info)
+            except (KeyError, TypeError):
+                story_id = story_info.get('id') if isinstance(story_info, dict) else None
+                outcomes.append((story_id, OUTCOME_INVALID))
+                continue
+            row_positions.append(len(outcomes))
+            outcomes.append((params[0], None))
+            rows.append(params)
+        
+        if not rows:
+            return outcomes
+        
+        if upsert:
+            # 未提供正文时保留原有正文
+            updates = ', '.join(
+                f'{column} = COALESCE(excluded.{column}, {column})' if column == 'content'
+                else f'{column} = excluded.{column}'
+                for column in STORY_COLUMNS[1:]
+            )
+            sql = f'{_INSERT_SQL} ON CONFLICT(id) DO UPDATE SET {updates}'
+        else:
+            sql = f'{_INSERT_SQL} ON CONFLICT(id) DO NOTHING'
+        
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                # 先取得写锁再查询，保证逐行结果与写入一致
+                cursor.execute('BEGIN IMMEDIATE')
+                seen = self._existing_ids(cursor, list({row[0] for row in rows}))
+                for position, row in zip(row_positions, rows):
+                    story_id = row[0]
+                    if story_id not in seen:
+                        outcome = OUTCOME_INSERTED
+                        seen.add(story_id)
+                    else:
+                        outcome = OUTCOME_UPDATED if upsert else OUTCOME_SKIPPED
+                    outcomes[position] = (story_id, outcome)
+                
+                cursor.executemany(sql, rows)
+        except Exception as e:
+            print(f"Error writing stories to database: {e}")
+            for position in row_positions:
+                outcomes[position] = (outcomes[position][0], OUTCOME_FAILED)
+        
+        return outcomes
+    
+    def add_stories(self, stories: Iterable[Dict[str, str]]) -> List[Tuple[Optional[str], str]]:
+        """批量添加故事，全部写入在一个事务中完成
+        
+        ID已存在(包括同一批中重复出现)的故事被跳过，不影响其他故事。
+        
+        Args:
+            stories: 故事信息字典，字段同 add_story
+        
+        Returns:
+            List[Tuple[Optional[str], str]]: 与输入顺序一致的 (故事ID, 结果)，
+                结果为 inserted、skipped、invalid(缺少字段) 或 failed(事务失败)
+        """
+        return self._write_stories(stories, upsert=False)
+    
+    def upsert_stories(self, stories: Iterable[Dict[str, str]]) -> List[Tuple[Optional[str], str]]:
+        """批量添加或更新故事，全部写入在一个事务中完成
+        
+        ID已存在的故事更新除创建时间外的所有字段。
+        
+        Args:
+            stories: 故事信息字典，字段同 add_story
+        
+        Returns:
+            List[Tuple[Optional[str], str]]: 与输入顺序一致的 (故事ID, 结果)，
+                结果为 inserted、updated、invalid(缺少字段) 或 failed(事务失败)
+        """
+        return self._write_stories(stories, upsert=True)
+    
     def get_story(self, story_id: str) -> Optional[Dict[str, str]]:
         """获取故事信息
         
@@ -97,92 +567,301 @@ class StoryDatabase:
         Returns:
             Dict[str, str]: 故事信息字典，如果不存在返回None
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM stories WHERE id = ?', (story_id,))
+        row = cursor.fetchone()
+        
+        if row:
+            columns = [description[0] for description in cursor.description]
+            story_info = dict(zip(columns, row))
+            story_info['metadata'] = json.loads(story_info['metadata'])
+            return story_info
+        
+        return None
+    
+    @staticmethod
+    def _filter_conditions(filters: Optional[Dict[str, str]], prefix: str = '') -> Tuple[List[str], List[str]]:
+        """把过滤条件转换为SQL条件和参数
+        
+        Args:
+            filters: 过滤条件，可包含 language、region、type、category、original_title
+                (等值)和 collected_after、collected_before(收集时间范围)
+            prefix: 列名前缀(表别名)
+        
+        Returns:
+            Tuple[List[str], List[str]]: (条件列表, 参数列表)
+        """
+        filters = filters or {}
+        unknown = set(filters) - set(SEARCH_FILTERS) - set(RANGE_FILTERS)
+        if unknown:
+            raise ValueError(f"不支持的过滤条件: {', '.join(sorted(unknown))}")
+        
+        conditions = []
+        params = []
+        for column in SEARCH_FILTERS:
+            if filters.get(column):
+                conditions.append(f'{prefix}{column} = ?')
+                params.append(filters[column])
+        for key, condition in RANGE_FILTERS.items():
+            if filters.get(key):
+                conditions.append(prefix + condition)
+                params.append(filters[key])
+        return conditions, params
+    
+    @staticmethod
+    def _decode_metadata(raw: Optional[str], lazy: bool):
+        """解析元数据列，lazy 为True时返回访问时才解析的 LazyMetadata"""
+        if lazy:
+            return LazyMetadata(raw)
+        return json.loads(raw) if raw else {}
+    
+    def iter_stories(self,
+                     filters: Optional[Dict[str, str]] = None,
+                     batch_size: int = ITER_BATCH_SIZE,
+                     lazy_metadata: bool = False) -> Iterator[Dict[str, str]]:
+        """按ID顺序逐条遍历故事
+        
+        每次按ID续查一批，批与批之间不持有读事务，内存占用与表大小无关。
+        
+        Args:
+            filters: 过滤条件，见 _filter_conditions
+            batch_size: 每次查询读取的行数
+            lazy_metadata: 元数据是否为 LazyMetadata(访问时才解析)，
+                适合大部分行不读取元数据的遍历；返回的行需要序列化时保持默认
+        
+        Yields:
+            Dict[str, str]: 故事信息字典
+        """
+        conditions, params = self._filter_conditions(filters)
+        after_id = None
+        
+        while True:
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if after_id is not None:
+                page_conditions.append('id > ?')
+                page_params.append(after_id)
+            where = ' AND '.join(page_conditions) or '1=1'
             
-            cursor.execute('SELECT * FROM stories WHERE id = ?', (story_id,))
-            row = cursor.fetchone()
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT * FROM stories WHERE {where} ORDER BY id LIMIT ?', page_params + [batch_size])
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
             
-            if row:
-                columns = [description[0] for description in cursor.description]
+            for row in rows:
                 story_info = dict(zip(columns, row))
-                story_info['metadata'] = json.loads(story_info['metadata'])
-                return story_info
+                story_info['metadata'] = self._decode_metadata(story_info['metadata'], lazy_metadata)
+                yield story_info
             
-            return None
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][columns.index('id')]
+    
+    @staticmethod
+    def _search_query(language: Optional[str] = None,
+                      region: Optional[str] = None,
+                      story_type: Optional[str] = None,
+                      after_id: Optional[str] = None,
+                      limit: Optional[int] = None,
+                      category: Optional[str] = None) -> Tuple[str, List[str]]:
+        """生成 search_stories 使用的SQL和参数"""
+        query = 'SELECT * FROM stories WHERE 1=1'
+        params = []
+        
+        if language:
+            query += ' AND language = ?'
+            params.append(language)
+        
+        if region:
+            query += ' AND region = ?'
+            params.append(region)
+        
+        if story_type:
+            query += ' AND type = ?'
+            params.append(story_type)
+        
+        if category:
+            query += ' AND category = ?'
+            params.append(category)
+        
+        if after_id is not None:
+            query += ' AND id > ?'
+            params.append(after_id)
+        
+        if after_id is not None or limit is not None:
+            query += ' ORDER BY id'
+            if limit is not None:
+                query += ' LIMIT ?'
+                params.append(limit)
+        
+        return query, params
     
     def search_stories(self, 
                       language: Optional[str] = None,
                       region: Optional[str] = None,
-                      story_type: Optional[str] = None) -> List[Dict[str, str]]:
+                      story_type: Optional[str] = None,
+                      after_id: Optional[str] = None,
+                      limit: Optional[int] = None,
+                      category: Optional[str] = None,
+                      lazy_metadata: bool = False) -> List[Dict[str, str]]:
         """搜索故事
         
+        提供 after_id 或 limit 时按ID排序分页：下一页以上一页最后一条的ID作为 after_id。
+        
         Args:
             language: 语言过滤
             region: 地区过滤
             story_type: 类型过滤
+            after_id: 只返回ID大于该值的故事
+            limit: 最多返回的故事数
+            category: 分类过滤
+            lazy_metadata: 元数据是否为 LazyMetadata，见 iter_stories
         
         Returns:
             List[Dict[str, str]]: 符合条件的故事列表
         """
-        query = 'SELECT * FROM stories WHERE 1=1'
+        query, params = self._search_query(language, region, story_type, after_id, limit, category)
+        
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        
+        columns = [description[0] for description in cursor.description]
+        stories = []
+        
+        for row in cursor.fetchall():
+            story_info = dict(zip(columns, row))
+            story_info['metadata'] = self._decode_metadata(story_info['metadata'], lazy_metadata)
+            stories.append(story_info)
+        
+        return stories
+    
+    def full_text_search(self,
+                         query: str,
+                         filters: Optional[Dict[str, str]] = None,
+                         limit: int = 20) -> List[Dict[str, str]]:
+        """按标题、简介和正文全文检索故事
+        
+        查询按空白拆分为多个词，所有词都需出现(不区分大小写)。结果按bm25相关度排序，
+        标题命中的权重最高。
+        
+        Args:
+            query: 检索词
+            filters: 过滤条件，见 _filter_conditions
+            limit: 最多返回的结果数
+        
+        Returns:
+            List[Dict[str, str]]: 故事信息列表，每条另含 snippet(命中片段，以[]标记)
+                和 rank(越小越相关)
+        """
+        filter_conditions, filter_params = self._filter_conditions(filters, prefix='s.')
+        
+        terms = query.split()
+        if not terms:
+            return []
+        
+        if self.fts_enabled:
+            long_terms = [term for term in terms if len(term) >= FTS_MIN_TERM_LENGTH]
+            short_terms = [term for term in terms if len(term) < FTS_MIN_TERM_LENGTH]
+        else:
+            long_terms, short_terms = [], terms
+        
+        conditions = []
         params = []
+        for term in short_terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append(
+                "(s.title LIKE ? ESCAPE '\\' OR s.summary LIKE ? ESCAPE '\\' OR s.content LIKE ? ESCAPE '\\')"
+            )
+            params.extend([pattern] * 3)
+        conditions.extend(filter_conditions)
+        params.extend(filter_params)
         
-        if language:
-            query += ' AND language = ?'
-            params.append(language)
+        if long_terms:
+            # 每个词作为短语匹配，避免FTS5查询语法被用户输入影响
+            match = ' '.join('"' + term.replace('"', '""') + '"' for term in long_terms)
+            weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+            sql = f'''
+                SELECT s.*,
+                       snippet(stories_fts, -1, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet,
+                       bm25(stories_fts, {weights}) AS rank
+                FROM stories_fts JOIN stories s ON s.rowid = stories_fts.rowid
+                WHERE stories_fts MATCH ?
+            '''
+            params.insert(0, match)
+            conditions_sql = ''.join(f' AND {condition}' for condition in conditions)
+            sql += conditions_sql + ' ORDER BY rank LIMIT ?'
+        else:
+            sql = 'SELECT s.*, NULL AS snippet, 0.0 AS rank FROM stories s WHERE 1=1'
+            sql += ''.join(f' AND {condition}' for condition in conditions) + ' ORDER BY s.id LIMIT ?'
+        params.append(limit)
         
-        if region:
-            query += ' AND region = ?'
-            params.append(region)
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
         
-        if story_type:
-            query += ' AND type = ?'
-            params.append(story_type)
+        columns = [description[0] for description in cursor.description]
+        stories = []
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            
-            columns = [description[0] for description in cursor.description]
-            stories = []
-            
-            for row in cursor.fetchall():
-                story_info = dict(zip(columns, row))
-                story_info['metadata'] = json.loads(story_info['metadata'])
-                stories.append(story_info)
-            
-            return stories
+        for row in cursor.fetchall():
+            story_info = dict(zip(columns, row))
+            story_info['metadata'] = json.loads(story_info['metadata'])
+            if story_info['snippet'] is None:
+                story_info['snippet'] = self._make_snippet(story_info, short_terms)
+            stories.append(story_info)
+        
+        return stories
+    
+    @staticmethod
+    def _make_snippet(story_info: Dict[str, str], terms: List[str]) -> str:
+        """为LIKE匹配的结果生成命中片段"""
+        width = SNIPPET_TOKENS * 2
+        for column in ('title', 'summary', 'content'):
+            text = story_info.get(column) or ''
+            lowered = text.lower()
+            for term in terms:
+                position = lowered.find(term.lower())
+                if position < 0:
+                    continue
+                start = max(0, position - width // 2)
+                end = min(len(text), position + len(term) + width // 2)
+                return ''.join([
+                    '…' if start > 0 else '',
+                    text[start:position], '[', text[position:position + len(term)], ']',
+                    text[position + len(term):end],
+                    '…' if end < len(text) else ''
+                ])
+        return ''
     
     def get_story_count(self) -> Dict[str, int]:
-        """获取故事统计信息
+        """获取故事统计信息(读取触发器维护的统计表)
         
         Returns:
             Dict[str, int]: 包含各种统计数据的字典
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            stats = {
-                'total': cursor.execute('SELECT COUNT(*) FROM stories').fetchone()[0],
-                'by_language': {},
-                'by_type': {},
-                'by_region': {}
-            }
-            
-            # 按语言统计
-            cursor.execute('SELECT language, COUNT(*) FROM stories GROUP BY language')
-            stats['by_language'] = dict(cursor.fetchall())
-            
-            # 按类型统计
-            cursor.execute('SELECT type, COUNT(*) FROM stories GROUP BY type')
-            stats['by_type'] = dict(cursor.fetchall())
-            
-            # 按地区统计
-            cursor.execute('SELECT region, COUNT(*) FROM stories GROUP BY region')
-            stats['by_region'] = dict(cursor.fetchall())
-            
-            return stats
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        stats = {
+            'total': 0,
+            'by_language': {},
+            'by_type': {},
+            'by_region': {}
+        }
+        keys = {dimension: key for dimension, _, key in STAT_DIMENSIONS}
+        
+        # 从统计表读取，不扫描 stories 表
+        cursor.execute('SELECT dimension, value, count FROM story_stats ORDER BY dimension, value')
+        for dimension, value, count in cursor.fetchall():
+            if dimension == 'total':
+                stats['total'] = count
+            elif dimension in keys:
+                stats[keys[dimension]][value] = count
+        
+        return stats
     
     def get_all_stories(self) -> List[Dict[str, str]]:
         """获取所有故事
@@ -190,16 +869,16 @@ class StoryDatabase:
         Returns:
             List[Dict[str, str]]: 所有故事的列表
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM stories')
-            
-            columns = [description[0] for description in cursor.description]
-            stories = []
-            
-            for row in cursor.fetchall():
-                story_info = dict(zip(columns, row))
-                story_info['metadata'] = json.loads(story_info['metadata'])
-                stories.append(story_info)
-            
-            return stories 
\ No newline at end of file
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM stories')
+        
+        columns = [description[0] for description in cursor.description]
+        stories = []
+        
+        for row in cursor.fetchall():
+            story_info = dict(zip(columns, row))
+            story_info['metadata'] = json.loads(story_info['metadata'])
+            stories.append(story_info)
+        
+        return stories 
\ No newline at end of file
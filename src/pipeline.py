@@ -0,0 +1,365 @@
+"""
+分阶段流式处理管道
+各阶段之间用有界队列连接，每个阶段有自己的工作线程，CPU密集的阶段可以把任务交给进程池；
+下游处理较慢时上游在队列满后等待(背压)，慢的阶段不会让数据无限积压，也不会阻塞其他阶段的并发处理
+"""
+
+import os
+import sys
+import time
+import queue
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+# 导入配置和工具
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from config.settings import SIMILARITY_THRESHOLD
+from utils.logger import get_logger, log_exception
+from utils.fingerprint import generate_fingerprint, is_duplicate
+from utils.story_parser import parse_story
+from src.validator import validate_story
+from src.storage import save_story, get_state_store
+
+# 获取日志记录器
+logger = get_logger('story_pipeline')
+
+# 阶段之间队列的默认容量
+DEFAULT_QUEUE_SIZE = 64
+
+# 等待队列时检查停止标志的间隔(秒)
+_POLL_INTERVAL = 0.1
+
+# 队列结束标记
+_END = object()
+
+# 进程池在工作线程运行后才按需创建进程，fork会复制其他线程持有的锁，
+# 因此改用 forkserver(不支持时用 spawn)启动进程
+_PROCESS_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+class Stage:
+    """管道中的一个阶段"""
+
+    def __init__(self, name, func, workers=1, use_processes=False, queue_size=None):
+        """
+        初始化阶段
+
+        Args:
+            name: 阶段名称
+            func: 处理函数，接收一项数据，返回传给下一阶段的数据，返回None表示丢弃；
+                  use_processes 为True时必须可以pickle(模块级函数或其partial)
+            workers: 工作线程数；使用进程时同时也是进程数
+            use_processes: 是否在进程池中执行处理函数
+            queue_size: 阶段输入队列的容量，默认使用管道的设置
+        """
+        if workers < 1:
+            raise ValueError(f"工作线程数必须大于0: {workers}")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.use_processes = use_processes
+        self.queue_size = queue_size
+
+
+class Pipeline:
+    """分阶段流式处理管道"""
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        初始化管道
+
+        Args:
+            stages: 按顺序排列的 Stage 列表
+            queue_size: 阶段之间队列的默认容量
+        """
+        if not stages:
+            raise ValueError("管道至少需要一个阶段")
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self._queues = []
+        self._stats = []
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started_at = None
+        self._finished_at = None
+
+    def _put(self, target, item):
+        """放入队列，队列满时等待；管道停止时返回False"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source, stats):
+        """从队列取出一项，记录取出前的队列长度；管道停止时返回结束标记"""
+        while not self._stop.is_set():
+            depth = source.qsize()
+            try:
+                item = source.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            with self._stats_lock:
+                stats['max_queue_depth'] = max(stats['max_queue_depth'], depth)
+            return item
+        return _END
+
+    def _feed(self, items):
+        """把输入数据放入第一个阶段的队列"""
+        try:
+            for item in items:
+                if not self._put(self._queues[0], item):
+                    return
+        except Exception as e:
+            log_exception(logger, e, "读取管道输入失败")
+        for _ in range(self.stages[0].workers):
+            self._put(self._queues[0], _END)
+
+    def _work(self, index, executor, remaining):
+        """阶段的工作线程"""
+        stage = self.stages[index]
+        stats = self._stats[index]
+        source, target = self._queues[index], self._queues[index + 1]
+        downstream_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+
+        while True:
+            item = self._get(source, stats)
+            if item is _END:
+                # 本阶段最后一个结束的线程通知下游
+                with self._stats_lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for _ in range(downstream_workers):
+                        self._put(target, _END)
+                return
+
+            started = time.perf_counter()
+            try:
+                if executor is not None:
+                    result = executor.submit(stage.func, item).result()
+                else:
+                    result = stage.func(item)
+                error = False
+            except Exception as e:
+                log_exception(logger, e, f"管道阶段 {stage.name} 处理失败")
+                result = None
+                error = True
+
+            with self._stats_lock:
+                stats['received'] += 1
+                stats['busy_seconds'] += time.perf_counter() - started
+                if error:
+                    stats['errors'] += 1
+                elif result is None:
+                    stats['dropped'] += 1
+                else:
+                    stats['emitted'] += 1
+
+            if result is not None and not self._put(target, result):
+                return
+
+    def run(self, items):
+        """
+        运行管道
+
+        Args:
+            items: 可迭代的输入数据，按需读取
+
+        Yields:
+            result: 最后一个阶段输出的数据，按完成顺序
+        """
+        self._stop.clear()
+        self._queues = [queue.Queue(maxsize=stage.queue_size or self.queue_size) for stage in self.stages]
+        self._queues.append(queue.Queue(maxsize=self.queue_size))
+        self._stats = [
+            {'received': 0, 'emitted': 0, 'dropped': 0, 'errors': 0, 'busy_seconds': 0.0, 'max_queue_depth': 0}
+            for _ in self.stages
+        ]
+        self._started_at = time.perf_counter()
+        self._finished_at = None
+
+        executors = []
+        threads = [threading.Thread(target=self._feed, args=(items,), name='pipeline-feed', daemon=True)]
+        for index, stage in enumerate(self.stages):
+            executor = None
+            if stage.use_processes:
+                executor = ProcessPoolExecutor(max_workers=stage.workers, mp_context=_PROCESS_CONTEXT)
+                executors.append(executor)
+            remaining = [stage.workers]
+            for number in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(index, executor, remaining),
+                    name=f'pipeline-{stage.name}-{number}', daemon=True
+                ))
+
+        for thread in threads:
+            thread.start()
+        try:
+            output_stats = {'max_queue_depth': 0}
+            while True:
+                item = self._get(self._queues[-1], output_stats)
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            for executor in executors:
+                executor.shutdown(cancel_futures=True)
+            self._finished_at = time.perf_counter()
+
+    def stop(self):
+        """停止管道，未处理的数据被丢弃"""
+        self._stop.set()
+
+    def metrics(self):
+        """
+        获取各阶段的运行指标，运行中也可以调用
+
+        Returns:
+            metrics: 每个阶段一项，包含接收、输出、丢弃和出错的数量，
+                     吞吐量(每秒接收数)、繁忙程度(处理时间/(运行时间*线程数))、
+                     当前和最大的输入队列长度
+        """
+        if self._started_at is None:
+            return []
+        elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        metrics = []
+        with self._stats_lock:
+            for stage, stats, source in zip(self.stages, self._stats, self._queues):
+                metrics.append(dict(
+                    stats,
+                    stage=stage.name,
+                    workers=stage.workers,
+                    busy_seconds=round(stats['busy_seconds'], 3),
+                    throughput=round(stats['received'] / elapsed, 2) if elapsed > 0 else 0.0,
+                    utilization=round(stats['busy_seconds'] / (elapsed * stage.workers), 3) if elapsed > 0 else 0.0,
+                    queue_depth=source.qsize()
+                ))
+        return metrics
+
+
+def validate_item(item, drop_invalid=False):
+    """
+    验证阶段：验证故事并使用修复后的内容
+
+    Args:
+        item: {'story_data': 故事元数据, 'content': 故事内容}
+        drop_invalid: 是否丢弃验证不通过的故事
+
+    Returns:
+        item: 增加 is_valid 和 issues 后的数据，丢弃时为None
+    """
+    is_valid, issues, fixed_content = validate_story(item['story_data'], item['content'])
+    if drop_invalid and not is_valid:
+        return None
+    item['is_valid'] = is_valid
+    item['issues'] = issues
+    item['content'] = fixed_content
+    item['story_data']['story_content'] = fixed_content
+    return item
+
+
+def build_ingest_pipeline(collector, fingerprints=None, db=None, notion=None, collect_workers=8,
+                          validate_workers=None, save_workers=2, sync_workers=4, drop_invalid=False,
+                          similarity_threshold=SIMILARITY_THRESHOLD, lsh_index=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    创建收集入库管道: 收集 → 验证 → 去重 → 保存 → 索引 → 同步
+
+    输入为收集任务 (语言代码, 地区, 分类, 类型)，输出为处理完成的故事数据字典。
+    验证在进程池中执行；去重只用一个线程，保证同一批中的重复故事也能被识别。
+
+    Args:
+        collector: 故事收集器，提供 collect_story
+        fingerprints: 已有故事的指纹字典或指纹存储，新故事会写入其中
+        db: 故事数据库，为None时不建立数据库索引
+        notion: Notion同步器，提供 sync_story，为None时不同步
+        collect_workers: 收集线程数
+        validate_workers: 验证进程数，默认为CPU核数
+        save_workers: 保存线程数
+        sync_workers: 同步线程数
+        drop_invalid: 是否丢弃验证不通过的故事
+        similarity_threshold: 去重的相似度阈值
+        lsh_index: 去重使用的LSH索引(可选)
+        queue_size: 阶段之间队列的容量
+
+    Returns:
+        pipeline: Pipeline实例
+    """
+    fingerprints = fingerprints if fingerprints is not None else {}
+
+    def collect(task):
+        success, metadata, content = collector.collect_story(*task)
+        if not success:
+            return None
+        story_data = dict(metadata, story_content=content)
+        story_data.setdefault('language_code', metadata.get('language'))
+        return {'story_data': story_data, 'content': content}
+
+    def dedupe(item):
+        story_data = item['story_data']
+        if is_duplicate(story_data, fingerprints, similarity_threshold, lsh_index=lsh_index):
+            return None
+        fingerprints[generate_fingerprint(story_data)] = {
+            key: story_data.get(key, '') for key in ('title', 'language_code', 'region', 'type', 'story_content')
+        }
+        return item
+
+    def save(item):
+        success, filepath = save_story(item['story_data'], item['content'])
+        if not success:
+            return None
+        item['filepath'] = filepath
+        return item
+
+    def index(item):
+        story_data = item['story_data']
+        item['indexed'] = db.add_story({
+            'id': story_data.get('id'),
+            'title': story_data.get('title'),
+            'language': story_data.get('language_code'),
+            'region': story_data.get('region'),
+            'type': story_data.get('type'),
+            'summary': parse_story(item['content']).section_content('故事梗概') or '',
+            'file_path': item['filepath'],
+            'metadata': {key: value for key, value in story_data.items() if key != 'story_content'},
+            'content': item['content']
+        })
+        return item
+
+    def sync(item):
+        story_data = item['story_data']
+        item['synced'] = notion.sync_story({
+            'story_id': story_data.get('id'),
+            'title': story_data.get('title'),
+            'content': item['content'],
+            'type': story_data.get('type'),
+            'language': story_data.get('language_code'),
+            'region': story_data.get('region'),
+            'file_path': item['filepath']
+        })
+        return item
+
+    # 保存阶段有多个线程，先在当前线程创建状态存储，避免并发创建
+    get_state_store()
+
+    stages = [
+        Stage('collect', collect, collect_workers),
+        Stage('validate', partial(validate_item, drop_invalid=drop_invalid), validate_workers or os.cpu_count() or 1,
+              use_processes=True),
+        Stage('dedupe', dedupe),
+        Stage('save', save, save_workers)
+    ]
+    if db is not None:
+        stages.append(Stage('index', index))
+    if notion is not None:
+        stages.append(Stage('sync', sync, sync_workers))
+    return Pipeline(stages, queue_size)
@@ -0,0 +1,280 @@
+"""
+故事状态存储模块
+用预写日志记录新保存的故事，后台合并到状态文件，避免每次保存都重写整个 state.json
+"""
+
+import os
+import sys
+import json
+import threading
+from datetime import datetime
+
+# 导入配置和工具
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from config.settings import STATE_FILE, STATE_JOURNAL_FILE, STATE_COMPACT_THRESHOLD
+from utils.logger import get_logger, log_operation, log_exception
+
+# 获取日志记录器
+logger = get_logger('story_state')
+
+
+def fsync_directory(path):
+    """同步目录项，确保重命名在断电后仍然有效(不支持的平台上忽略)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def repair_journal_tail(path, chunk_size=4096):
+    """
+    截掉日志末尾写入中断的不完整行，使后续追加的记录从新的一行开始
+
+    Args:
+        path: 日志文件路径
+        chunk_size: 向前查找换行符时每次读取的字节数
+
+    Returns:
+        removed: 截掉的字节数
+    """
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            position = f.read(end - start).rfind(b'\n')
+            if position >= 0:
+                end = start + position + 1
+                break
+            end = start
+        if end == size:
+            return 0
+        f.truncate(end)
+        f.flush()
+        os.fsync(f.fileno())
+    return size - end
+
+
+class StateStore:
+    """
+    故事状态存储
+
+    状态由两部分组成：
+    - 快照(state.json)：与原格式相同，另外记录已合并的日志序号 journal_seq
+    - 日志(state.journal)：每行一条 {"seq": 序号, "record": 故事记录}，每次保存只追加并同步
+
+    读取时合并快照和序号大于 journal_seq 的日志记录。合并先原子替换快照，
+    再截断日志；两步之间中断时，旧日志记录会因序号不大于 journal_seq 而被忽略。
+    """
+
+    def __init__(self, state_file=STATE_FILE, journal_file=STATE_JOURNAL_FILE,
+                 compact_threshold=STATE_COMPACT_THRESHOLD):
+        """
+        初始化状态存储
+
+        Args:
+            state_file: 状态快照文件路径
+            journal_file: 状态日志文件路径
+            compact_threshold: 日志记录数超过该值时在后台合并
+        """
+        self.state_file = state_file
+        self.journal_file = journal_file
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compact_thread = None
+
+        directory = os.path.dirname(journal_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 上次写入中断留下的不完整行会与下一条追加的记录连在一起，打开时先截掉
+        removed = repair_journal_tail(journal_file)
+        if removed:
+            log_operation(logger, "修复状态日志", "成功", f"截掉末尾 {removed} 字节的不完整记录")
+
+        # 确定下一个日志序号和未合并的日志记录数
+        snapshot_seq = self._read_snapshot()[1]
+        journal = self._read_journal(snapshot_seq)
+        self._next_seq = max([snapshot_seq] + [seq for seq, _ in journal]) + 1
+        self._pending = len(journal)
+
+    def _read_snapshot(self):
+        """
+        读取状态快照
+
+        Returns:
+            (state, journal_seq, valid): 状态字典、已合并的日志序号、快照是否可以解析
+        """
+        if not os.path.exists(self.state_file):
+            return {}, 0, True
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return state, state.get('journal_seq', 0), True
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            log_exception(logger, e, f"状态文件损坏: {self.state_file}")
+            return {}, 0, False
+
+    def _read_journal(self, after_seq=0):
+        """
+        读取日志记录，忽略写入中断的不完整行
+
+        Args:
+            after_seq: 只返回序号大于该值的记录
+
+        Returns:
+            records: [(序号, 故事记录), ...]
+        """
+        records = []
+        if not os.path.exists(self.journal_file):
+            return records
+
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get('seq', 0) > after_seq:
+                    records.append((entry['seq'], entry['record']))
+        return records
+
+    def append(self, record):
+        """
+        追加一条故事记录
+
+        Args:
+            record: 故事记录
+        """
+        self.append_many([record])
+
+    def append_many(self, records):
+        """
+        追加多条故事记录，一次写入、一次同步
+
+        Args:
+            records: 故事记录列表
+        """
+        if not records:
+            return
+
+        with self._lock:
+            lines = []
+            for record in records:
+                lines.append(json.dumps({'seq': self._next_seq, 'record': record}, ensure_ascii=False))
+                self._next_seq += 1
+
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._pending += len(records)
+            should_compact = self._pending >= self.compact_threshold
+
+        if should_compact:
+            self.compact_in_background()
+
+    def load_state(self):
+        """
+        读取合并后的完整状态
+
+        Returns:
+            state: 状态字典
+        """
+        with self._lock:
+            state, snapshot_seq, _ = self._read_snapshot()
+            journal = self._read_journal(snapshot_seq)
+
+        stories = state.get('stories', [])
+        if journal:
+            stories = stories + [record for _, record in journal]
+            state['last_updated'] = journal[-1][1].get('collected_at', state.get('last_updated'))
+        state['stories'] = stories
+        state.pop('journal_seq', None)
+        return state
+
+    def load_stories(self):
+        """
+        读取全部故事记录
+
+        Returns:
+            stories: 故事记录列表
+        """
+        return self.load_state()['stories']
+
+    def compact(self):
+        """
+        把日志合并到状态快照
+
+        Returns:
+            success: 是否合并成功；快照损坏时不合并，以免覆盖原有数据
+        """
+        with self._compact_lock:
+            with self._lock:
+                state, snapshot_seq, valid = self._read_snapshot()
+                journal = self._read_journal(snapshot_seq)
+            if not valid:
+                log_operation(logger, "合并状态日志", "失败", "状态文件无法解析，保留日志")
+                return False
+            if not journal:
+                return True
+
+            merged_seq = journal[-1][0]
+            state.setdefault('stories', []).extend(record for _, record in journal)
+            state['last_updated'] = datetime.now().isoformat()
+            state['journal_seq'] = merged_seq
+
+            temp_filepath = self.state_file + '.tmp'
+            with open(temp_filepath, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_filepath, self.state_file)
+            fsync_directory(self.state_file)
+
+            # 保留合并期间新追加的日志记录
+            with self._lock:
+                remaining = self._read_journal(merged_seq)
+                temp_filepath = self.journal_file + '.tmp'
+                with open(temp_filepath, 'w', encoding='utf-8') as f:
+                    for seq, record in remaining:
+                        f.write(json.dumps({'seq': seq, 'record': record}, ensure_ascii=False) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_filepath, self.journal_file)
+                self._pending = len(remaining)
+
+            log_operation(logger, "合并状态日志", "成功", f"合并 {len(journal)} 条记录")
+            return True
+
+    def compact_in_background(self):
+        """在后台线程中合并日志，已有合并任务时不重复启动"""
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(target=self._compact_safely, daemon=True)
+        self._compact_thread.start()
+
+    def _compact_safely(self):
+        try:
+            self.compact()
+        except Exception as e:
+            log_exception(logger, e, "合并状态日志失败")
+
+    def wait_for_compaction(self):
+        """等待后台合并完成"""
+        thread = self._compact_thread
+        if thread is not None:
+            thread.join()
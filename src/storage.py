@@ -4,22 +4,53 @@
 """
 
 import os
-import json
 import sys
 import shutil
 from datetime import datetime
 
 # 导入配置和工具
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from config.settings import STORIES_DIR, STATE_FILE, USE_ATOMIC_WRITE, BACKUP_COUNT
+from config.settings import (
+    STORIES_DIR, STATE_FILE, STATE_JOURNAL_FILE, SCAN_CACHE_FILE, USE_ATOMIC_WRITE, BACKUP_COUNT, BATCH_SIZE
+)
 from utils.logger import get_logger, log_operation, log_exception
+from utils.scan_cache import DirectoryScanCache
+from src.state_store import StateStore, fsync_directory
 
 # 获取日志记录器
 logger = get_logger('story_storage')
 
-def create_story_path(language_code, region, category, story_type):
+# 状态存储和目录扫描缓存，首次使用时创建
+_state_store = None
+_scan_cache = None
+
+def get_state_store():
     """
-    创建故事文件路径
+    获取状态存储
+    
+    Returns:
+        store: StateStore实例
+    """
+    global _state_store
+    if _state_store is None:
+        _state_store = StateStore(STATE_FILE, STATE_JOURNAL_FILE)
+    return _state_store
+
+def get_scan_cache():
+    """
+    获取目录扫描缓存
+    
+    Returns:
+        cache: DirectoryScanCache实例
+    """
+    global _scan_cache
+    if _scan_cache is None:
+        _scan_cache = DirectoryScanCache(SCAN_CACHE_FILE)
+    return _scan_cache
+
+def get_story_dir(language_code, region, category, story_type):
+    """
+    计算故事文件所在目录(不创建目录)
     
     Args:
         language_code: 语言代码
@@ -28,7 +59,7 @@ def create_story_path(language_code, region, category, story_type):
         story_type: 故事类型
         
     Returns:
-        path: 创建的路径
+        path: 目录路径
     """
     # 安全处理输入，避免路径注入
     language_code = language_code.replace('/', '_').replace('\\', '_')
@@ -36,14 +67,28 @@ def create_story_path(language_code, region, category, story_type):
     category = category.replace('/', '_').replace('\\', '_')
     story_type = story_type.replace('/', '_').replace('\\', '_')
     
-    # 创建目录结构
+    # 目录结构: 分类/语言代码_地区/类型
     base_dir = os.path.join(STORIES_DIR, f"{category}")
     language_dir = os.path.join(base_dir, f"{language_code}_{region}")
-    type_dir = os.path.join(language_dir, f"{story_type}")
+    return os.path.join(language_dir, f"{story_type}")
+
+def create_story_path(language_code, region, category, story_type):
+    """
+    创建故事文件路径
     
-    # 确保目录存在
-    for dir_path in [base_dir, language_dir, type_dir]:
-        os.makedirs(dir_path, exist_ok=True)
+    Args:
+        language_code: 语言代码
+        region: 地区
+        category: 分类
+        story_type: 故事类型
+        
+    Returns:
+        path: 创建的路径
+    """
+    type_dir = get_story_dir(language_code, region, category, story_type)
+    
+    # 确保目录存在(同时创建上级目录)
+    os.makedirs(type_dir, exist_ok=True)
         
     return type_dir
 
@@ -70,6 +115,28 @@ def generate_story_filename(title, language_code, story_number=None):
     
     return f"{language_code}{story_number}_{safe_title}.md"
 
+def _story_target(story_data):
+    """
+    计算故事的保存位置
+    
+    Args:
+        story_data: 故事元数据
+        
+    Returns:
+        (story_dir, filepath): 目录和文件路径
+    """
+    language_code = story_data.get('language_code', 'XX')
+    story_dir = get_story_dir(
+        language_code,
+        story_data.get('region', 'Unknown'),
+        story_data.get('category', 'traditional'),
+        story_data.get('type', 'general')
+    )
+    filename = generate_story_filename(
+        story_data.get('title', 'Untitled Story'), language_code, story_data.get('story_number')
+    )
+    return story_dir, os.path.join(story_dir, filename)
+
 def save_story(story_data, content):
     """
     保存故事到文件
@@ -82,20 +149,11 @@ def save_story(story_data, content):
         (success, filepath): 是否成功和保存的文件路径
     """
     try:
-        # 提取必要信息
-        language_code = story_data.get('language_code', 'XX')
-        region = story_data.get('region', 'Unknown')
-        category = story_data.get('category', 'traditional')
-        story_type = story_data.get('type', 'general')
         title = story_data.get('title', 'Untitled Story')
-        story_number = story_data.get('story_number')
         
-        # 创建目录
-        story_dir = create_story_path(language_code, region, category, story_type)
-        
-        # 生成文件名
-        filename = generate_story_filename(title, language_code, story_number)
-        filepath = os.path.join(story_dir, filename)
+        # 创建目录并生成文件名
+        story_dir, filepath = _story_target(story_data)
+        os.makedirs(story_dir, exist_ok=True)
         
         # 检查文件是否已存在
         if os.path.exists(filepath):
@@ -123,51 +181,168 @@ def save_story(story_data, content):
         log_exception(logger, e, f"保存故事失败: {title}")
         return False, None
 
+def save_stories(batch, batch_size=BATCH_SIZE):
+    """
+    批量保存故事
+    
+    每组故事只创建一次目录，写完所有文件后统一同步，再一次性记录状态。
+    
+    Args:
+        batch: [(故事元数据, 故事内容), ...]
+        batch_size: 每组的故事数量
+        
+    Returns:
+        results: 与输入顺序一致的 [(success, filepath), ...]
+    """
+    results = []
+    for start in range(0, len(batch), batch_size):
+        results.extend(_save_story_group(batch[start:start + batch_size]))
+    return results
+
+def _save_story_group(group):
+    """
+    保存一组故事并提交状态
+    
+    Args:
+        group: [(故事元数据, 故事内容), ...]
+        
+    Returns:
+        results: [(success, filepath), ...]
+    """
+    results = [(False, None)] * len(group)
+    pending = []
+    claimed = set()
+    
+    # 计算保存位置，跳过已存在或组内重复的文件
+    for i, (story_data, content) in enumerate(group):
+        try:
+            story_dir, filepath = _story_target(story_data)
+        except Exception as e:
+            log_exception(logger, e, f"保存故事失败: {story_data.get('title', 'Untitled Story')}")
+            continue
+        if filepath in claimed or os.path.exists(filepath):
+            log_operation(logger, "保存故事", "警告", f"故事文件已存在: {filepath}")
+            results[i] = (False, filepath)
+            continue
+        claimed.add(filepath)
+        pending.append((i, story_dir, filepath))
+    
+    # 每个目录只创建一次
+    created_dirs = set()
+    for _, story_dir, _ in pending:
+        if story_dir not in created_dirs:
+            os.makedirs(story_dir, exist_ok=True)
+            created_dirs.add(story_dir)
+    
+    # 写入所有文件，统一同步后再重命名
+    written = []
+    saved = []
+    try:
+        for i, story_dir, filepath in pending:
+            story_data, content = group[i]
+            target = filepath + ".tmp" if USE_ATOMIC_WRITE else filepath
+            try:
+                f = open(target, 'w', encoding='utf-8')
+            except Exception as e:
+                log_exception(logger, e, f"保存故事失败: {story_data.get('title', 'Untitled Story')}")
+                continue
+            written.append((i, filepath, target, f))
+            try:
+                f.write(content)
+                f.flush()
+            except Exception as e:
+                written.pop()
+                _discard_file(f, target)
+                log_exception(logger, e, f"保存故事失败: {story_data.get('title', 'Untitled Story')}")
+        
+        for i, filepath, target, f in written:
+            try:
+                with f:
+                    os.fsync(f.fileno())
+                if USE_ATOMIC_WRITE:
+                    os.rename(target, filepath)
+                saved.append((i, filepath))
+            except Exception as e:
+                log_exception(logger, e, f"保存故事失败: {filepath}")
+    finally:
+        # 清理写入或同步失败留下的文件
+        done = {i for i, _ in saved}
+        for i, filepath, target, f in written:
+            if i not in done:
+                _discard_file(f, target)
+    
+    for story_dir in created_dirs:
+        fsync_directory(os.path.join(story_dir, ''))
+    
+    for i, filepath in saved:
+        results[i] = (True, filepath)
+        log_operation(logger, "保存故事", "成功", f"保存到: {filepath}")
+    
+    # 一次提交所有状态记录
+    if saved:
+        try:
+            get_state_store().append_many([_build_story_record(group[i][0], filepath) for i, filepath in saved])
+            log_operation(logger, "更新状态文件", "成功", f"记录 {len(saved)} 个故事")
+        except Exception as e:
+            log_exception(logger, e, "更新状态文件失败")
+    
+    return results
+
+def _discard_file(f, path):
+    """
+    关闭并删除未能完整保存的文件
+    
+    Args:
+        f: 已打开的文件对象
+        path: 文件路径
+    """
+    try:
+        f.close()
+    except OSError:
+        pass
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 def update_state_file(story_data, filepath):
     """
     更新状态文件
     
+    只向状态日志追加一条记录，日志由状态存储在后台合并到状态文件。
+    
     Args:
         story_data: 故事数据
         filepath: 保存的文件路径
     """
     try:
-        # 加载现有状态
-        state = {}
-        if os.path.exists(STATE_FILE):
-            try:
-                with open(STATE_FILE, 'r', encoding='utf-8') as f:
-                    state = json.load(f)
-            except json.JSONDecodeError:
-                state = {}
-        
-        # 确保stories列表存在
-        if 'stories' not in state:
-            state['stories'] = []
-        
-        # 添加新故事记录
-        story_record = {
-            'title': story_data.get('title', 'Untitled'),
-            'language_code': story_data.get('language_code', 'XX'),
-            'region': story_data.get('region', 'Unknown'),
-            'category': story_data.get('category', 'traditional'),
-            'type': story_data.get('type', 'general'),
-            'filepath': filepath,
-            'collected_at': datetime.now().isoformat()
-        }
-        
-        state['stories'].append(story_record)
-        state['last_updated'] = datetime.now().isoformat()
-        
-        # 保存状态文件
-        with open(STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
-            
+        get_state_store().append(_build_story_record(story_data, filepath))
         log_operation(logger, "更新状态文件", "成功")
         
     except Exception as e:
         log_exception(logger, e, "更新状态文件失败")
 
+def _build_story_record(story_data, filepath):
+    """
+    创建状态文件中的故事记录
+    
+    Args:
+        story_data: 故事数据
+        filepath: 保存的文件路径
+        
+    Returns:
+        story_record: 故事记录
+    """
+    return {
+        'title': story_data.get('title', 'Untitled'),
+        'language_code': story_data.get('language_code', 'XX'),
+        'region': story_data.get('region', 'Unknown'),
+        'category': story_data.get('category', 'traditional'),
+        'type': story_data.get('type', 'general'),
+        'filepath': filepath,
+        'collected_at': datetime.now().isoformat()
+    }
+
 def get_existing_stories():
     """
     获取已存在的故事列表
@@ -178,38 +353,12 @@ def get_existing_stories():
     stories = []
     
     try:
-        # 从状态文件加载
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r', encoding='utf-8') as f:
-                state = json.load(f)
-                stories = state.get('stories', [])
+        # 从状态文件和状态日志加载
+        stories = get_state_store().load_stories()
         
-        # 如果状态文件为空，则扫描目录
+        # 如果状态文件为空，则扫描目录(只重新读取修改过的目录)
         if not stories:
-            for root, dirs, files in os.walk(STORIES_DIR):
-                for file in files:
-                    if file.endswith('.md'):
-                        filepath = os.path.join(root, file)
-                        relative_path = os.path.relpath(filepath, STORIES_DIR)
-                        parts = relative_path.split(os.sep)
-                        
-                        if len(parts) >= 3:
-                            category = parts[0]
-                            language_region = parts[1]
-                            language_code = language_region.split('_')[0] if '_' in language_region else 'XX'
-                            region = language_region.split('_')[1] if '_' in language_region else 'Unknown'
-                            
-                            story_record = {
-                                'title': file[:-3],  # 移除.md后缀
-                                'language_code': language_code,
-                                'region': region,
-                                'category': category,
-                                'type': parts[2] if len(parts) > 3 else 'general',
-                                'filepath': filepath,
-                                'collected_at': datetime.fromtimestamp(os.path.getctime(filepath)).isoformat()
-                            }
-                            
-                            stories.append(story_record)
+            stories = scan_story_files()
         
         return stories
         
@@ -217,6 +366,42 @@ def get_existing_stories():
         log_exception(logger, e, "获取现有故事列表失败")
         return []
 
+def scan_story_files():
+    """
+    扫描故事目录，生成故事记录
+    
+    Returns:
+        stories: 故事列表
+    """
+    stories = []
+    cache = get_scan_cache()
+    
+    for dirpath, files in cache.scan(STORIES_DIR):
+        # 同一目录下的文件共享路径解析结果
+        parts = os.path.relpath(dirpath, STORIES_DIR).split(os.sep)
+        if parts == ['.'] or len(parts) < 2:
+            continue
+        
+        category = parts[0]
+        language_region = parts[1]
+        language_code = language_region.split('_')[0] if '_' in language_region else 'XX'
+        region = language_region.split('_')[1] if '_' in language_region else 'Unknown'
+        story_type = parts[2] if len(parts) > 2 else 'general'
+        
+        for file, ctime in files:
+            stories.append({
+                'title': file[:-3],  # 移除.md后缀
+                'language_code': language_code,
+                'region': region,
+                'category': category,
+                'type': story_type,
+                'filepath': os.path.join(dirpath, file),
+                'collected_at': datetime.fromtimestamp(ctime).isoformat()
+            })
+    
+    cache.save()
+    return stories
+
 def backup_file(filepath):
     """
     备份文件
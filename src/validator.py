@@ -6,50 +6,185 @@
 import sys
 import os
 import re
+import hashlib
+import inspect
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 
 # 导入配置和工具
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils.logger import get_logger, log_operation
-from utils.formatter import validate_story_format, fix_common_issues
-from config.settings import STORY_LANGUAGES, STORY_TYPES, STORY_CATEGORIES
+from utils.formatter import validate_story_format, fix_common_issues, has_heading
+from utils.story_parser import parse_story
+from utils.validation_cache import ValidationCache, content_hash
+from config.settings import STORY_LANGUAGES, STORY_TYPES, STORY_CATEGORIES, VALIDATION_CACHE_FILE
 
 # 获取日志记录器
 logger = get_logger('story_validator')
 
-def validate_story(story_data, content):
+# 批量验证时每个任务包含的故事数，减少进程间传输的次数
+VALIDATION_CHUNK_SIZE = 32
+
+# 每个工作进程同时排队的任务数，限制未完成结果占用的内存
+PENDING_CHUNKS_PER_WORKER = 2
+
+# 验证规则集版本；规则依赖的公共代码(如故事解析)改变时递增，使全部缓存结果失效。
+# 单条规则函数本身的修改由源码哈希自动识别，只影响该规则的缓存结果
+RULESET_VERSION = 2
+
+# 验证结果缓存，按文件路径在每个进程中按需创建
+_validation_caches = {}
+
+def get_validation_cache(filepath=VALIDATION_CACHE_FILE):
+    """
+    获取验证结果缓存，同一进程中同一路径复用一个实例
+    
+    Args:
+        filepath: 缓存数据库路径
+    
+    Returns:
+        cache: ValidationCache实例
+    """
+    cache = _validation_caches.get(filepath)
+    if cache is None:
+        cache = _validation_caches[filepath] = ValidationCache(filepath)
+    return cache
+
+@lru_cache(maxsize=None)
+def _rule_version(rule):
+    """
+    计算验证规则的版本
+    
+    Args:
+        rule: 规则函数
+        
+    Returns:
+        version: 由规则集版本和函数源码得到的短哈希
+    """
+    try:
+        source = inspect.getsource(rule)
+    except (OSError, TypeError):
+        source = rule.__code__.co_code.hex()
+    return hashlib.md5(f"{RULESET_VERSION}|{source}".encode('utf-8')).hexdigest()[:16]
+
+def validate_story(story_data, content, cache=None):
     """
     验证故事数据和内容
     
+    提供缓存时，内容相关规则(格式、质量、修复)的结果按内容哈希缓存，内容和规则都没有变化时
+    直接返回缓存的结果；元数据验证开销很小，每次都重新执行。
+    
     Args:
         story_data: 故事元数据
         content: 故事内容
+        cache: 验证结果缓存(可选)，为None时不使用缓存
         
     Returns:
         (is_valid, issues, fixed_content): 是否有效、问题列表、修复后的内容
     """
     issues = []
     
+    rules = {'format': validate_story_format, 'quality': validate_content_quality, 'fix': fix_common_issues}
+    versions = {name: _rule_version(rule) for name, rule in rules.items()}
+    digest = content_hash(content) if cache is not None else None
+    cached = cache.get(digest, versions) if cache is not None else {}
+    computed = {}
+    
     # 验证元数据
     metadata_issues = validate_metadata(story_data)
     issues.extend(metadata_issues)
     
     # 验证内容格式
-    is_valid_format, format_issues = validate_story_format(content)
+    if 'format' not in cached:
+        computed['format'] = list(validate_story_format(content))
+    is_valid_format, format_issues = cached['format'] if 'format' in cached else computed['format']
     if not is_valid_format:
         issues.extend(format_issues)
         
     # 验证内容质量
-    quality_issues = validate_content_quality(content)
+    if 'quality' not in cached:
+        computed['quality'] = validate_content_quality(content)
+    quality_issues = cached['quality'] if 'quality' in cached else computed['quality']
     issues.extend(quality_issues)
     
-    # 如果有问题，尝试修复
+    # 如果有问题，尝试修复；缓存中只记录修复后有变化的内容
     fixed_content = content
     if issues:
-        fixed_content = fix_common_issues(content)
+        if 'fix' in cached:
+            fixed_content = cached['fix'] if cached['fix'] is not None else content
+        else:
+            fixed_content = fix_common_issues(content)
+            computed['fix'] = fixed_content if fixed_content != content else None
         log_operation(logger, "修复故事格式", "成功" if fixed_content != content else "无需修复")
     
+    if cache is not None and computed:
+        cache.put(digest, computed, versions)
+    
     return len(issues) == 0, issues, fixed_content
 
+def _validate_chunk(chunk, cache_file=None):
+    """
+    在工作进程中验证一组故事
+    
+    Args:
+        chunk: [(故事元数据, 故事内容), ...]
+        cache_file: 验证结果缓存路径，为None时不使用缓存
+        
+    Returns:
+        results: [(故事ID, 是否有效, 问题列表, 修复后的内容), ...]
+    """
+    cache = get_validation_cache(cache_file) if cache_file else None
+    return [(story_data.get('id'),) + validate_story(story_data, content, cache) for story_data, content in chunk]
+
+def _chunks(batch, size):
+    """把故事序列按固定大小分组"""
+    iterator = iter(batch)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def validate_stories(batch, workers=None, chunksize=VALIDATION_CHUNK_SIZE, cache_file=None):
+    """
+    批量验证故事，在多个进程中并行执行
+    
+    每组故事验证完成后立即返回结果，因此结果顺序与输入顺序不一定相同；
+    输入可以是生成器，最多只有 workers * PENDING_CHUNKS_PER_WORKER 组在处理中。
+    
+    Args:
+        batch: 可迭代的 (故事元数据, 故事内容)，元数据的 'id' 作为结果中的故事ID
+        workers: 进程数，默认为CPU核数，为1时在当前进程内按顺序验证
+        chunksize: 每个任务包含的故事数
+        cache_file: 验证结果缓存路径(如 VALIDATION_CACHE_FILE)，反复重新验证整个语料时使用；
+            为None时不使用缓存
+        
+    Yields:
+        (story_id, is_valid, issues, fixed_content): 故事ID、是否有效、问题列表、修复后的内容
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(batch, max(1, chunksize))
+    
+    if workers == 1:
+        for chunk in chunks:
+            yield from _validate_chunk(chunk, cache_file)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(_validate_chunk, chunk, cache_file))
+            if len(pending) >= workers * PENDING_CHUNKS_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
 def validate_metadata(story_data):
     """
     验证故事元数据
@@ -93,51 +228,30 @@ def validate_content_quality(content):
         issues: 问题列表
     """
     issues = []
+    document = parse_story(content)
     
     # 检查内容长度
     if len(content) < 200:
         issues.append("故事内容过短，应该至少包含200个字符")
     
     # 检查是否包含故事梗概部分
-    if not re.search(r'## 故事梗概', content, re.MULTILINE):
+    story_content = document.section_content('故事梗概')
+    if not has_heading(content, '故事梗概'):
         issues.append("缺少故事梗概部分")
-    else:
-        # 提取故事梗概
-        story_content_match = re.search(r'## 故事梗概\s+(.*?)(?=##|\Z)', content, re.DOTALL)
-        if story_content_match:
-            story_content = story_content_match.group(1).strip()
+    elif story_content is not None:
+        # 检查梗概长度
+        if len(story_content) < 100:
+            issues.append("故事梗概过短，应该至少包含100个字符的详细描述")
             
-            # 检查梗概长度
-            if len(story_content) < 100:
-                issues.append("故事梗概过短，应该至少包含100个字符的详细描述")
-                
-            # 检查是否有段落
-            if '\n\n' not in story_content and len(story_content) > 300:
-                issues.append("故事梗概缺少适当的段落分隔")
-    
-    # 检查文化背景部分
-    if '## 文化背景' in content:
-        culture_match = re.search(r'## 文化背景\s+(.*?)(?=##|\Z)', content, re.DOTALL)
-        if culture_match:
-            culture_content = culture_match.group(1).strip()
-            if len(culture_content) < 50:
-                issues.append("文化背景部分内容不足")
-    
-    # 检查故事主题部分
-    if '## 故事主题' in content:
-        theme_match = re.search(r'## 故事主题\s+(.*?)(?=##|\Z)', content, re.DOTALL)
-        if theme_match:
-            theme_content = theme_match.group(1).strip()
-            if len(theme_content) < 50:
-                issues.append("故事主题部分内容不足")
-    
-    # 检查教育价值部分
-    if '## 教育价值' in content:
-        edu_match = re.search(r'## 教育价值\s+(.*?)(?=##|\Z)', content, re.DOTALL)
-        if edu_match:
-            edu_content = edu_match.group(1).strip()
-            if len(edu_content) < 50:
-                issues.append("教育价值部分内容不足")
+        # 检查是否有段落
+        if '\n\n' not in story_content and len(story_content) > 300:
+            issues.append("故事梗概缺少适当的段落分隔")
+    
+    # 检查文化背景、故事主题和教育价值部分
+    for section_name in ('文化背景', '故事主题', '教育价值'):
+        section_content = document.section_content(section_name)
+        if section_content is not None and len(section_content) < 50:
+            issues.append(f"{section_name}部分内容不足")
     
     return issues
 
@@ -152,42 +266,38 @@ def extract_metadata_from_content(content):
         metadata: 提取的元数据
     """
     metadata = {}
+    document = parse_story(content)
     
     # 提取标题
-    title_match = re.search(r'^# ([^\(]+)(?:\(([^\)]+)\))?', content, re.MULTILINE)
-    if title_match:
-        metadata['title'] = title_match.group(1).strip()
-        if title_match.group(2):
-            metadata['original_title'] = title_match.group(2).strip()
+    if document.title:
+        title_match = re.match(r'([^\(]+)(?:\(([^\)]+)\))?', document.title)
+        if title_match:
+            metadata['title'] = title_match.group(1).strip()
+            if title_match.group(2):
+                metadata['original_title'] = title_match.group(2).strip()
     
     # 提取基本信息
-    basic_info_match = re.search(r'## 基本信息\s+(.*?)(?=##|\Z)', content, re.DOTALL)
-    if basic_info_match:
-        basic_info = basic_info_match.group(1).strip()
-        
-        # 提取故事编号
-        story_number_match = re.search(r'- 故事编号:\s*([^\n]+)', basic_info)
-        if story_number_match:
-            full_number = story_number_match.group(1).strip()
-            # 尝试提取语言代码
-            if len(full_number) >= 2:
-                metadata['language_code'] = full_number[:2]
-                metadata['story_number'] = full_number[2:] if len(full_number) > 2 else ''
-        
-        # 提取分类
-        category_match = re.search(r'- 分类:\s*([^\n]+)', basic_info)
-        if category_match:
-            metadata['category'] = _match_category(category_match.group(1).strip())
-        
-        # 提取子分类/地区
-        region_match = re.search(r'- 子分类:\s*([^\n]+)', basic_info)
-        if region_match:
-            metadata['region'] = region_match.group(1).strip()
-        
-        # 提取故事类型
-        type_match = re.search(r'- 类型:\s*([^\n]+)', basic_info)
-        if type_match:
-            metadata['type'] = _match_type(type_match.group(1).strip())
+    basic_info = document.basic_info
+    
+    # 提取故事编号
+    full_number = basic_info.get('故事编号')
+    if full_number:
+        # 尝试提取语言代码
+        if len(full_number) >= 2:
+            metadata['language_code'] = full_number[:2]
+            metadata['story_number'] = full_number[2:] if len(full_number) > 2 else ''
+    
+    # 提取分类
+    if basic_info.get('分类'):
+        metadata['category'] = _match_category(basic_info['分类'])
+    
+    # 提取子分类/地区
+    if basic_info.get('子分类'):
+        metadata['region'] = basic_info['子分类']
+    
+    # 提取故事类型
+    if basic_info.get('类型'):
+        metadata['type'] = _match_type(basic_info['类型'])
     
     return metadata
 
@@ -7,13 +7,26 @@
 
 import os
 import sys
+import json
+import time
+import random
+import asyncio
+import shutil
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from unittest.mock import patch, MagicMock
 
 # 添加项目路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.collector import StoryCollector
+from src.collector import (StoryCollector, AsyncStoryCollector, collect_stories_async,
+                           CollectionScheduler, TokenBucket, RateLimitedError,
+                           CollectionPlan, generate_plan, run_plan)
+from src.collector.scheduler import backoff_delay
+from src.collector.id_allocator import IdAllocator
+from src.database.story_db import StoryDatabase
+from config.settings import BASE_DIR
 from utils.fingerprint import generate_fingerprint
 
 class TestStoryCollector(unittest.TestCase):
@@ -21,12 +34,19 @@ class TestStoryCollector(unittest.TestCase):
     
     def setUp(self):
         """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = StoryDatabase(os.path.join(self.temp_dir, 'stories.db'))
         # 模拟初始化，跳过真实的加载过程
         with patch('src.collector.StoryCollector._load_existing_data'):
-            self.collector = StoryCollector()
+            self.collector = StoryCollector(IdAllocator(self.db))
             self.collector.existing_stories = []
             self.collector.fingerprints = {}
     
+    def tearDown(self):
+        """测试后清理"""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+    
     def test_is_duplicate_story(self):
         """测试故事重复检测"""
         # 添加一个已存在的故事指纹
@@ -123,5 +143,309 @@ class TestStoryCollector(unittest.TestCase):
         self.assertEqual(len(self.collector.fingerprints), 1, "应该添加新的指纹")
         self.assertEqual(len(self.collector.existing_stories), 1, "应该添加新的故事记录")
 
+
+class TestAsyncStoryCollector(unittest.TestCase):
+    """测试异步故事收集器"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = StoryDatabase(os.path.join(self.temp_dir, 'stories.db'))
+        self.collector = StoryCollector(IdAllocator(self.db))
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def collect(self, tasks, **kwargs):
+        async def run():
+            return [item async for item in collect_stories_async(tasks, collector=self.collector, **kwargs)]
+        return asyncio.run(run())
+    
+    def test_collect_stories_concurrently(self):
+        """测试多个收集任务同时进行"""
+        tasks = [('CN', '华北', 'traditional', 'myth')] * 20 + [('EN', 'London', 'modern', 'legend')] * 5
+        async_collector = AsyncStoryCollector(self.collector, concurrency=25, latency=0.2)
+        
+        async def run():
+            return [item async for item in async_collector.collect_stories(iter(tasks))]
+        
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        self.assertLess(time.perf_counter() - started, 1.0)
+        
+        self.assertEqual(len(results), 25)
+        self.assertTrue(all(success for _, (success, _, _) in results))
+        ids = sorted(metadata['id'] for _, (_, metadata, _) in results)
+        self.assertEqual(ids, [f'CN{i:03d}' for i in range(1, 21)] + [f'EN{i:03d}' for i in range(1, 6)])
+        for task, (_, metadata, content) in results:
+            self.assertEqual((metadata['language'], metadata['region']), task[:2])
+            self.assertTrue(content.startswith(f"# {metadata['title']}"))
+    
+    def test_concurrency_limit(self):
+        """测试同时进行的任务数不超过并发数，失败的任务不影响其他任务"""
+        running = []
+        peak = []
+        
+        async def collect_story(self, language, region, category, story_type):
+            running.append(language)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(language)
+            if language == 'XX':
+                raise RuntimeError('网络错误')
+            return True, {'language': language}, ''
+        
+        tasks = [('CN', '华北', 'traditional', 'myth')] * 10 + [('XX', '', '', '')]
+        with patch.object(AsyncStoryCollector, 'collect_story', collect_story):
+            results = self.collect(tasks, concurrency=3)
+        
+        self.assertEqual(max(peak), 3)
+        self.assertEqual(len(results), 11)
+        self.assertIn((('XX', '', '', ''), (False, None, '')), results)
+        with self.assertRaises(ValueError):
+            AsyncStoryCollector(self.collector, concurrency=0)
+    
+    def test_reuse_across_event_loops(self):
+        """测试同一个收集器可以在多个事件循环中使用"""
+        async_collector = AsyncStoryCollector(self.collector, concurrency=1, latency=0.01)
+        tasks = [('CN', '华北', 'traditional', 'myth')] * 3
+        
+        # 直接并发调用 collect_story(如调度器)时任务需要等待信号量
+        async def run():
+            return await asyncio.gather(*(async_collector.collect_story(*task) for task in tasks))
+        
+        for _ in range(2):
+            results = asyncio.run(run())
+            self.assertTrue(all(success for success, _, _ in results))
+
+
+class FakeSource:
+    """按预设的失败次数返回结果的收集器，记录调用顺序"""
+    
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.calls = []
+    
+    async def collect_story(self, language, region, category, story_type):
+        task = (language, region, category, story_type)
+        self.calls.append(task)
+        await asyncio.sleep(0)
+        error = self.failures.get(task)
+        if error is not None and error[1] > 0:
+            self.failures[task] = (error[0], error[1] - 1)
+            raise error[0]
+        return True, {'language': language, 'region': region, 'type': story_type}, ''
+
+
+class TestCollectionScheduler(unittest.TestCase):
+    """测试收集调度器"""
+    
+    def run_scheduler(self, scheduler, tasks):
+        async def run():
+            return [item async for item in scheduler.run(tasks)]
+        return asyncio.run(run())
+    
+    def test_token_bucket(self):
+        """测试令牌桶的突发和补充"""
+        bucket = TokenBucket(rate=2, capacity=2)
+        self.assertEqual(bucket.acquire(0.0), 0)
+        self.assertEqual(bucket.acquire(0.0), 0)
+        self.assertAlmostEqual(bucket.acquire(0.0), 0.5)
+        self.assertEqual(bucket.acquire(0.5), 0)
+        bucket.pause(0.5, 3)
+        self.assertAlmostEqual(bucket.acquire(0.5), 3)
+    
+    def test_backoff_delay(self):
+        """测试指数退避和上限"""
+        rnd = MagicMock()
+        rnd.uniform.side_effect = lambda low, high: high
+        self.assertEqual([backoff_delay(n, 0.5, 3, rnd) for n in range(1, 6)], [0.5, 1, 2, 3, 3])
+    
+    def test_rate_limited_source_does_not_block_others(self):
+        """测试限流来源的任务推迟时先执行其他来源的任务"""
+        slow = [('CN', '华北', 'traditional', 'myth')] * 3
+        fast = [('EN', 'London', 'modern', 'legend')] * 5
+        source = FakeSource()
+        scheduler = CollectionScheduler(source, concurrency=4, rate=100, burst=10,
+                                        source_rates={('CN', '华北'): (10, 1)})
+        
+        started = time.perf_counter()
+        results = self.run_scheduler(scheduler, slow + fast)
+        elapsed = time.perf_counter() - started
+        
+        self.assertEqual(source.calls, slow[:1] + fast + slow[1:])
+        self.assertEqual(len(results), 8)
+        # 第二、三个华北任务依次等待令牌(每0.1秒一个)，第三个任务被推迟两次
+        self.assertGreaterEqual(elapsed, 0.18)
+        self.assertEqual(scheduler.stats['throttled'], 3)
+    
+    def test_retry_with_backoff(self):
+        """测试失败的任务重试，超过重试次数时返回失败结果"""
+        flaky = ('CN', '华北', 'traditional', 'myth')
+        broken = ('JP', 'Tokyo', 'modern', 'legend')
+        limited = ('FR', 'Paris', 'festival', 'fairy_tale')
+        source = FakeSource({
+            flaky: (RuntimeError('超时'), 2),
+            broken: (RuntimeError('服务不可用'), 10),
+            limited: (RateLimitedError('请求过多', retry_after=0.05), 1)
+        })
+        scheduler = CollectionScheduler(source, rate=100, burst=10, retry_count=2, base_delay=0.01,
+                                        rnd=random.Random(0))
+        
+        results = dict(self.run_scheduler(scheduler, [flaky, broken, limited]))
+        self.assertTrue(results[flaky][0])
+        self.assertTrue(results[limited][0])
+        self.assertEqual(results[broken], (False, None, ''))
+        self.assertEqual(source.calls.count(flaky), 3)
+        self.assertEqual(source.calls.count(broken), 3)
+        self.assertEqual(scheduler.stats, {'attempts': 8, 'retries': 5, 'throttled': 0, 'failed': 1})
+
+
+class TestCollectionPlan(unittest.TestCase):
+    """测试收集计划"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.plan_file = os.path.join(self.temp_dir, 'collection_plan.json')
+        self.journal_file = os.path.join(self.temp_dir, 'collection_plan.journal')
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def open_plan(self, tasks, checkpoint_interval=3):
+        return CollectionPlan(tasks, self.plan_file, self.journal_file, checkpoint_interval)
+    
+    def test_generate_plan(self):
+        """测试展开语言、地区、分类和类型"""
+        tasks = generate_plan()
+        self.assertEqual(len(tasks), 9 * 3 * 4)
+        self.assertEqual(tasks[0], ('CN', '中国', 'traditional', 'fairy_tale'))
+        self.assertIn(('JP', 'Kyoto', 'festival', 'myth'), tasks)
+        self.assertEqual(generate_plan(['EN'], ['modern'], ['legend'], 2),
+                         [('EN', 'London', 'modern', 'legend')] * 2 + [('EN', 'Edinburgh', 'modern', 'legend')] * 2)
+    
+    def test_resume_from_checkpoint(self):
+        """测试中断后只接续已写入进度日志的任务"""
+        tasks = generate_plan(['EN', 'JP'], ['modern'], ['legend'])
+        plan = self.open_plan(tasks)
+        for index in range(4):
+            plan.mark_done(index)
+        # 第4个完成的任务还没有写入日志，模拟此时中断
+        
+        plan = self.open_plan(tasks)
+        self.assertEqual(plan.progress(), (3, 4))
+        self.assertEqual(plan.pending(), [(3, ('JP', 'Kyoto', 'modern', 'legend'))])
+        with plan:
+            plan.mark_done(3)
+        self.assertTrue(self.open_plan(tasks).is_complete())
+        
+        # 任务列表变化时重新开始
+        plan = self.open_plan(tasks[:2], checkpoint_interval=1)
+        self.assertEqual(plan.progress(), (0, 2))
+        
+        # 日志末尾写了一半的行在打开时被截掉，之后写入的进度仍然可以读取
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write('{"plan": "')
+        plan = self.open_plan(tasks[:2], checkpoint_interval=1)
+        plan.mark_done(0)
+        self.assertEqual(self.open_plan(tasks[:2]).pending(), [(1, tasks[1])])
+    
+    def test_run_plan(self):
+        """测试按计划收集，失败的任务在下次运行时重新执行"""
+        tasks = generate_plan(['EN'], ['modern'], ['legend', 'myth'])
+        source = FakeSource({tasks[1]: (RuntimeError('服务不可用'), 1)})
+        scheduler = CollectionScheduler(source, rate=100, burst=10, retry_count=0)
+        
+        async def run(plan):
+            return [item async for item in run_plan(plan, scheduler)]
+        
+        # 调用方在处理第一个结果时中断，该任务不记录为完成
+        async def interrupted(plan):
+            async for task, result in run_plan(plan, scheduler):
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            asyncio.run(interrupted(self.open_plan(tasks, checkpoint_interval=1)))
+        self.assertEqual(self.open_plan(tasks).progress(), (0, 4))
+        
+        source.failures[tasks[1]] = (RuntimeError('服务不可用'), 1)
+        results = asyncio.run(run(self.open_plan(tasks, checkpoint_interval=10)))
+        self.assertEqual(sum(1 for _, result in results if result[0]), 3)
+        
+        plan = self.open_plan(tasks)
+        self.assertEqual(plan.pending(), [(1, tasks[1])])
+        results = asyncio.run(run(plan))
+        self.assertEqual(results, [(tasks[1], (True, {'language': 'EN', 'region': 'London', 'type': 'myth'}, ''))])
+        self.assertTrue(self.open_plan(tasks).is_complete())
+
+
+def _allocate_ids(args):
+    """在子进程中分配ID"""
+    db_path, count = args
+    with StoryDatabase(db_path) as db:
+        allocator = IdAllocator(db, block_size=7)
+        return [allocator.next_id('CN') for _ in range(count)]
+
+
+class TestIdAllocator(unittest.TestCase):
+    """测试故事ID分配器"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'stories.db')
+        self.db = StoryDatabase(self.db_path)
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def test_allocate_from_leased_blocks(self):
+        """测试从租用的区间分配ID，每个区间只写一次数据库"""
+        counter_file = os.path.join(self.temp_dir, 'id_counter.json')
+        with open(counter_file, 'w') as f:
+            f.write('{"CN": 41}')
+        allocator = IdAllocator(self.db, block_size=5, legacy_counter_file=counter_file)
+        
+        with patch.object(self.db, 'lease_id_block', wraps=self.db.lease_id_block) as lease:
+            ids = [allocator.next_id('CN') for _ in range(12)] + [allocator.next_id('EN')]
+        self.assertEqual(ids, [f'CN{i:03d}' for i in range(42, 54)] + ['EN001'])
+        self.assertEqual(lease.call_count, 4)
+        
+        # 新的分配器从已租出的区间之后开始
+        self.assertEqual(IdAllocator(self.db, block_size=5).next_id('CN'), 'CN057')
+    
+    def test_legacy_counter_independent_of_cwd(self):
+        """测试在其他工作目录下运行时仍接续项目目录下的旧ID计数器"""
+        with open(os.path.join(BASE_DIR, 'data', 'id_counter.json')) as f:
+            last_value = json.load(f)['CN']
+        
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            collector = StoryCollector()
+            collector.id_allocator.db = self.db
+            self.assertEqual(collector.id_allocator.next_id('CN'), f'CN{last_value + 1:03d}')
+        finally:
+            os.chdir(cwd)
+    
+    def test_default_database_path(self):
+        """测试默认数据库位于项目目录下，与当前工作目录无关"""
+        with patch('src.collector.id_allocator.StoryDatabase', return_value=self.db) as database:
+            self.assertEqual(IdAllocator().next_id('CN'), 'CN001')
+        database.assert_called_once_with(os.path.join(BASE_DIR, 'data', 'database', 'stories.db'))
+    
+    def test_parallel_processes(self):
+        """测试多个进程同时分配ID不重复"""
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(_allocate_ids, [(self.db_path, 30)] * 4))
+        ids = [story_id for result in results for story_id in result]
+        self.assertEqual(len(set(ids)), 120)
+
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试故事指纹与去重模块
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils.fingerprint
+from utils.fingerprint import (
+    generate_fingerprint, is_duplicate, calculate_similarity, deduplicate_batch, SimilarityChecker,
+    _extract_content_signature
+)
+from utils.shingling import detect_script, get_shingles, SCRIPT_CJK, SCRIPT_LATIN
+from utils.lsh_index import MinHashLSHIndex, load_lsh_index, lsh_index_path
+from src.cluster_duplicates import find_duplicate_clusters, load_corpus_from_stories_dir, write_report
+from utils.fingerprint_store import FingerprintStore, open_fingerprint_store, fingerprint_store_path
+
+CHARS = [chr(code) for code in range(0x4e00, 0x4e00 + 2000)]
+
+
+def make_story(seed, length=600):
+    """生成随机故事内容"""
+    rng = random.Random(seed)
+    return ''.join(rng.choice(CHARS) for _ in range(length))
+
+
+def mutate(text, count, seed=0):
+    """随机替换部分字符"""
+    rng = random.Random(seed)
+    chars = list(text)
+    for i in rng.sample(range(len(chars)), count):
+        chars[i] = rng.choice(CHARS)
+    return ''.join(chars)
+
+
+class TestShingling(unittest.TestCase):
+    """测试文本分片"""
+
+    def test_detect_script(self):
+        """测试文字体系检测"""
+        self.assertEqual(detect_script('从前有一座山，山里有一座庙'), SCRIPT_CJK)
+        self.assertEqual(detect_script('むかしむかし、あるところに'), SCRIPT_CJK)
+        self.assertEqual(detect_script('Once upon a time there was a fox'), SCRIPT_LATIN)
+        self.assertEqual(detect_script('Once upon a time', 'CN'), SCRIPT_CJK)
+
+    def test_cjk_signature_is_bounded(self):
+        """测试中文内容签名长度有上限"""
+        signature = _extract_content_signature(make_story(1, 5000))
+        self.assertEqual(len(signature), 203)
+
+    def test_shingles(self):
+        """测试哈希片段集合"""
+        text = make_story(2)
+        shingles = get_shingles(text)
+
+        self.assertEqual(shingles.typecode, 'Q')
+        self.assertEqual(list(shingles), sorted(set(shingles)))
+        self.assertIs(get_shingles(text), shingles)
+        self.assertGreater(len(set(shingles) & set(get_shingles(mutate(text, 10)))), len(shingles) // 2)
+        self.assertLess(len(set(shingles) & set(get_shingles(make_story(3)))), len(shingles) // 10)
+
+        english = get_shingles('the quick brown fox jumps over the lazy dog')
+        self.assertEqual(len(english), 7)
+
+
+class TestSimilarityChecker(unittest.TestCase):
+    """测试分层相似度检查"""
+
+    def test_layers_prune_and_agree(self):
+        """测试各层剪枝结果与完整计算一致"""
+        checker = SimilarityChecker()
+        base = make_story(10)
+        pairs = [
+            (base, base[:100]),                      # 长度相差很大
+            (base, make_story(11)),                  # 字符分布不同
+            (base, base[300:] + base[:300]),          # 字符相同但顺序不同
+            (base, mutate(base, 10))                 # 近似重复
+        ]
+
+        for text1, text2 in pairs:
+            self.assertEqual(checker.exceeds(text1, text2, 0.85), calculate_similarity(text1, text2) > 0.85)
+
+        self.assertEqual(checker.stats['pairs'], 4)
+        self.assertEqual(checker.stats['pruned_length'], 1)
+        self.assertEqual(checker.stats['pruned_histogram'], 1)
+        self.assertEqual(checker.stats['pruned_ratio'], 1)
+        self.assertEqual(checker.stats['matched'], 1)
+
+    def test_cache(self):
+        """测试清理文本缓存"""
+        checker = SimilarityChecker(cache_size=2)
+        first = checker.prepare('# 标题\n内容', key='a')
+
+        self.assertIs(checker.prepare('其他内容', key='a'), first)
+        checker.prepare('b', key='b')
+        checker.prepare('c', key='c')
+        self.assertIsNone(checker.cached('a'))
+
+
+class TestDeduplicateBatch(unittest.TestCase):
+    """测试批量去重"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.existing = {}
+        for i in range(20):
+            story = {'title': f'已有{i}', 'language_code': 'CN', 'region': '中国', 'story_content': make_story(i)}
+            self.existing[generate_fingerprint(story)] = story
+
+        self.stories = []
+        for i in range(30):
+            if i % 3 == 0:
+                content = mutate(make_story(i % 20), 5, seed=i)        # 与已有故事相似
+            elif i % 3 == 1 and i > 10:
+                content = mutate(self.stories[i - 10]['story_content'], 5, seed=i)  # 与批次内故事相似
+            else:
+                content = make_story(100 + i)
+            self.stories.append({'title': f'新{i}', 'language_code': 'CN', 'region': '中国', 'story_content': content})
+        self.stories.append(dict(self.stories[2]))                     # 完全相同
+        self.stories.append(dict(self.stories[5], title='新5日文', language_code='JP'))  # 不同语言
+
+    def sequential(self):
+        """逐个调用 is_duplicate 的结果"""
+        fingerprints = dict(self.existing)
+        duplicates = set()
+        for i, story in enumerate(self.stories):
+            if is_duplicate(story, fingerprints):
+                duplicates.add(i)
+            else:
+                fingerprints[generate_fingerprint(story)] = story
+        return duplicates
+
+    def test_matches_sequential(self):
+        """测试结果与逐个检查一致"""
+        expected = self.sequential()
+        duplicates = deduplicate_batch(self.stories, self.existing, workers=1)
+
+        self.assertEqual(set(duplicates), expected)
+        self.assertIn(duplicates[0], self.existing)
+        self.assertEqual(duplicates[len(self.stories) - 2], 2)
+        self.assertNotIn(len(self.stories) - 1, duplicates)
+
+    def test_process_pool(self):
+        """测试使用进程池计算"""
+        with patch.object(utils.fingerprint, 'PARALLEL_MIN_PAIRS', 0):
+            duplicates = deduplicate_batch(self.stories, self.existing, workers=2)
+        self.assertEqual(duplicates, deduplicate_batch(self.stories, self.existing, workers=1))
+
+    def test_with_lsh_index(self):
+        """测试使用候选索引"""
+        duplicates = deduplicate_batch(self.stories, self.existing, workers=1, lsh_index=MinHashLSHIndex())
+        self.assertEqual(set(duplicates), self.sequential())
+
+
+class TestLSHIndex(unittest.TestCase):
+    """测试MinHash/LSH候选索引"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.fingerprints = {}
+        for i in range(50):
+            story = {
+                'title': f'故事{i}',
+                'region': '中国',
+                'type': 'fairy_tale',
+                'language_code': 'CN',
+                'story_content': make_story(i)
+            }
+            self.fingerprints[generate_fingerprint(story)] = story
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_query_returns_near_duplicate(self):
+        """测试近似重复的故事会出现在候选中"""
+        index = MinHashLSHIndex()
+        index.sync(self.fingerprints)
+
+        key, data = next(iter(self.fingerprints.items()))
+        candidates = index.query(mutate(data['story_content'], 20))
+
+        self.assertIn(key, candidates)
+        self.assertLess(len(candidates), len(self.fingerprints))
+
+    def test_is_duplicate_with_index(self):
+        """测试使用索引时的重复检测结果与全量比较一致"""
+        index = MinHashLSHIndex()
+        data = next(iter(self.fingerprints.values()))
+
+        near = dict(data, title='新标题', story_content=mutate(data['story_content'], 20))
+        other = dict(data, title='另一个标题', story_content=make_story(1000))
+
+        for story in (near, other):
+            self.assertEqual(
+                is_duplicate(story, self.fingerprints, lsh_index=index),
+                is_duplicate(story, self.fingerprints)
+            )
+        self.assertTrue(is_duplicate(near, self.fingerprints, lsh_index=index))
+        self.assertFalse(is_duplicate(other, self.fingerprints, lsh_index=index))
+
+    def test_index_follows_replaced_fingerprint(self):
+        """测试删除一个指纹并加入另一个(数量不变)后索引同步更新"""
+        index = MinHashLSHIndex()
+        fingerprints = dict(self.fingerprints)
+        index.sync(fingerprints)
+
+        removed = next(iter(fingerprints))
+        del fingerprints[removed]
+        added = {'title': '新故事', 'region': '中国', 'type': 'fairy_tale', 'language_code': 'CN',
+                 'story_content': make_story(1000)}
+        fingerprints[generate_fingerprint(added)] = added
+        self.assertEqual(len(index), len(fingerprints))
+
+        near = dict(added, title='新标题', story_content=mutate(added['story_content'], 20))
+        self.assertTrue(is_duplicate(near, fingerprints, lsh_index=index))
+        self.assertNotIn(removed, index)
+
+    def test_recall_near_threshold(self):
+        """测试相似度刚超过阈值的故事使用索引时同样被判定为重复"""
+        index = MinHashLSHIndex()
+        index.sync(self.fingerprints)
+        tested = 0
+        for seed, (key, data) in enumerate(self.fingerprints.items()):
+            # 逐步增加替换的字符，取相似度刚超过0.85的版本
+            for count in range(60, 120, 2):
+                content = mutate(data['story_content'], count, seed)
+                if calculate_similarity(data['story_content'], content) < 0.87:
+                    break
+            if calculate_similarity(data['story_content'], content) <= 0.85:
+                continue
+            near = dict(data, title=f'新标题{seed}', story_content=content)
+            self.assertIn(key, index.query(content, language_code='CN'))
+            self.assertTrue(is_duplicate(near, self.fingerprints))
+            self.assertTrue(is_duplicate(near, self.fingerprints, lsh_index=index))
+            tested += 1
+        self.assertGreater(tested, 30)
+
+    def test_save_and_load(self):
+        """测试索引持久化"""
+        fingerprint_file = os.path.join(self.temp_dir, 'fingerprints.json')
+        index = load_lsh_index(fingerprint_file, self.fingerprints)
+
+        self.assertTrue(os.path.exists(lsh_index_path(fingerprint_file)))
+
+        loaded = MinHashLSHIndex.load(lsh_index_path(fingerprint_file))
+        self.assertEqual(len(loaded), len(self.fingerprints))
+
+        key, data = next(iter(self.fingerprints.items()))
+        self.assertEqual(loaded.signatures[key], index.signatures[key])
+        self.assertIn(key, loaded.query(data['story_content']))
+
+
+class TestFingerprintStore(unittest.TestCase):
+    """测试追加写入的指纹存储"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.temp_dir, 'fingerprints.log')
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_append_and_reopen(self):
+        """测试追加记录后重新打开"""
+        with FingerprintStore(self.filepath) as store:
+            store['a'] = {'title': '故事A', 'story_content': make_story(1)}
+            store['b'] = {'title': '故事B', 'story_content': make_story(2)}
+            store['a'] = {'title': '故事A2', 'story_content': make_story(3)}
+            del store['b']
+
+        with FingerprintStore(self.filepath) as store:
+            self.assertEqual(list(store), ['a'])
+            self.assertEqual(store['a']['title'], '故事A2')
+            self.assertEqual(store['a']['story_content'], make_story(3))
+            self.assertEqual(dict(store['a']), {'title': '故事A2', 'story_content': make_story(3)})
+
+    def test_truncated_record_is_discarded(self):
+        """测试写入中断的记录会被丢弃"""
+        with FingerprintStore(self.filepath) as store:
+            store['a'] = {'title': '故事A', 'story_content': make_story(1)}
+            store['b'] = {'title': '故事B', 'story_content': make_story(2)}
+
+        with open(self.filepath, 'r+b') as f:
+            f.truncate(os.path.getsize(self.filepath) - 10)
+
+        with FingerprintStore(self.filepath) as store:
+            self.assertEqual(list(store), ['a'])
+            store['c'] = {'title': '故事C'}
+
+        with FingerprintStore(self.filepath) as store:
+            self.assertEqual(sorted(store), ['a', 'c'])
+
+    def test_compaction(self):
+        """测试自动压缩"""
+        store = FingerprintStore(self.filepath, compact_min_dead=10)
+        for i in range(30):
+            store['a'] = {'title': f'故事{i}', 'story_content': make_story(i)}
+        size = os.path.getsize(self.filepath)
+        store.close()
+
+        self.assertLess(size, 12 * len(make_story(0).encode('utf-8')))
+        with FingerprintStore(self.filepath) as store:
+            self.assertEqual(store['a']['title'], '故事29')
+
+    def test_record_read_after_compaction(self):
+        """测试压缩前取得的记录在压缩后仍读到正确的正文"""
+        with FingerprintStore(self.filepath, compact_min_dead=10) as store:
+            for i in range(5):
+                store['a'] = {'title': f'故事{i}', 'story_content': make_story(i)}
+            store['kept'] = {'title': '保留的故事', 'story_content': make_story(100)}
+            record = store['kept']
+            # 压缩去掉前面失效的记录，保留的故事在日志中的位置前移
+            for i in range(5, 30):
+                store['a'] = {'title': f'故事{i}', 'story_content': make_story(i)}
+            self.assertEqual(record['story_content'], make_story(100))
+
+    def test_migrate_from_json(self):
+        """测试从旧的JSON文件导入"""
+        json_path = os.path.join(self.temp_dir, 'fingerprints.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            f.write('{"x": {"title": "旧故事", "story_content": "内容"}}')
+
+        with open_fingerprint_store(json_path) as store:
+            self.assertEqual(store.filepath, fingerprint_store_path(json_path))
+            self.assertEqual(store['x']['story_content'], '内容')
+            self.assertTrue(is_duplicate({'title': '旧故事'}, store))
+
+    def test_interrupted_migration(self):
+        """测试导入中断时不留下不完整的日志，下次打开重新导入"""
+        json_path = os.path.join(self.temp_dir, 'fingerprints.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            f.write('{"x": {"title": "故事1"}, "y": {"title": "故事2"}}')
+
+        setitem = FingerprintStore.__setitem__
+        def interrupt(store, fingerprint, data):
+            if fingerprint == 'y':
+                raise KeyboardInterrupt
+            setitem(store, fingerprint, data)
+
+        with patch.object(FingerprintStore, '__setitem__', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                open_fingerprint_store(json_path)
+        self.assertFalse(os.path.exists(fingerprint_store_path(json_path)))
+
+        with open_fingerprint_store(json_path) as store:
+            self.assertEqual(sorted(store), ['x', 'y'])
+
+
+class TestDuplicateClusters(unittest.TestCase):
+    """测试全库近似重复聚类"""
+
+    def test_clusters(self):
+        """测试近似重复故事被合并为簇"""
+        corpus = {}
+        for i in range(40):
+            corpus[f'k{i:02d}'] = {'title': f'故事{i}', 'language_code': 'CN', 'story_content': make_story(i)}
+        # k00 与 k40、k41 近似重复，k05 与 k42 近似重复，k43 是不同语言的副本
+        corpus['k40'] = dict(corpus['k00'], title='副本1', story_content=mutate(corpus['k00']['story_content'], 10, 1))
+        corpus['k41'] = dict(corpus['k00'], title='副本2', story_content=mutate(corpus['k40']['story_content'], 10, 2))
+        corpus['k42'] = dict(corpus['k05'], title='副本3', story_content=mutate(corpus['k05']['story_content'], 10, 3))
+        corpus['k43'] = dict(corpus['k05'], title='副本4', language_code='JP')
+
+        clusters, stats = find_duplicate_clusters(corpus, workers=1)
+
+        self.assertEqual([cluster['members'] for cluster in clusters], [['k00', 'k40', 'k41'], ['k05', 'k42']])
+        self.assertEqual(len(clusters[0]['edges']), 2)
+        self.assertTrue(all(edge['similarity'] > 0.85 for edge in clusters[0]['edges']))
+        self.assertEqual(stats['duplicate_stories'], 3)
+
+    def test_stories_dir_report(self):
+        """测试从故事目录生成报告"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            story_dir = os.path.join(temp_dir, 'traditional', 'CN_中国', 'fairy_tale')
+            os.makedirs(story_dir)
+            content = make_story(1)
+            for name, text in [('a', content), ('b', mutate(content, 5)), ('c', make_story(2))]:
+                with open(os.path.join(story_dir, f'{name}.md'), 'w', encoding='utf-8') as f:
+                    f.write(f'# 故事{name}\n\n{text}')
+
+            corpus = load_corpus_from_stories_dir(temp_dir)
+            self.assertEqual(corpus[os.path.join('traditional', 'CN_中国', 'fairy_tale', 'a.md')]['region'], '中国')
+
+            clusters, stats = find_duplicate_clusters(corpus, workers=1)
+            self.assertEqual(len(clusters), 1)
+
+            report_path = os.path.join(temp_dir, 'report.json')
+            self.assertTrue(write_report(clusters, stats, report_path, corpus))
+            self.assertTrue(os.path.exists(report_path))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
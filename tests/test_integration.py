@@ -16,6 +16,8 @@ import unittest
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.collector import StoryCollector
+from src.collector.id_allocator import IdAllocator
+from src.database.story_db import StoryDatabase
 from src.validator import validate_story
 from utils.formatter import format_story
 from utils.fingerprint import generate_fingerprint, is_duplicate
@@ -39,8 +41,9 @@ class TestIntegration(unittest.TestCase):
         # 创建必要的目录
         os.makedirs(config.settings.STORIES_DIR, exist_ok=True)
         
-        # 初始化收集器
-        self.collector = StoryCollector()
+        # 初始化收集器，ID序列保存在临时数据库中
+        self.db = StoryDatabase(os.path.join(self.temp_dir, 'stories.db'))
+        self.collector = StoryCollector(IdAllocator(self.db))
     
     def tearDown(self):
         """测试后清理"""
@@ -50,6 +53,7 @@ class TestIntegration(unittest.TestCase):
         config.settings.STATE_FILE = self.original_state_file
         
         # 删除临时目录
+        self.db.close()
         shutil.rmtree(self.temp_dir)
     
     def test_full_workflow(self):
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试分阶段处理管道
+"""
+
+import os
+import sys
+import time
+import shutil
+import operator
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+# 添加项目路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.storage as storage
+from src.pipeline import Pipeline, Stage, build_ingest_pipeline
+from src.state_store import StateStore
+from src.database.story_db import StoryDatabase
+
+SUMMARIES = [
+    '后羿射下九个太阳，百姓终于可以安心耕种。',
+    '一只狐狸看见葡萄太高，就说葡萄是酸的。',
+    'The tortoise kept walking while the hare slept under a tree.',
+    '愚公带着子孙每天挖山，感动了天帝。'
+]
+
+
+class TestPipeline(unittest.TestCase):
+    """测试管道运行"""
+
+    def test_stages_drop_and_errors(self):
+        """测试各阶段依次处理，丢弃和出错的数据不传给下游"""
+        def check(value):
+            if value == 13:
+                raise ValueError('不吉利的数')
+            return value if value % 5 else None
+
+        pipeline = Pipeline([
+            Stage('double', lambda value: value * 2, workers=3),
+            Stage('check', check, workers=2),
+            Stage('negate', operator.neg, workers=2, use_processes=True)
+        ], queue_size=4)
+
+        # 6.5 加倍后为13，在第二个阶段出错
+        results = sorted(pipeline.run([6.5] + list(range(20))))
+        self.assertEqual(results, sorted(-value * 2 for value in range(20) if (value * 2) % 5))
+
+        metrics = {item['stage']: item for item in pipeline.metrics()}
+        self.assertEqual(metrics['double']['received'], 21)
+        self.assertEqual(metrics['check']['errors'], 1)
+        self.assertEqual(metrics['check']['dropped'], 4)
+        self.assertEqual(metrics['negate']['emitted'], 16)
+        self.assertEqual(metrics['negate']['workers'], 2)
+        self.assertEqual(metrics['negate']['queue_depth'], 0)
+
+    def test_backpressure(self):
+        """测试慢的阶段使上游在队列满后等待，输入按需读取"""
+        pulled = []
+
+        def source():
+            for i in range(100):
+                pulled.append(i)
+                yield i
+
+        pipeline = Pipeline([Stage('fast', lambda value: value), Stage('slow', lambda value: value)], queue_size=2)
+        results = pipeline.run(source())
+        self.assertEqual(next(results), 0)
+        time.sleep(0.2)
+        # 输入最多填满两个阶段的输入队列、输出队列和各线程手中的一项
+        self.assertLess(len(pulled), 12)
+        results.close()
+
+        metrics = pipeline.metrics()
+        self.assertLessEqual(max(item['max_queue_depth'] for item in metrics), 2)
+
+    def test_slow_stage_does_not_stall_upstream(self):
+        """测试下游的慢阶段不会使上游停顿"""
+        collected = []
+
+        def collect(value):
+            collected.append(value)
+            return value
+
+        def sync(value):
+            time.sleep(0.05)
+            return value
+
+        pipeline = Pipeline([Stage('collect', collect), Stage('sync', sync, workers=1)], queue_size=50)
+        results = pipeline.run(range(40))
+        next(results)
+        time.sleep(0.1)
+        self.assertEqual(len(collected), 40)
+        self.assertEqual(len(list(results)), 39)
+
+
+class TestIngestPipeline(unittest.TestCase):
+    """测试收集入库管道"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.patches = [
+            patch.object(storage, 'STORIES_DIR', os.path.join(self.temp_dir, 'stories')),
+            patch.object(storage, '_state_store', StateStore(
+                os.path.join(self.temp_dir, 'state.json'), os.path.join(self.temp_dir, 'state.journal')
+            ))
+        ]
+        for p in self.patches:
+            p.start()
+        self.db = StoryDatabase(os.path.join(self.temp_dir, 'stories.db'))
+
+    def tearDown(self):
+        """测试后清理"""
+        for p in self.patches:
+            p.stop()
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_ingest(self):
+        """测试收集、验证、去重、保存、索引和同步"""
+        lock = threading.Lock()
+        counter = [0]
+
+        def collect_story(language, region, category, story_type):
+            with lock:
+                counter[0] += 1
+                number = counter[0]
+            title = '重复的故事' if number > 3 else f'故事{number}'
+            summary = SUMMARIES[min(number, 4) - 1]
+            content = f"# {title}\n\n## 故事梗概\n{summary}\n"
+            metadata = {'id': f'{language}{number:03d}', 'title': title, 'language': language,
+                        'region': region, 'category': category, 'type': story_type}
+            return True, metadata, content
+
+        collector = MagicMock()
+        collector.collect_story.side_effect = collect_story
+        notion = MagicMock()
+        notion.sync_story.return_value = True
+
+        pipeline = build_ingest_pipeline(collector, db=self.db, notion=notion, collect_workers=2,
+                                         validate_workers=1)
+        tasks = [('CN', '华北', 'traditional', 'myth')] * 6
+        results = list(pipeline.run(tasks))
+
+        # 后三个故事标题相同，只保留第一个
+        self.assertEqual(len(results), 4)
+        for item in results:
+            self.assertTrue(os.path.exists(item['filepath']))
+            self.assertFalse(item['is_valid'])
+            self.assertTrue(item['indexed'])
+            self.assertTrue(item['synced'])
+        self.assertEqual(self.db.get_story_count()['total'], 4)
+        self.assertEqual(notion.sync_story.call_count, 4)
+        self.assertEqual(len(storage.get_state_store().load_stories()), 4)
+
+        metrics = {item['stage']: item for item in pipeline.metrics()}
+        self.assertEqual(list(metrics), ['collect', 'validate', 'dedupe', 'save', 'index', 'sync'])
+        self.assertEqual(metrics['dedupe']['dropped'], 2)
+        self.assertEqual(metrics['sync']['received'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
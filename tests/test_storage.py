@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试故事存储模块
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.storage as storage
+from src.state_store import StateStore
+from utils.scan_cache import DirectoryScanCache
+
+
+def make_record(i):
+    """生成故事记录"""
+    return {'title': f'故事{i}', 'language_code': 'CN', 'filepath': f'/path/{i}.md'}
+
+
+class TestStateStore(unittest.TestCase):
+    """测试状态存储"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.temp_dir, 'state.json')
+        self.journal_file = os.path.join(self.temp_dir, 'state.journal')
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+
+    def open_store(self, compact_threshold=1000):
+        return StateStore(self.state_file, self.journal_file, compact_threshold)
+
+    def test_append_and_reload(self):
+        """测试追加记录后重新打开"""
+        store = self.open_store()
+        store.append(make_record(1))
+        store.append_many([make_record(2), make_record(3)])
+
+        self.assertFalse(os.path.exists(self.state_file))
+        self.assertEqual([s['title'] for s in self.open_store().load_stories()], ['故事1', '故事2', '故事3'])
+
+    def test_existing_state_file(self):
+        """测试兼容原有的状态文件"""
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump({'stories': [make_record(0)], 'last_updated': '2024-01-01'}, f)
+
+        store = self.open_store()
+        store.append(make_record(1))
+        self.assertEqual(len(store.load_stories()), 2)
+
+    def test_torn_journal_line(self):
+        """测试写入中断的日志行被忽略"""
+        store = self.open_store()
+        store.append(make_record(1))
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write('{"seq": 2, "rec')
+
+        store = self.open_store()
+        self.assertEqual(len(store.load_stories()), 1)
+
+        # 之后追加的记录不会接在不完整的行后面
+        store.append(make_record(2))
+        self.assertEqual([s['title'] for s in self.open_store().load_stories()], ['故事1', '故事2'])
+
+    def test_compaction(self):
+        """测试日志合并到状态文件"""
+        store = self.open_store(compact_threshold=3)
+        store.append_many([make_record(i) for i in range(3)])
+        store.wait_for_compaction()
+        store.append(make_record(3))
+
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)['stories']), 3)
+        self.assertEqual(len(self.open_store().load_stories()), 4)
+
+    def test_crash_between_snapshot_and_truncate(self):
+        """测试快照替换后、日志截断前中断时不会重复记录"""
+        store = self.open_store()
+        store.append_many([make_record(i) for i in range(3)])
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            journal = f.read()
+
+        store.compact()
+        with open(self.journal_file, 'w', encoding='utf-8') as f:
+            f.write(journal)
+
+        store = self.open_store()
+        self.assertEqual(len(store.load_stories()), 3)
+        store.append(make_record(3))
+        self.assertEqual(len(store.load_stories()), 4)
+
+    def test_corrupt_state_file_is_kept(self):
+        """测试状态文件损坏时不会被合并覆盖"""
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            f.write('{"stories": [')
+
+        store = self.open_store()
+        store.append(make_record(1))
+        self.assertFalse(store.compact())
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), '{"stories": [')
+
+
+class TestDirectoryScanCache(unittest.TestCase):
+    """测试目录扫描缓存"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, 'stories')
+        self.cache_file = os.path.join(self.temp_dir, 'scan_cache.json')
+        for i in range(3):
+            story_dir = os.path.join(self.root, 'traditional', f'CN_地区{i}', 'fairy_tale')
+            os.makedirs(story_dir)
+            for j in range(2):
+                with open(os.path.join(story_dir, f'故事{j}.md'), 'w', encoding='utf-8') as f:
+                    f.write('# 故事')
+        # 把修改时间设为过去，避免被当作刚修改过的目录
+        self.age_tree()
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+
+    def age_tree(self):
+        for root, dirs, files in os.walk(self.root):
+            os.utime(root, (1000000000, 1000000000))
+
+    def count_files(self, directories):
+        return sum(len(files) for _, files in directories)
+
+    def test_unchanged_tree_uses_cache(self):
+        """测试目录未变化时不重新读取"""
+        cache = DirectoryScanCache(self.cache_file)
+        self.assertEqual(self.count_files(cache.scan(self.root)), 6)
+        self.assertTrue(cache.save())
+
+        cache = DirectoryScanCache(self.cache_file)
+        with patch('utils.scan_cache.os.scandir') as scandir:
+            directories = cache.scan(self.root)
+        scandir.assert_not_called()
+        self.assertEqual(self.count_files(directories), 6)
+        self.assertEqual(cache.stats['rescanned'], 0)
+
+    def test_changed_directory_is_rescanned(self):
+        """测试只重新读取修改过的目录"""
+        cache = DirectoryScanCache(self.cache_file)
+        cache.scan(self.root)
+
+        story_dir = os.path.join(self.root, 'traditional', 'CN_地区1', 'fairy_tale')
+        with open(os.path.join(story_dir, '新故事.md'), 'w', encoding='utf-8') as f:
+            f.write('# 新故事')
+        shutil.rmtree(os.path.join(self.root, 'traditional', 'CN_地区2'))
+
+        directories = cache.scan(self.root)
+        self.assertEqual(self.count_files(directories), 5)
+        self.assertEqual(cache.stats['rescanned'], 2)  # 新增文件的目录和删除子目录的目录
+        self.assertFalse(any('CN_地区2' in path for path in cache.entries))
+
+
+class TestStorage(unittest.TestCase):
+    """测试故事保存"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.stories_dir = os.path.join(self.temp_dir, 'stories')
+        store = StateStore(os.path.join(self.temp_dir, 'state.json'), os.path.join(self.temp_dir, 'state.journal'))
+        self.patches = [
+            patch.object(storage, 'STORIES_DIR', self.stories_dir),
+            patch.object(storage, '_state_store', store),
+            patch.object(storage, '_scan_cache', DirectoryScanCache())
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_save_story(self):
+        """测试保存故事并记录状态"""
+        story_data = {
+            'title': '测试故事',
+            'language_code': 'CN',
+            'region': '北京',
+            'category': 'traditional',
+            'type': 'fairy_tale',
+            'story_number': '001'
+        }
+
+        success, filepath = storage.save_story(story_data, '# 测试故事')
+        self.assertTrue(success)
+        self.assertTrue(os.path.exists(filepath))
+
+        stories = storage.get_existing_stories()
+        self.assertEqual(len(stories), 1)
+        self.assertEqual(stories[0]['filepath'], filepath)
+
+        # 同一文件不会重复保存
+        self.assertFalse(storage.save_story(story_data, '# 测试故事')[0])
+
+    def test_save_stories(self):
+        """测试批量保存故事"""
+        batch = []
+        for i in range(7):
+            story_data = {
+                'title': f'故事{i}',
+                'language_code': 'CN',
+                'region': '北京' if i % 2 else '上海',
+                'category': 'traditional',
+                'type': 'fairy_tale',
+                'story_number': f'{i:03d}'
+            }
+            batch.append((story_data, f'# 故事{i}'))
+        batch.append(batch[0])
+
+        with patch.object(storage.os, 'makedirs', wraps=os.makedirs) as makedirs:
+            results = storage.save_stories(batch, batch_size=4)
+
+        self.assertEqual([success for success, _ in results], [True] * 7 + [False])
+        self.assertEqual(results[7][1], results[0][1])
+        story_dir_calls = [c for c in makedirs.call_args_list if c.args[0].endswith('fairy_tale')]
+        self.assertEqual(len(story_dir_calls), 4)  # 两组，每组两个目录
+        for success, filepath in results[:7]:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                self.assertTrue(f.read().startswith('# 故事'))
+            self.assertFalse(os.path.exists(filepath + '.tmp'))
+
+        self.assertEqual(len(storage.get_existing_stories()), 7)
+
+    def test_save_stories_failure_leaves_no_temp_files(self):
+        """测试写入或同步失败时不留下临时文件"""
+        batch = []
+        for i in range(4):
+            story_data = {
+                'title': f'故事{i}',
+                'language_code': 'CN',
+                'region': '北京',
+                'category': 'traditional',
+                'type': 'fairy_tale',
+                'story_number': f'{i:03d}'
+            }
+            batch.append((story_data, f'# 故事{i}'))
+        batch[2] = (batch[2][0], '# 故事\ud800')  # 无法编码，写入失败
+
+        real_fsync = os.fsync
+        calls = []
+
+        def failing_fsync(fd):
+            calls.append(fd)
+            if len(calls) == 2:
+                raise OSError("fsync失败")
+            return real_fsync(fd)
+
+        with patch.object(storage.os, 'fsync', side_effect=failing_fsync):
+            results = storage.save_stories(batch, batch_size=4)
+
+        self.assertEqual([success for success, _ in results], [True, False, False, True])
+        story_dir = storage.get_story_dir('CN', '北京', 'traditional', 'fairy_tale')
+        leftovers = [name for name in os.listdir(story_dir) if name.endswith('.tmp')]
+        self.assertEqual(leftovers, [])
+        self.assertEqual(sorted(os.listdir(story_dir)), sorted(os.path.basename(p) for _, p in (results[0], results[3])))
+        self.assertEqual(len(storage.get_existing_stories()), 2)
+
+    def test_existing_stories_from_directory_scan(self):
+        """测试状态为空时从目录扫描故事"""
+        story_dir = storage.create_story_path('CN', '北京', 'traditional', 'fairy_tale')
+        with open(os.path.join(story_dir, '测试故事.md'), 'w', encoding='utf-8') as f:
+            f.write('# 测试故事')
+
+        stories = storage.get_existing_stories()
+        self.assertEqual(len(stories), 1)
+        self.assertEqual(stories[0]['title'], '测试故事')
+        self.assertEqual(stories[0]['language_code'], 'CN')
+        self.assertEqual(stories[0]['region'], '北京')
+        self.assertEqual(stories[0]['category'], 'traditional')
+        self.assertEqual(stories[0]['type'], 'fairy_tale')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试故事数据库模块
+"""
+
+import os
+import json
+import sys
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+# 添加项目路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database.story_db import StoryDatabase, LazyMetadata, _INSERT_SQL
+from src.database.benchmark import seed_database, run_benchmark
+
+
+def make_story(i, **overrides):
+    """生成故事信息"""
+    story = {
+        'id': f'CN-{i:05d}',
+        'title': f'故事{i}',
+        'language': 'CN',
+        'region': '北京' if i % 2 else '上海',
+        'type': 'fairy_tale',
+        'summary': f'简介{i}',
+        'file_path': f'/path/{i}.md',
+        'metadata': {'index': i}
+    }
+    story.update(overrides)
+    return story
+
+
+class TestStoryDatabase(unittest.TestCase):
+    """测试故事数据库"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = StoryDatabase(os.path.join(self.temp_dir, 'stories.db'))
+
+    def tearDown(self):
+        """测试后清理"""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_add_and_get_story(self):
+        """测试添加和读取故事"""
+        self.assertTrue(self.db.add_story(make_story(1)))
+        self.assertFalse(self.db.add_story(make_story(1)))
+
+        story = self.db.get_story('CN-00001')
+        self.assertEqual(story['title'], '故事1')
+        self.assertEqual(story['metadata'], {'index': 1})
+        self.assertIsNone(self.db.get_story('CN-99999'))
+
+        self.assertEqual(self.db.get_story_count()['by_region'], {'北京': 1})
+
+    def test_add_stories(self):
+        """测试批量添加故事"""
+        self.db.add_story(make_story(0))
+        stories = [make_story(i) for i in range(3)] + [make_story(1), {'id': 'CN-bad'}]
+
+        outcomes = self.db.add_stories(stories)
+        self.assertEqual(outcomes, [
+            ('CN-00000', 'skipped'),
+            ('CN-00001', 'inserted'),
+            ('CN-00002', 'inserted'),
+            ('CN-00001', 'skipped'),
+            ('CN-bad', 'invalid')
+        ])
+        self.assertEqual(self.db.get_story_count()['total'], 3)
+
+    def test_upsert_stories(self):
+        """测试批量添加或更新故事"""
+        self.db.add_stories(make_story(i) for i in range(2))
+        created_at = self.db.get_story('CN-00001')['created_at']
+
+        outcomes = self.db.upsert_stories([make_story(1, title='新标题'), make_story(2)])
+        self.assertEqual(outcomes, [('CN-00001', 'updated'), ('CN-00002', 'inserted')])
+
+        story = self.db.get_story('CN-00001')
+        self.assertEqual(story['title'], '新标题')
+        self.assertEqual(story['created_at'], created_at)
+        self.assertEqual(self.db.get_story_count()['total'], 3)
+
+    def test_iter_stories(self):
+        """测试分批遍历故事"""
+        self.db.add_stories(make_story(i) for i in range(25))
+
+        stories = list(self.db.iter_stories(batch_size=10, lazy_metadata=True))
+        self.assertEqual([story['id'] for story in stories], [f'CN-{i:05d}' for i in range(25)])
+        self.assertIsInstance(stories[3]['metadata'], LazyMetadata)
+        self.assertEqual(stories[3]['metadata'], {'index': 3})
+        self.assertEqual(stories[3]['metadata']['index'], 3)
+        self.assertIsInstance(self.db.search_stories(limit=1, lazy_metadata=True)[0]['metadata'], LazyMetadata)
+
+        shanghai = list(self.db.iter_stories({'region': '上海'}, batch_size=5))
+        self.assertEqual(len(shanghai), 13)
+        self.assertEqual(list(self.db.iter_stories({'region': '广州'})), [])
+
+    def test_iter_round_trip(self):
+        """测试遍历得到的故事可以序列化并重新写入"""
+        self.db.add_stories(make_story(i, metadata={'index': i, 'category': 'modern'}) for i in range(5))
+
+        stories = list(self.db.iter_stories())
+        restored = json.loads(json.dumps(stories))
+        self.assertEqual([outcome for _, outcome in self.db.upsert_stories(restored)], ['updated'] * 5)
+
+        # 按需解析的元数据同样可以写回，提升的列取自元数据
+        lazy = list(self.db.iter_stories(lazy_metadata=True))
+        self.assertEqual([outcome for _, outcome in self.db.upsert_stories(lazy)], ['updated'] * 5)
+        self.assertEqual(len(self.db.search_stories(category='modern')), 5)
+        self.assertEqual(self.db.get_story('CN-00002')['metadata'], {'index': 2, 'category': 'modern'})
+
+    def test_search_stories_pages(self):
+        """测试按ID分页搜索"""
+        self.db.add_stories(make_story(i) for i in range(7))
+
+        pages = []
+        after_id = None
+        while True:
+            page = self.db.search_stories(region='北京', after_id=after_id, limit=2)
+            if not page:
+                break
+            pages.append([story['id'] for story in page])
+            after_id = page[-1]['id']
+        self.assertEqual(pages, [['CN-00001', 'CN-00003'], ['CN-00005']])
+        self.assertEqual(len(self.db.search_stories(language='CN')), 7)
+
+    def test_full_text_search(self):
+        """测试全文检索"""
+        self.db.add_stories([
+            make_story(1, title='嫦娥奔月', summary='月亮上的仙女', content='后羿射下九个太阳，嫦娥飞上了月宫。'),
+            make_story(2, title='后羿射日', summary='射日的英雄', content='天上有十个太阳，后羿射下了九个。'),
+            make_story(3, title='The Fox and the Grapes', summary='A fable', content='A hungry fox saw some grapes.')
+        ])
+
+        results = self.db.full_text_search('后羿射')
+        self.assertEqual([story['id'] for story in results], ['CN-00002', 'CN-00001'])
+        self.assertIn('[后羿射]', results[0]['snippet'])
+
+        self.assertEqual([s['id'] for s in self.db.full_text_search('hungry FOX')], ['CN-00003'])
+        self.assertEqual([s['id'] for s in self.db.full_text_search('太阳', {'region': '上海'})], ['CN-00002'])
+        self.assertEqual(self.db.full_text_search('"月宫'), [])
+        self.assertEqual(self.db.full_text_search('月宫 狐狸'), [])
+        with self.assertRaises(ValueError):
+            self.db.full_text_search('太阳', {'title': '后羿射日'})
+
+    def test_full_text_index_follows_updates(self):
+        """测试更新和删除后全文索引保持同步"""
+        self.db.add_story(make_story(1, content='一只小兔子'))
+        self.db.upsert_stories([make_story(1, content='一只小乌龟')])
+        self.assertEqual(self.db.full_text_search('小兔子'), [])
+        self.assertEqual(len(self.db.full_text_search('小乌龟')), 1)
+
+        with self.db._get_connection() as conn:
+            conn.execute("DELETE FROM stories WHERE id = 'CN-00001'")
+        self.assertEqual(self.db.full_text_search('小乌龟'), [])
+
+    def test_story_count_follows_changes(self):
+        """测试统计表随增删改更新"""
+        self.assertEqual(self.db.get_story_count(),
+                         {'total': 0, 'by_language': {}, 'by_type': {}, 'by_region': {}})
+
+        self.db.add_stories(make_story(i) for i in range(5))
+        self.db.upsert_stories([make_story(1, region='广州', type='legend')])
+        with self.db._get_connection() as conn:
+            conn.execute("DELETE FROM stories WHERE id = 'CN-00000'")
+
+        expected = {
+            'total': 4,
+            'by_language': {'CN': 4},
+            'by_type': {'fairy_tale': 3, 'legend': 1},
+            'by_region': {'上海': 2, '北京': 1, '广州': 1}
+        }
+        self.assertEqual(self.db.get_story_count(), expected)
+
+        with self.db._get_connection() as conn:
+            conn.execute('DELETE FROM story_stats')
+        self.db.rebuild_stats()
+        self.assertEqual(self.db.get_story_count(), expected)
+
+    def test_replace_keeps_stats_and_index(self):
+        """测试 INSERT OR REPLACE 替换已有故事时统计表和全文索引同步更新"""
+        self.db.add_stories([make_story(1, content='一只小兔子'), make_story(2)])
+        with self.db._get_connection() as conn:
+            conn.execute(_INSERT_SQL.replace('INSERT', 'INSERT OR REPLACE', 1), self.db._story_params(
+                make_story(1, region='广州', type='legend', content='一只小乌龟')
+            ))
+
+        self.assertEqual(self.db.get_story_count(), {
+            'total': 2,
+            'by_language': {'CN': 2},
+            'by_type': {'fairy_tale': 1, 'legend': 1},
+            'by_region': {'上海': 1, '广州': 1}
+        })
+        self.assertEqual(self.db.full_text_search('小兔子'), [])
+        self.assertEqual([s['id'] for s in self.db.full_text_search('小乌龟')], ['CN-00001'])
+
+    def test_query_plan_benchmark(self):
+        """测试查询基准使用组合索引"""
+        seed_database(self.db, 500)
+        results = run_benchmark(self.db, repeat=1)
+        self.assertEqual(len(results), 16)
+
+        page = results[-1]
+        self.assertEqual(page['shape'], 'page')
+        self.assertIn('idx_language_region_type', page['plan'][0])
+        self.assertFalse(any('TEMP B-TREE' in step for step in page['plan']))
+
+    def test_promoted_metadata_columns(self):
+        """测试元数据字段提升为独立列后的过滤"""
+        self.db.add_stories([
+            make_story(1, metadata={'category': 'traditional', 'collected_at': '2024-01-05T10:00:00'}),
+            make_story(2, metadata={'category': 'modern', 'collected_at': '2024-02-05T10:00:00'}),
+            make_story(3, metadata={'category': 'traditional', 'original_title': 'Cinderella',
+                                    'collected_at': '2024-03-05T10:00:00'})
+        ])
+
+        self.assertEqual([s['id'] for s in self.db.search_stories(category='traditional')], ['CN-00001', 'CN-00003'])
+        stories = self.db.iter_stories({'collected_after': '2024-02-01', 'collected_before': '2024-03-01'})
+        self.assertEqual([s['id'] for s in stories], ['CN-00002'])
+        self.assertEqual(self.db.get_story('CN-00003')['original_title'], 'Cinderella')
+
+        conn = self.db._get_connection()
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM stories WHERE category = 'modern' ORDER BY id")
+        self.assertIn('idx_category', ' '.join(row[3] for row in plan))
+
+    def test_migrate_existing_database(self):
+        """测试旧数据库迁移时回填提升的列"""
+        db_path = os.path.join(self.temp_dir, 'legacy.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            CREATE TABLE stories (
+                id TEXT PRIMARY KEY, title TEXT NOT NULL, language TEXT NOT NULL, region TEXT NOT NULL,
+                type TEXT NOT NULL, summary TEXT NOT NULL, file_path TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, metadata TEXT
+            )
+        ''')
+        conn.execute("INSERT INTO stories (id, title, language, region, type, summary, file_path, metadata) "
+                     "VALUES ('CN-1', '旧故事', 'CN', '北京', 'myth', '简介', '/a.md', '{\"category\": \"festival\"}')")
+        conn.commit()
+        conn.close()
+
+        with StoryDatabase(db_path) as db:
+            self.assertEqual(db.get_schema_version(), 2)
+            self.assertEqual([s['id'] for s in db.search_stories(category='festival')], ['CN-1'])
+            self.assertEqual(db.get_story_count()['total'], 1)
+            self.assertEqual(len(db.full_text_search('旧故事')), 1)
+
+    def test_connection_settings(self):
+        """测试连接复用和WAL设置"""
+        conn = self.db._get_connection()
+        self.assertIs(self.db._get_connection(), conn)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute('PRAGMA recursive_triggers').fetchone()[0], 1)
+
+    def test_thread_local_connections(self):
+        """测试每个线程使用独立连接"""
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.db._get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], self.db._get_connection())
+
+    def test_short_lived_threads_release_connections(self):
+        """测试已结束线程的连接被关闭，close() 关闭所有线程的连接"""
+        self.db.add_story(make_story(1))
+        connections = []
+
+        def read():
+            self.assertIsNotNone(self.db.get_story('CN-00001'))
+            connections.append(self.db._get_connection())
+
+        for _ in range(100):
+            thread = threading.Thread(target=read)
+            thread.start()
+            thread.join()
+
+        # 每个新连接创建时关闭已结束线程的连接，只剩主线程和最后一个线程的连接
+        self.assertEqual(len(self.db._connections), 2)
+        for conn in connections[:-1]:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute('SELECT 1')
+
+        self.db.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connections[-1].execute('SELECT 1')
+
+    def test_reader_not_blocked_by_writer(self):
+        """测试写事务进行中读操作不被阻塞"""
+        self.db.add_story(make_story(1))
+        writer = self.db._get_connection()
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("UPDATE stories SET title = '修改' WHERE id = 'CN-00001'")
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.db.get_story('CN-00001')))
+        thread.start()
+        thread.join(timeout=2)
+        writer.commit()
+
+        self.assertEqual(results[0]['title'], '故事1')
+        self.assertEqual(self.db.get_story('CN-00001')['title'], '修改')
+
+    def test_close_and_reopen(self):
+        """测试关闭后重新使用"""
+        with StoryDatabase(self.db.db_path) as db:
+            db.add_story(make_story(2))
+        self.db.close()
+        self.assertEqual(self.db.get_story_count()['total'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
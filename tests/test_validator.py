@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试故事解析、格式化和验证
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.story_parser import parse_story
+import utils.formatter as formatter
+from config.settings import TEMPLATE_FILE
+from utils.formatter import extract_sections, validate_story_format, fix_common_issues, format_story
+import src.validator as validator
+from src.validator import (validate_story, validate_stories, validate_content_quality,
+                           extract_metadata_from_content)
+from utils.validation_cache import ValidationCache
+
+SAMPLE_STORY = """# CN001 嫦娥奔月 (Chang'e Flies to the Moon)
+
+## 基本信息
+- 故事编号: CN001
+- 分类: 传统民间故事
+- 子分类: 华北
+- 类型: 神话
+- Source Url: http://example.com/a:b
+
+## 故事梗概
+""" + "后羿射日之后，从西王母处得到不死药。" * 10 + """
+
+### 结局
+嫦娥飞上月宫。
+
+## 文化背景
+中秋节
+
+## 收集记录
+- 收集时间: 2024-01
+"""
+
+
+class TestStoryParser(unittest.TestCase):
+    """测试故事解析"""
+
+    def test_parse_sections(self):
+        """测试解析标题、基本信息和各部分"""
+        document = parse_story(SAMPLE_STORY)
+        self.assertEqual(document.title, "CN001 嫦娥奔月 (Chang'e Flies to the Moon)")
+        self.assertEqual([s.name for s in document.sections], ['基本信息', '故事梗概', '文化背景', '收集记录'])
+        self.assertEqual(document.basic_info['source_url'], 'http://example.com/a:b')
+
+        section = document.section('文化背景')
+        self.assertEqual(SAMPLE_STORY[section.heading_start:section.start], '## 文化背景\n')
+        self.assertEqual(section.content, '中秋节')
+        # 三级标题属于所在的二级部分
+        self.assertTrue(document.section_content('故事梗概').endswith('嫦娥飞上月宫。'))
+        self.assertIsNone(document.section('故事来源'))
+
+        # 标题后带说明时按标题开头的文字匹配
+        document = parse_story('# 标题\n\n## 故事梗概 (Summary)\n很久以前\n\n## 故事梗概补充\n另一部分\n')
+        self.assertEqual(document.section_content('故事梗概'), '很久以前')
+        self.assertIsNone(document.section('故事'))
+
+    def test_parse_is_cached(self):
+        """测试相同内容只解析一次"""
+        self.assertIs(parse_story(SAMPLE_STORY), parse_story(SAMPLE_STORY))
+        with self.assertRaises(TypeError):
+            parse_story(SAMPLE_STORY).basic_info['分类'] = '现代'
+
+
+class TestFormatter(unittest.TestCase):
+    """测试格式化工具"""
+
+    def test_extract_sections(self):
+        """测试提取故事各部分"""
+        sections = extract_sections(SAMPLE_STORY)
+        self.assertEqual(sections['title'], "CN001 嫦娥奔月 (Chang'e Flies to the Moon)")
+        self.assertEqual(sections['分类'], '传统民间故事')
+        self.assertEqual(sections['文化背景'], '中秋节')
+        self.assertTrue(sections['基本信息'].startswith('- 故事编号: CN001'))
+
+    def test_validate_and_fix(self):
+        """测试格式验证和修复"""
+        self.assertEqual(validate_story_format(SAMPLE_STORY), (True, []))
+
+        content = '一个没有格式的故事'
+        is_valid, issues = validate_story_format(content)
+        self.assertFalse(is_valid)
+        self.assertEqual(len(issues), 4)
+
+        fixed_content = fix_common_issues(content)
+        self.assertTrue(fixed_content.startswith('# 一个没有格式的故事'))
+        self.assertIn('\n## 基本信息\n', fixed_content)
+        self.assertIn('\n## 故事梗概\n', fixed_content)
+        # 修复后的内容通过格式验证
+        self.assertEqual(validate_story_format(fixed_content), (True, []))
+
+    def test_heading_matching(self):
+        """测试标题带说明文字或为更低级标题时同样满足格式要求"""
+        content = SAMPLE_STORY.replace('## 基本信息', '## 基本信息 (Basic Info)').replace('## 收集记录', '### 收集记录')
+        self.assertEqual(validate_story_format(content), (True, []))
+        self.assertEqual(fix_common_issues(content), content)
+
+        content = SAMPLE_STORY.replace('## 故事梗概', '## 故事梗概 (Summary)')
+        self.assertEqual(validate_content_quality(content), validate_content_quality(SAMPLE_STORY))
+
+
+class TestFormatStory(unittest.TestCase):
+    """测试模板渲染"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.template_file = os.path.join(self.temp_dir, 'story_template.md')
+        self.patch = patch.object(formatter, 'TEMPLATE_FILE', self.template_file)
+        self.patch.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        self.patch.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def write_template(self, content, mtime):
+        with open(self.template_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.utime(self.template_file, (mtime, mtime))
+
+    def test_render_config_template(self):
+        """测试使用配置的模板渲染故事"""
+        shutil.copy(TEMPLATE_FILE, self.template_file)
+        story_data = {
+            'title': '嫦娥奔月',
+            'original_title': "Chang'e",
+            'language_code': 'CN',
+            'story_number': '007',
+            'category': 'traditional',
+            'region': '华北',
+            'type': 'myth',
+            'story_content': '## 故事梗概\n后羿射日。\n\n## 参考来源\n1. 淮南子 \\1\n',
+            'collector': '测试'
+        }
+
+        content = format_story(story_data)
+        self.assertTrue(content.startswith("# CN007 嫦娥奔月 (Chang'e)\n\n## 基本信息\n- 故事编号: CN007\n"))
+        self.assertIn('- 子分类: 华北\n- 地区: 华北\n- 类型: myth\n', content)
+        self.assertIn('## 故事梗概\n\n后羿射日。\n\n## 文化背景\n1. [文化元素一]', content)
+        self.assertIn('## 参考来源\n\n1. 淮南子 \\1\n\n## 收集记录\n', content)
+        self.assertIn('## 故事来源\n[简要说明', content)
+        self.assertIn('- 收集人: 测试\n- 完整性: 完整', content)
+
+        document = parse_story(content)
+        self.assertEqual(document.basic_info['分类'], 'traditional')
+
+    def test_template_reloaded_when_modified(self):
+        """测试模板文件修改后重新编译，未修改时不重新读取"""
+        self.write_template('# [标题]\n\n## 基本信息\n- 分类: [分类]\n', 1000000000)
+        self.assertEqual(format_story({'title': '故事', 'language_code': 'CN', 'category': 'modern'}),
+                         '# CN001 故事\n\n## 基本信息\n- 分类: modern\n')
+
+        with patch('builtins.open') as mocked_open:
+            format_story({'category': 'modern'})
+        mocked_open.assert_not_called()
+
+        self.write_template('# [标题]\n\n## 基本信息\n- 类型: [类型]\n', 1000000100)
+        self.assertEqual(format_story({'type': 'myth'}), '# [标题]\n\n## 基本信息\n- 类型: myth\n')
+
+
+class TestValidator(unittest.TestCase):
+    """测试内容验证"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.cache = ValidationCache()
+        self.temp_dir = tempfile.mkdtemp()
+        self.patch = patch.object(validator, '_validation_caches', {})
+        self.patch.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        for cache in validator._validation_caches.values():
+            cache.close()
+        self.patch.stop()
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_validate_content_quality(self):
+        """测试内容质量检查"""
+        self.assertEqual(validate_content_quality(SAMPLE_STORY), ["文化背景部分内容不足"])
+        issues = validate_content_quality('# 标题\n\n## 故事梗概\n太短')
+        self.assertIn("故事梗概过短，应该至少包含100个字符的详细描述", issues)
+
+    def test_extract_metadata_from_content(self):
+        """测试从内容提取元数据"""
+        metadata = extract_metadata_from_content(SAMPLE_STORY)
+        self.assertEqual(metadata, {
+            'title': 'CN001 嫦娥奔月',
+            'original_title': "Chang'e Flies to the Moon",
+            'language_code': 'CN',
+            'story_number': '001',
+            'category': 'traditional',
+            'region': '华北',
+            'type': 'myth'
+        })
+
+    def test_validate_stories(self):
+        """测试并行批量验证与逐个验证结果一致"""
+        batch = []
+        for i in range(40):
+            story_data = {'id': f'CN{i:03d}', 'title': f'故事{i}', 'language_code': 'CN',
+                          'region': '华北', 'category': 'traditional', 'type': 'myth'}
+            content = SAMPLE_STORY if i % 3 else f'没有格式的故事{i}'
+            batch.append((story_data, content))
+        expected = {story_data['id']: validate_story(story_data, content) for story_data, content in batch}
+
+        for workers in (1, 2):
+            results = list(validate_stories(iter(batch), workers=workers, chunksize=3))
+            self.assertEqual(len(results), len(batch))
+            self.assertEqual({story_id: (is_valid, issues, fixed_content)
+                              for story_id, is_valid, issues, fixed_content in results}, expected)
+
+        self.assertEqual(list(validate_stories([], workers=2)), [])
+
+        # 批量重新验证时使用指定的缓存文件，各工作进程共享
+        cache_file = os.path.join(self.temp_dir, 'validation_cache.db')
+        for workers in (2, 1):
+            results = list(validate_stories(iter(batch), workers=workers, chunksize=3, cache_file=cache_file))
+            self.assertEqual({story_id: (is_valid, issues, fixed_content)
+                              for story_id, is_valid, issues, fixed_content in results}, expected)
+        self.assertEqual(validator.get_validation_cache(cache_file).stats, {'hits': 120, 'misses': 0})
+
+    def test_validation_cache(self):
+        """测试未变化的内容使用缓存结果，规则变化只使缓存中该规则的结果失效"""
+        story_data = {'title': '故事', 'language_code': 'CN', 'region': '华北',
+                      'category': 'traditional', 'type': 'myth'}
+        content = '没有格式的故事'
+        # 默认不使用缓存
+        expected = validate_story(story_data, content)
+        self.assertEqual(validator._validation_caches, {})
+
+        self.assertEqual(validate_story(story_data, content, self.cache), expected)
+        self.assertEqual(self.cache.stats, {'hits': 0, 'misses': 3})
+        with patch.object(validator, 'parse_story') as parse, patch.object(formatter, 'parse_story') as format_parse:
+            self.assertEqual(validate_story(story_data, content, self.cache), expected)
+        parse.assert_not_called()
+        format_parse.assert_not_called()
+        self.assertEqual(self.cache.stats, {'hits': 3, 'misses': 3})
+
+        # 元数据不参与缓存
+        self.assertFalse(validate_story(dict(story_data, type='unknown'), SAMPLE_STORY, self.cache)[0])
+
+        def changed_rule(content):
+            return ['新规则的问题']
+        with patch.object(validator, 'validate_content_quality', changed_rule):
+            is_valid, issues, _ = validate_story(story_data, content, self.cache)
+        self.assertIn('新规则的问题', issues)
+        self.assertEqual(self.cache.stats, {'hits': 5, 'misses': 7})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,11 +3,28 @@
 用于生成故事的唯一标识，用于去重
 """
 
+import os
+import sys
 import hashlib
-import re
 import json
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
 
+# 导入工具
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.shingling import clean_text, detect_script, split_units, join_units
+from utils.lsh_index import MinHashLSHIndex
+
+# 内容签名保留的首尾单位数(CJK文本为字符，拉丁文字为单词)
+SIGNATURE_UNITS = 100
+
+# 相似度检查器缓存的已清理文本数量
+CLEAN_TEXT_CACHE_SIZE = 4096
+
+# 批量去重时少于该数量的比较在当前进程内完成，避免进程池的启动开销
+PARALLEL_MIN_PAIRS = 200
+
 def generate_fingerprint(story_data):
     """
     生成故事的指纹
@@ -27,17 +44,18 @@ def generate_fingerprint(story_data):
     content = story_data.get('story_content', '')
     
     # 生成指纹基础字符串
-    fingerprint_base = f"{title}|{region}|{story_type}|{_extract_content_signature(content)}"
+    fingerprint_base = f"{title}|{region}|{story_type}|{_extract_content_signature(content, story_data.get('language_code'))}"
     
     # 生成MD5哈希
     return hashlib.md5(fingerprint_base.encode('utf-8')).hexdigest()
 
-def _extract_content_signature(content):
+def _extract_content_signature(content, language_code=None):
     """
     从故事内容中提取特征签名
     
     Args:
         content: 故事内容文本
+        language_code: 语言代码(可选)
         
     Returns:
         signature: 内容特征签名
@@ -46,43 +64,21 @@ def _extract_content_signature(content):
         return ""
     
     # 清理文本
-    clean_content = _clean_text(content)
+    clean_content = clean_text(content)
     
-    # 提取前100个单词和后100个单词
-    words = clean_content.split()
-    if len(words) <= 200:
+    # 按文字体系切分：CJK文本没有空格，按字符计数
+    script = detect_script(clean_content, language_code)
+    units = split_units(clean_content, script)
+    
+    # 提取前100个单位和后100个单位
+    if len(units) <= 2 * SIGNATURE_UNITS:
         return clean_content
     
-    start = ' '.join(words[:100])
-    end = ' '.join(words[-100:])
+    start = join_units(units[:SIGNATURE_UNITS], script)
+    end = join_units(units[-SIGNATURE_UNITS:], script)
     
     return f"{start}...{end}"
 
-def _clean_text(text):
-    """
-    清理文本，移除特殊字符、多余空格等
-    
-    Args:
-        text: 原始文本
-        
-    Returns:
-        cleaned_text: 清理后的文本
-    """
-    if not text:
-        return ""
-    
-    # 移除Markdown标记
-    text = re.sub(r'#.*?\n', ' ', text)
-    text = re.sub(r'\*\*|\*|__|\||_|`', '', text)
-    
-    # 移除多余空白字符
-    text = re.sub(r'\s+', ' ', text)
-    
-    # 移除标点符号
-    text = re.sub(r'[^\w\s]', '', text)
-    
-    return text.strip().lower()
-
 def calculate_similarity(text1, text2):
     """
     计算两段文本的相似度
@@ -95,12 +91,179 @@ def calculate_similarity(text1, text2):
         similarity: 相似度(0-1)
     """
     # 清理文本
-    clean_text1 = _clean_text(text1)
-    clean_text2 = _clean_text(text2)
+    clean_text1 = clean_text(text1)
+    clean_text2 = clean_text(text2)
     
     # 使用SequenceMatcher计算相似度
     return SequenceMatcher(None, clean_text1, clean_text2).ratio()
 
+class PreparedText:
+    """清理后的文本及其字符直方图(直方图按需计算)"""
+
+    __slots__ = ('text', 'length', '_histogram')
+
+    def __init__(self, text):
+        self.text = text
+        self.length = len(text)
+        self._histogram = None
+
+    @property
+    def histogram(self):
+        if self._histogram is None:
+            self._histogram = Counter(self.text)
+        return self._histogram
+
+class SimilarityChecker:
+    """
+    分层相似度检查器
+
+    按代价从低到高依次计算相似度的上界，一旦上界不超过阈值就提前结束：
+    1. length: 长度比上界 2*min(a,b)/(a+b)，等同于 real_quick_ratio
+    2. histogram: 字符直方图交集上界，等同于 quick_ratio
+    3. ratio: 完整的 SequenceMatcher.ratio()
+
+    已有故事的清理文本按键(指纹)缓存，避免每次比较都重新执行正则清理。
+    """
+
+    LAYERS = ('length', 'histogram', 'ratio')
+
+    def __init__(self, cache_size=CLEAN_TEXT_CACHE_SIZE):
+        """
+        初始化检查器
+
+        Args:
+            cache_size: 缓存的已清理文本数量
+        """
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.stats = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        """重置统计信息"""
+        self.stats = {'pairs': 0, 'matched': 0}
+        for layer in self.LAYERS:
+            self.stats[f'pruned_{layer}'] = 0
+
+    def cached(self, key):
+        """
+        获取已缓存的清理文本
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            prepared: PreparedText，未缓存时返回None
+        """
+        prepared = self._cache.get(key)
+        if prepared is not None:
+            self._cache.move_to_end(key)
+        return prepared
+
+    def prepare(self, text, key=None):
+        """
+        清理文本，提供key时缓存结果
+
+        Args:
+            text: 原始文本
+            key: 缓存键(可选)，一般为已有故事的指纹
+
+        Returns:
+            prepared: PreparedText
+        """
+        if key is not None:
+            prepared = self.cached(key)
+            if prepared is not None:
+                return prepared
+
+        prepared = PreparedText(clean_text(text))
+
+        if key is not None:
+            self._cache[key] = prepared
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return prepared
+
+    def exceeds(self, text1, text2, threshold):
+        """
+        判断两段文本的相似度是否超过阈值
+
+        Args:
+            text1: 第一段文本(str 或 PreparedText)
+            text2: 第二段文本(str 或 PreparedText)
+            threshold: 相似度阈值
+
+        Returns:
+            exceeded: 相似度是否大于阈值
+        """
+        return self.similarity(text1, text2, threshold) > threshold
+
+    def similarity(self, text1, text2, threshold=0.0):
+        """
+        计算相似度，上界不超过阈值时提前返回上界
+
+        返回值不超过阈值时只保证是真实相似度的上界；超过阈值时为精确值。
+
+        Args:
+            text1: 第一段文本(str 或 PreparedText)
+            text2: 第二段文本(str 或 PreparedText)
+            threshold: 相似度阈值
+
+        Returns:
+            similarity: 相似度(0-1)
+        """
+        a = text1 if isinstance(text1, PreparedText) else self.prepare(text1)
+        b = text2 if isinstance(text2, PreparedText) else self.prepare(text2)
+        self.stats['pairs'] += 1
+
+        total = a.length + b.length
+        if not total:
+            ratio = 1.0
+        else:
+            bound = self._upper_bound(a, b, total, threshold)
+            if bound is not None:
+                return bound
+
+            # 第3层：完整计算
+            ratio = SequenceMatcher(None, a.text, b.text).ratio()
+
+        if ratio <= threshold:
+            self.stats['pruned_ratio'] += 1
+        else:
+            self.stats['matched'] += 1
+        return ratio
+
+    def _upper_bound(self, a, b, total, threshold):
+        """
+        依次计算廉价的相似度上界
+
+        Returns:
+            bound: 上界不超过阈值时返回该上界，否则返回None
+        """
+        # 第1层：长度比上界
+        bound = 2.0 * min(a.length, b.length) / total
+        if bound <= threshold:
+            self.stats['pruned_length'] += 1
+            return bound
+
+        # 第2层：字符直方图上界
+        small, large = (a.histogram, b.histogram) if len(a.histogram) <= len(b.histogram) else (b.histogram, a.histogram)
+        matches = 0
+        for char, count in small.items():
+            other = large.get(char)
+            if other:
+                matches += count if count < other else other
+        bound = 2.0 * matches / total
+        if bound <= threshold:
+            self.stats['pruned_histogram'] += 1
+            return bound
+
+        return None
+
+# 默认检查器，在多次 is_duplicate 调用之间共享清理文本缓存
+default_checker = SimilarityChecker()
+
 def load_fingerprints(filepath):
     """
     从文件加载指纹
@@ -135,7 +298,49 @@ def save_fingerprints(fingerprints, filepath):
     except Exception:
         return False
 
-def is_duplicate(story_data, existing_fingerprints, similarity_threshold=0.85):
+def _compare_rule(story_data, data, similarity_threshold):
+    """
+    确定两个故事之间的比较规则
+    
+    Args:
+        story_data: 待检查的故事数据
+        data: 已存在的故事数据
+        similarity_threshold: 相似度阈值
+        
+    Returns:
+        (title_matched, check_threshold): 标题是否判定为重复、内容比较使用的阈值；
+        不需要比较时返回None
+    """
+    story_language = story_data.get('language_code', '')
+    story_region = story_data.get('region', '')
+    
+    # 如果是不同语言或地区的故事，提高相似度阈值（更严格的判断）
+    check_threshold = similarity_threshold
+    
+    # 如果保存的数据中有语言代码和地区信息
+    data_language = data.get('language_code', '')
+    data_region = data.get('region', '')
+    
+    # 如果语言不同，则需要更高的相似度才判定为重复
+    if data_language and story_language and data_language != story_language:
+        return None  # 不同语言的故事直接跳过比较
+    
+    # 如果地区不同，也提高相似度要求
+    if data_region and story_region and data_region != story_region:
+        check_threshold = 0.90
+    
+    # 标题完全相同的情况
+    title_matched = False
+    if 'title' in story_data and story_data['title'] == data.get('title', ''):
+        # 如果语言和地区都相同，则认为是重复
+        if (not data_language or not story_language or data_language == story_language) and \
+           (not data_region or not story_region or data_region == story_region):
+            title_matched = True
+    
+    return title_matched, check_threshold
+
+def is_duplicate(story_data, existing_fingerprints, similarity_threshold=0.85, lsh_index=None,
+                 checker=None):
     """
     检查故事是否是重复的
     
@@ -143,6 +348,8 @@ def is_duplicate(story_data, existing_fingerprints, similarity_threshold=0.85):
         story_data: 故事数据
         existing_fingerprints: 已存在的指纹字典
         similarity_threshold: 相似度阈值
+        lsh_index: MinHash/LSH候选索引(可选)，提供时只与候选故事比较相似度
+        checker: 相似度检查器(可选)，默认使用 default_checker
         
     Returns:
         is_duplicate: 是否重复
@@ -157,35 +364,214 @@ def is_duplicate(story_data, existing_fingerprints, similarity_threshold=0.85):
     # 检查内容相似度
     story_content = story_data.get('story_content', '')
     story_language = story_data.get('language_code', '')
-    story_region = story_data.get('region', '')
     
-    for fp, data in existing_fingerprints.items():
-        # 如果是不同语言或地区的故事，提高相似度阈值（更严格的判断）
-        check_threshold = similarity_threshold
-        
-        # 如果保存的数据中有语言代码和地区信息
-        data_language = data.get('language_code', '')
-        data_region = data.get('region', '')
-        
-        # 如果语言不同，则需要更高的相似度才判定为重复
-        if data_language and story_language and data_language != story_language:
-            check_threshold = 0.95  # 非常高的阈值
-            continue  # 不同语言的故事直接跳过比较
-        
-        # 如果地区不同，也提高相似度要求
-        if data_region and story_region and data_region != story_region:
-            check_threshold = 0.90
-        
-        # 标题完全相同的情况
-        if 'title' in story_data and story_data['title'] == data.get('title', ''):
-            # 如果语言和地区都相同，则认为是重复
-            if (not data_language or not story_language or data_language == story_language) and \
-               (not data_region or not story_region or data_region == story_region):
-                return True
-        
-        # 检查内容相似度
-        existing_content = data.get('story_content', '')
-        if existing_content and calculate_similarity(story_content, existing_content) > check_threshold:
+    checker = checker or default_checker
+    prepared_story = None
+    
+    # 确定需要比较的故事
+    if lsh_index is not None:
+        # 比较键集合而不是数量：替换一个指纹后数量不变，索引仍需更新
+        if lsh_index.signatures.keys() != existing_fingerprints.keys():
+            lsh_index.sync(existing_fingerprints)
+        candidates = lsh_index.query(story_content, story_data.get('title'), story_language)
+        items = ((fp, existing_fingerprints[fp]) for fp in candidates if fp in existing_fingerprints)
+    else:
+        items = existing_fingerprints.items()
+    
+    for fp, data in items:
+        rule = _compare_rule(story_data, data, similarity_threshold)
+        if rule is None:
+            continue
+        
+        title_matched, check_threshold = rule
+        if title_matched:
             return True
+        
+        # 检查内容相似度(优先使用缓存的清理文本，避免读取和清理已有故事内容)
+        prepared_existing = checker.cached(fp)
+        if prepared_existing is None:
+            existing_content = data.get('story_content', '')
+            if not existing_content:
+                continue
+            prepared_existing = checker.prepare(existing_content, key=fp)
+        
+        if prepared_story is None:
+            prepared_story = checker.prepare(story_content)
+        if checker.exceeds(prepared_story, prepared_existing, check_threshold):
+            return True
+    
+    return False
+
+# 批量去重工作进程中共享的清理文本，由进程池初始化函数设置
+_worker_texts = None
+_worker_checker = None
+
+def _init_dedupe_worker(texts):
+    """
+    初始化批量去重工作进程
+    
+    Args:
+        texts: 所有参与比较的清理文本列表
+    """
+    global _worker_texts, _worker_checker
+    _worker_texts = [PreparedText(text) for text in texts]
+    _worker_checker = SimilarityChecker()
+
+def _match_story(task):
+    """
+    在工作进程中比较一个故事与它的候选故事
+    
+    Args:
+        task: (故事文本下标, 已有故事候选列表, 批次内候选列表)，
+              候选列表元素为 (候选文本下标, 阈值, 候选标识)
+        
+    Returns:
+        matches: 相似度超过阈值的候选标识列表；与已有故事重复时只返回第一个匹配
+    """
+    text_index, existing_candidates, batch_candidates = task
+    story = _worker_texts[text_index]
+    
+    for candidate_index, threshold, ref in existing_candidates:
+        if _worker_checker.exceeds(story, _worker_texts[candidate_index], threshold):
+            return [ref]
+    
+    return [
+        ref for candidate_index, threshold, ref in batch_candidates
+        if _worker_checker.exceeds(story, _worker_texts[candidate_index], threshold)
+    ]
+
+def deduplicate_batch(stories, existing, similarity_threshold=0.85, workers=None, lsh_index=None):
+    """
+    批量检查故事是否重复
+    
+    与对每个故事依次调用 is_duplicate 并把不重复的故事加入指纹字典的结果一致：
+    每个故事既与已有故事比较，也与批次中排在它前面且不重复的故事比较。
+    内容相似度的计算分配到进程池中并行执行。
+    
+    Args:
+        stories: 故事数据列表
+        existing: 已存在的指纹字典
+        similarity_threshold: 相似度阈值
+        workers: 工作进程数，默认为CPU核数；为1时在当前进程内计算
+        lsh_index: MinHash/LSH候选索引(可选)，提供时只与候选故事比较相似度
+        
+    Returns:
+        duplicates: 重复故事映射 {批次下标: 原故事}，原故事为已有故事的指纹(str)
+                    或批次中更早的故事下标(int)
+    """
+    fingerprints = [generate_fingerprint(story) for story in stories]
+    texts = []
+    text_indexes = {}
+    
+    def text_index(key, load):
+        # 每段文本只清理一次，并按首次出现的顺序编号
+        if key not in text_indexes:
+            text_indexes[key] = len(texts)
+            texts.append(load())
+        return text_indexes[key]
+    
+    def batch_text(j):
+        return lambda: clean_text(stories[j].get('story_content', ''))
+    
+    # 候选故事：提供索引时只取索引候选，批次内部也建立临时索引
+    batch_index = None
+    if lsh_index is not None:
+        if lsh_index.signatures.keys() != existing.keys():
+            lsh_index.sync(existing)
+        batch_index = MinHashLSHIndex(lsh_index.num_perm, lsh_index.bands)
+    
+    tasks = []
+    task_owners = []
+    resolved = {}
+    title_matches = {}
+    total_pairs = 0
+    
+    for i, story in enumerate(stories):
+        content = story.get('story_content', '')
+        language = story.get('language_code', '')
+        
+        if fingerprints[i] in existing:
+            resolved[i] = fingerprints[i]
+            continue
+        
+        if lsh_index is not None:
+            signature = lsh_index.signature(content, language)
+            existing_keys = lsh_index.query_signature(signature, story.get('title'))
+            existing_items = ((fp, existing[fp]) for fp in existing_keys if fp in existing)
+            batch_keys = sorted(batch_index.query_signature(signature, story.get('title')))
+            batch_index.add_signature(i, signature, story.get('title'))
+        else:
+            existing_items = existing.items()
+            batch_keys = range(i)
+        
+        # 与已有故事比较：标题规则直接判定，内容相似度交给工作进程
+        existing_candidates = []
+        for fp, data in existing_items:
+            rule = _compare_rule(story, data, similarity_threshold)
+            if rule is None:
+                continue
+            if rule[0]:
+                resolved[i] = fp
+                break
+            prepared = default_checker.cached(fp)
+            if prepared is None:
+                existing_content = data.get('story_content', '')
+                if not existing_content:
+                    continue
+                prepared = default_checker.prepare(existing_content, key=fp)
+            existing_candidates.append((text_index(fp, lambda: prepared.text), rule[1], fp))
+        if i in resolved:
+            continue
+        
+        # 与批次内更早的故事比较，是否生效取决于那些故事本身是否重复
+        batch_candidates = []
+        title_matches[i] = []
+        for j in batch_keys:
+            if fingerprints[j] == fingerprints[i]:
+                title_matches[i].append(j)
+                continue
+            rule = _compare_rule(story, stories[j], similarity_threshold)
+            if rule is None:
+                continue
+            if rule[0]:
+                title_matches[i].append(j)
+            elif stories[j].get('story_content', ''):
+                batch_candidates.append((text_index(('batch', j), batch_text(j)), rule[1], j))
+        
+        if existing_candidates or batch_candidates:
+            tasks.append((text_index(('batch', i), batch_text(i)), existing_candidates, batch_candidates))
+            task_owners.append(i)
+            total_pairs += len(existing_candidates) + len(batch_candidates)
+    
+    # 并行计算内容相似度
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or total_pairs < PARALLEL_MIN_PAIRS:
+        _init_dedupe_worker(texts)
+        results = list(map(_match_story, tasks))
+        _init_dedupe_worker([])
+    else:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_dedupe_worker,
+                                 initargs=(texts,)) as executor:
+            results = list(executor.map(_match_story, tasks, chunksize=chunksize))
+    
+    content_matches = dict(zip(task_owners, results))
+    
+    # 按批次顺序判定，只有不重复的故事才会作为后续故事的比较对象
+    duplicates = {}
+    for i in range(len(stories)):
+        if i in resolved:
+            duplicates[i] = resolved[i]
+            continue
+        
+        matches = content_matches.get(i, [])
+        if matches and isinstance(matches[0], str):
+            duplicates[i] = matches[0]
+            continue
+        
+        for j in sorted(title_matches.get(i, []) + matches):
+            if j not in duplicates:
+                duplicates[i] = j
+                break
     
-    return False 
\ No newline at end of file
+    return duplicates
@@ -0,0 +1,307 @@
+"""
+追加写入的指纹存储
+用长度前缀的日志文件代替整体重写的 fingerprints.json：
+新增指纹只追加一条记录，启动时只读取记录头建立 指纹→偏移 索引，故事正文按需读取
+"""
+
+import os
+import sys
+import json
+import struct
+import threading
+from collections.abc import Mapping, MutableMapping
+
+# 导入工具
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.fingerprint import load_fingerprints
+
+MAGIC = b'SCFPLOG1'
+
+OP_PUT = 1
+OP_DELETE = 2
+
+# 记录头: 操作类型、元数据长度、正文长度
+_RECORD_HEADER = struct.Struct('<BII')
+
+# 失效记录超过该数量且超过有效记录数时自动压缩
+COMPACT_MIN_DEAD = 256
+
+BODY_FIELD = 'story_content'
+
+
+def fingerprint_store_path(fingerprint_filepath):
+    """
+    获取指纹文件对应的日志文件路径
+
+    Args:
+        fingerprint_filepath: 指纹文件路径(fingerprints.json)
+
+    Returns:
+        log_filepath: 日志文件路径
+    """
+    root, _ = os.path.splitext(fingerprint_filepath)
+    return f"{root}.log"
+
+
+class FingerprintRecord(Mapping):
+    """指纹记录，故事正文在首次访问时才从日志读取"""
+
+    def __init__(self, store, fingerprint, meta, body_offset, body_length, generation):
+        self._store = store
+        self._fingerprint = fingerprint
+        self._meta = meta
+        self._body_offset = body_offset
+        self._body_length = body_length
+        self._generation = generation
+        self._body = None
+
+    def __getitem__(self, key):
+        if key == BODY_FIELD and self._body_length is not None:
+            if self._body is None:
+                self._body = self._store._read_body(self._fingerprint, self._body_offset, self._body_length,
+                                                    self._generation)
+            return self._body
+        return self._meta[key]
+
+    def __iter__(self):
+        yield from self._meta
+        if self._body_length is not None:
+            yield BODY_FIELD
+
+    def __len__(self):
+        return len(self._meta) + (self._body_length is not None)
+
+    def __repr__(self):
+        return f"FingerprintRecord({self._meta!r})"
+
+
+class FingerprintStore(MutableMapping):
+    """追加写入的指纹存储，可直接作为 is_duplicate 的指纹字典使用"""
+
+    def __init__(self, filepath, compact_min_dead=COMPACT_MIN_DEAD):
+        """
+        打开指纹日志，文件不存在时创建
+
+        Args:
+            filepath: 日志文件路径
+            compact_min_dead: 触发自动压缩的最少失效记录数
+        """
+        self.filepath = filepath
+        self.compact_min_dead = compact_min_dead
+        self._lock = threading.RLock()
+        self._index = {}
+        self._dead = 0
+        # 每次压缩后加1，之前取得的记录中的正文偏移随之失效
+        self._generation = 0
+
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._open()
+
+    def _open(self):
+        """打开日志文件并扫描记录头建立索引"""
+        if not os.path.exists(self.filepath) or os.path.getsize(self.filepath) == 0:
+            with open(self.filepath, 'wb') as f:
+                f.write(MAGIC)
+
+        self._index = {}
+        self._dead = 0
+        self._reader = open(self.filepath, 'rb')
+        if self._reader.read(len(MAGIC)) != MAGIC:
+            self._reader.close()
+            raise ValueError(f"不是有效的指纹日志文件: {self.filepath}")
+
+        end = self._scan()
+        self._writer = open(self.filepath, 'ab')
+        # 丢弃写入中断留下的不完整记录
+        if self._writer.tell() != end:
+            self._writer.truncate(end)
+            self._writer.seek(end)
+
+    def _scan(self):
+        """
+        顺序读取记录头，跳过正文
+
+        Returns:
+            end: 最后一条完整记录的结束位置
+        """
+        reader = self._reader
+        size = os.fstat(reader.fileno()).st_size
+        position = len(MAGIC)
+
+        while position + _RECORD_HEADER.size <= size:
+            reader.seek(position)
+            op, meta_length, body_length = _RECORD_HEADER.unpack(reader.read(_RECORD_HEADER.size))
+            body_offset = position + _RECORD_HEADER.size + meta_length
+            end = body_offset + body_length
+            if end > size or op not in (OP_PUT, OP_DELETE):
+                break
+
+            try:
+                meta = json.loads(reader.read(meta_length).decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                break
+
+            fingerprint = meta.pop('fingerprint')
+            if fingerprint in self._index:
+                self._dead += 1
+            if op == OP_PUT:
+                has_body = meta.pop('has_body', False)
+                self._index[fingerprint] = (meta, body_offset, body_length if has_body else None)
+            else:
+                self._index.pop(fingerprint, None)
+                self._dead += 1
+
+            position = end
+
+        return position
+
+    def _read_body(self, fingerprint, offset, length, generation):
+        """读取故事正文，日志在记录取得后压缩过时按当前索引重新定位"""
+        with self._lock:
+            if generation != self._generation:
+                entry = self._index.get(fingerprint)
+                if entry is None or entry[2] is None:
+                    raise KeyError(BODY_FIELD)
+                _, offset, length = entry
+            self._reader.seek(offset)
+            return self._reader.read(length).decode('utf-8')
+
+    def _append(self, op, fingerprint, data=None):
+        """追加一条记录"""
+        meta = {'fingerprint': fingerprint}
+        body = b''
+        if data is not None:
+            for key, value in data.items():
+                if key == BODY_FIELD:
+                    body = (value or '').encode('utf-8')
+                    meta['has_body'] = True
+                else:
+                    meta[key] = value
+
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        position = self._writer.tell()
+        self._writer.write(_RECORD_HEADER.pack(op, len(meta_bytes), len(body)))
+        self._writer.write(meta_bytes)
+        self._writer.write(body)
+        self._writer.flush()
+
+        meta.pop('fingerprint')
+        has_body = meta.pop('has_body', False)
+        body_offset = position + _RECORD_HEADER.size + len(meta_bytes)
+        return meta, body_offset, len(body) if has_body else None
+
+    def __getitem__(self, fingerprint):
+        meta, body_offset, body_length = self._index[fingerprint]
+        return FingerprintRecord(self, fingerprint, meta, body_offset, body_length, self._generation)
+
+    def __setitem__(self, fingerprint, data):
+        with self._lock:
+            if fingerprint in self._index:
+                self._dead += 1
+            self._index[fingerprint] = self._append(OP_PUT, fingerprint, data)
+            self._maybe_compact()
+
+    def __delitem__(self, fingerprint):
+        with self._lock:
+            if fingerprint not in self._index:
+                raise KeyError(fingerprint)
+            self._append(OP_DELETE, fingerprint)
+            del self._index[fingerprint]
+            self._dead += 2
+            self._maybe_compact()
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._index
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+    def __len__(self):
+        return len(self._index)
+
+    def _maybe_compact(self):
+        """失效记录过多时压缩日志"""
+        if self._dead >= self.compact_min_dead and self._dead > len(self._index):
+            self.compact()
+
+    def compact(self):
+        """
+        压缩日志，只保留有效记录
+
+        先写入临时文件再原子替换，压缩过程中断不会损坏原日志。
+        """
+        with self._lock:
+            temp_filepath = self.filepath + '.tmp'
+            with open(temp_filepath, 'wb') as out:
+                out.write(MAGIC)
+                for fingerprint, (meta, body_offset, body_length) in self._index.items():
+                    record = dict(meta, fingerprint=fingerprint)
+                    body = b''
+                    if body_length is not None:
+                        record['has_body'] = True
+                        self._reader.seek(body_offset)
+                        body = self._reader.read(body_length)
+                    meta_bytes = json.dumps(record, ensure_ascii=False).encode('utf-8')
+                    out.write(_RECORD_HEADER.pack(OP_PUT, len(meta_bytes), len(body)))
+                    out.write(meta_bytes)
+                    out.write(body)
+                out.flush()
+                os.fsync(out.fileno())
+
+            self._close_files()
+            os.replace(temp_filepath, self.filepath)
+            self._generation += 1
+            self._open()
+
+    def sync(self):
+        """把已追加的记录刷新到磁盘"""
+        with self._lock:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+
+    def _close_files(self):
+        self._writer.close()
+        self._reader.close()
+
+    def close(self):
+        """关闭存储"""
+        with self._lock:
+            if not self._writer.closed:
+                self.sync()
+                self._close_files()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_fingerprint_store(fingerprint_filepath):
+    """
+    打开指纹文件对应的日志存储
+
+    日志不存在而旧的 fingerprints.json 存在时，先把旧文件中的指纹导入日志。
+    导入写入临时文件，完成后才原子替换为日志，导入中断时下次打开重新导入。
+
+    Args:
+        fingerprint_filepath: 指纹文件路径(fingerprints.json)
+
+    Returns:
+        store: 指纹存储实例
+    """
+    log_filepath = fingerprint_store_path(fingerprint_filepath)
+    if not os.path.exists(log_filepath) and os.path.exists(fingerprint_filepath):
+        temp_filepath = log_filepath + '.tmp'
+        # 上次中断的导入留下的临时文件不完整，重新开始
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        with FingerprintStore(temp_filepath) as store:
+            for fingerprint, data in load_fingerprints(fingerprint_filepath).items():
+                store[fingerprint] = data
+        os.replace(temp_filepath, log_filepath)
+
+    return FingerprintStore(log_filepath)
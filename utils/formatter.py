@@ -11,6 +11,7 @@ from datetime import datetime
 # 导入配置
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from config.settings import TEMPLATE_FILE
+from utils.story_parser import parse_story
 
 def read_template():
     """
@@ -36,36 +37,128 @@ def extract_sections(content):
         sections: 故事各部分的字典
     """
     sections = {}
+    document = parse_story(content)
     
     # 提取标题
-    title_match = re.search(r'^# (.*?)$', content, re.MULTILINE)
-    if title_match:
-        sections['title'] = title_match.group(1).strip()
+    if document.title is not None:
+        sections['title'] = document.title
     
     # 提取基本信息
-    basic_info_pattern = r'## 基本信息\s+(.+?)(?=##|\Z)'
-    basic_info_match = re.search(basic_info_pattern, content, re.DOTALL)
-    if basic_info_match:
-        basic_info = basic_info_match.group(1).strip()
-        # 提取具体项目
-        for line in basic_info.split('\n'):
-            line = line.strip()
-            if line.startswith('-'):
-                parts = line[1:].split(':', 1)
-                if len(parts) == 2:
-                    key = parts[0].strip().lower().replace(' ', '_')
-                    value = parts[1].strip()
-                    sections[key] = value
+    sections.update(document.basic_info)
     
     # 提取其他主要部分
-    sections_pattern = r'## ([^\n]+)\s+(.*?)(?=## |$)'
-    for section_match in re.finditer(sections_pattern, content, re.DOTALL):
-        section_name = section_match.group(1).strip().lower().replace(' ', '_')
-        section_content = section_match.group(2).strip()
-        sections[section_name] = section_content
+    for section in document.sections:
+        sections[section.key] = section.content
     
     return sections
 
+# 由故事内容填充的模板部分
+TEMPLATE_SECTIONS = ('故事来源', '故事梗概', '文化背景', '故事主题', '故事意义', '教育价值', '相关传统', '参考来源')
+
+# 模板中 "- 键: [占位符]" 形式的列表项
+_INFO_PLACEHOLDER_PATTERN = re.compile(r'^- ([^:\n]+): (\[[^\n]*\])[ \t]*$', re.MULTILINE)
+
+# 已编译的模板: (模板路径, 修改时间, CompiledTemplate)
+_compiled_template = None
+
+
+class CompiledTemplate:
+    """
+    编译后的故事模板
+
+    模板被切分为文本片段和槽位，渲染时只替换槽位对应的片段后拼接一次。
+    槽位名: title(一级标题文字)、info:<键>(列表项占位符)、section:<标题>(部分正文)
+    """
+
+    def __init__(self, template):
+        """
+        Args:
+            template: 模板内容
+        """
+        spans = []
+
+        # 一级标题
+        title_start = 0 if template.startswith('# ') else template.find('\n# ') + 1
+        if title_start > 0 or template.startswith('# '):
+            title_end = template.find('\n', title_start)
+            if title_end < 0:
+                title_end = len(template)
+            spans.append((title_start + 2, title_end, 'title'))
+
+        # 由故事内容填充的部分：从标题行末的换行到正文最后一个非空白字符
+        for section in parse_story(template).sections:
+            if section.name not in TEMPLATE_SECTIONS:
+                continue
+            start = section.start - 1 if template[section.start - 1:section.start] == '\n' else section.start
+            end = section.start + len(template[section.start:section.end].rstrip())
+            spans.append((start, end, f'section:{section.name}'))
+
+        # 其余部分中的列表项占位符
+        section_spans = list(spans)
+        for match in _INFO_PLACEHOLDER_PATTERN.finditer(template):
+            start, end = match.span(2)
+            if not any(s <= start < e for s, e, name in section_spans if name.startswith('section:')):
+                spans.append((start, end, f'info:{match.group(1).strip()}'))
+
+        self.parts = []
+        self.slots = {}
+        position = 0
+        for start, end, name in sorted(spans):
+            self.parts.append(template[position:start])
+            self.slots[name] = len(self.parts)
+            self.parts.append(template[start:end])
+            position = end
+        self.parts.append(template[position:])
+
+    def render(self, values):
+        """
+        渲染模板
+
+        Args:
+            values: {槽位名: 文本}，未提供的槽位保留模板原文
+
+        Returns:
+            content: 渲染结果
+        """
+        parts = list(self.parts)
+        for name, value in values.items():
+            index = self.slots.get(name)
+            if index is not None:
+                parts[index] = value
+        return ''.join(parts)
+
+
+def get_compiled_template(template_file=None):
+    """
+    获取编译后的模板，模板文件修改时间变化时重新编译
+
+    Args:
+        template_file: 模板文件路径，默认为配置中的模板
+
+    Returns:
+        compiled: CompiledTemplate，模板不存在或为空时为None
+    """
+    global _compiled_template
+    template_file = template_file or TEMPLATE_FILE
+    try:
+        mtime_ns = os.stat(template_file).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _compiled_template
+    if cached is not None and cached[0] == template_file and cached[1] == mtime_ns:
+        return cached[2]
+
+    try:
+        with open(template_file, 'r', encoding='utf-8') as f:
+            template = f.read()
+    except FileNotFoundError:
+        return None
+
+    compiled = CompiledTemplate(template) if template else None
+    _compiled_template = (template_file, mtime_ns, compiled)
+    return compiled
+
 def format_story(story_data):
     """
     将故事数据格式化为Markdown格式
@@ -76,87 +169,48 @@ def format_story(story_data):
     Returns:
         formatted_content: 格式化后的Markdown内容
     """
-    template = read_template()
+    template = get_compiled_template()
     
     # 如果没有模板，则创建基本内容
-    if not template:
+    if template is None:
         return _create_basic_content(story_data)
     
-    # 替换模板中的占位符
-    formatted_content = template
+    values = {}
     
-    # 替换标题
+    # 标题
     if 'title' in story_data:
         if 'original_title' in story_data:
-            title_line = f"# {story_data['language_code']}{story_data.get('story_number', '001')} {story_data['title']} ({story_data['original_title']})"
+            values['title'] = f"{story_data['language_code']}{story_data.get('story_number', '001')} {story_data['title']} ({story_data['original_title']})"
         else:
-            title_line = f"# {story_data['language_code']}{story_data.get('story_number', '001')} {story_data['title']}"
-        formatted_content = re.sub(r'^# .*?$', title_line, formatted_content, flags=re.MULTILINE)
+            values['title'] = f"{story_data['language_code']}{story_data.get('story_number', '001')} {story_data['title']}"
     
-    # 替换基本信息
+    # 基本信息
     if 'language_code' in story_data:
-        formatted_content = re.sub(r'- 故事编号: \[语言代码\]\[编号\]', 
-                                  f"- 故事编号: {story_data['language_code']}{story_data.get('story_number', '001')}", 
-                                  formatted_content)
+        values['info:故事编号'] = f"{story_data['language_code']}{story_data.get('story_number', '001')}"
     
     if 'category' in story_data:
-        formatted_content = re.sub(r'- 分类: \[传统民间故事/现代故事/节日故事等\]', 
-                                  f"- 分类: {story_data['category']}", 
-                                  formatted_content)
+        values['info:分类'] = f"{story_data['category']}"
     
     if 'region' in story_data:
-        formatted_content = re.sub(r'- 子分类: \[具体地区/文化圈分类\]', 
-                                  f"- 子分类: {story_data['region']}", 
-                                  formatted_content)
-        formatted_content = re.sub(r'- 地区: \[具体城市/地区，所属国家\]', 
-                                  f"- 地区: {story_data['region']}", 
-                                  formatted_content)
+        values['info:子分类'] = f"{story_data['region']}"
+        values['info:地区'] = f"{story_data['region']}"
     
     if 'type' in story_data:
-        formatted_content = re.sub(r'- 类型: \[故事类型：神话/传说/童话等\]', 
-                                  f"- 类型: {story_data['type']}", 
-                                  formatted_content)
+        values['info:类型'] = f"{story_data['type']}"
     
-    # 替换故事内容
+    # 故事内容的各个部分
     if 'story_content' in story_data:
-        # 提取故事梗概部分
-        story_content = story_data['story_content']
-        story_parts = {}
-        
-        # 尝试从story_content中提取各个部分
-        parts = re.findall(r'## ([^\n]+)\s+(.*?)(?=##|\Z)', story_content, re.DOTALL)
-        for part_name, part_content in parts:
-            part_key = part_name.strip().lower()
-            story_parts[part_key] = part_content.strip()
-        
-        # 替换故事来源
-        if '故事来源' in story_parts:
-            formatted_content = re.sub(r'## 故事来源\s+\[简要说明故事的文化背景和来源，100字以内\]',
-                                     f"## 故事来源\n\n{story_parts['故事来源']}", 
-                                     formatted_content)
-        
-        # 替换故事梗概
-        if '故事梗概' in story_parts:
-            formatted_content = re.sub(r'## 故事梗概\s+\[详细的故事情节，包括人物、事件发展和结局，1000字左右\]',
-                                     f"## 故事梗概\n\n{story_parts['故事梗概']}", 
-                                     formatted_content)
-        
-        # 替换其他部分
-        for section in ['文化背景', '故事主题', '故事意义', '教育价值', '相关传统', '参考来源']:
-            section_lower = section.lower()
-            if section_lower in story_parts:
-                pattern = f"## {section}\\s+.*?(?=##|\\Z)"
-                replacement = f"## {section}\n\n{story_parts[section_lower]}"
-                formatted_content = re.sub(pattern, replacement, formatted_content, flags=re.DOTALL)
+        for section in parse_story(story_data['story_content']).sections:
+            if section.name in TEMPLATE_SECTIONS:
+                values[f'section:{section.name}'] = f"\n\n{section.content}"
     
-    # 添加收集记录
-    now = datetime.now().strftime('%Y-%m')
-    collector = story_data.get('collector', '自动收集')
-    formatted_content = re.sub(r'- 收集时间: \[年月\]', f'- 收集时间: {now}', formatted_content)
-    formatted_content = re.sub(r'- 收集人: \[收集者\]', f'- 收集人: {collector}', formatted_content)
-    formatted_content = re.sub(r'- 完整性: \[完整性评估\]', f'- 完整性: {story_data.get("completeness", "完整")}', formatted_content)
+    # 收集记录
+    now = datetime.now()
+    values['info:收集时间'] = f"{now.year:04d}-{now.month:02d}"
+    values['info:收集人'] = f"{story_data.get('collector', '自动收集')}"
+    values['info:完整性'] = f"{story_data.get('completeness', '完整')}"
     
-    return formatted_content
+    return template.render(values)
 
 def _create_basic_content(story_data):
     """
@@ -204,6 +258,22 @@ def _create_basic_content(story_data):
     
     return "\n".join(content)
 
+def has_heading(content, name):
+    """
+    检查内容中是否包含指定的标题
+
+    按文本查找 "## 名称"，标题后带说明(如 "## 基本信息 (Basic Info)")或更低级的标题
+    (如 "### 基本信息")同样算作包含，与按二级标题行解析的 parse_story 不同。
+
+    Args:
+        content: 故事内容
+        name: 标题文字
+
+    Returns:
+        found: 是否包含
+    """
+    return f'## {name}' in content
+
 def validate_story_format(content):
     """
     验证故事格式是否符合要求
@@ -217,19 +287,19 @@ def validate_story_format(content):
     issues = []
     
     # 检查标题
-    if not re.search(r'^# ', content, re.MULTILINE):
+    if parse_story(content).title is None:
         issues.append("缺少标题(# 开头)")
     
     # 检查基本信息
-    if not re.search(r'## 基本信息', content, re.MULTILINE):
+    if not has_heading(content, '基本信息'):
         issues.append("缺少基本信息部分")
     
     # 检查故事梗概
-    if not re.search(r'## 故事梗概', content, re.MULTILINE):
+    if not has_heading(content, '故事梗概'):
         issues.append("缺少故事梗概部分")
     
     # 检查收集记录
-    if not re.search(r'## 收集记录', content, re.MULTILINE):
+    if not has_heading(content, '收集记录'):
         issues.append("缺少收集记录部分")
     
     return len(issues) == 0, issues
@@ -247,7 +317,7 @@ def fix_common_issues(content):
     fixed_content = content
     
     # 修复标题格式
-    if not re.search(r'^# ', fixed_content, re.MULTILINE):
+    if parse_story(content).title is None:
         title_match = re.search(r'^(.+?)$', fixed_content.strip(), re.MULTILINE)
         if title_match:
             title = title_match.group(1).strip()
@@ -256,16 +326,16 @@ def fix_common_issues(content):
             fixed_content = f"# 未命名故事\n\n{fixed_content}"
     
     # 修复基本信息部分
-    if not re.search(r'## 基本信息', fixed_content, re.MULTILINE):
+    if not has_heading(fixed_content, '基本信息'):
         fixed_content += "\n\n## 基本信息\n- 故事编号: 未编号\n- 分类: 未分类\n"
     
     # 修复故事梗概部分
-    if not re.search(r'## 故事梗概', fixed_content, re.MULTILINE):
+    if not has_heading(fixed_content, '故事梗概'):
         fixed_content += "\n\n## 故事梗概\n[无故事内容]"
     
     # 修复收集记录部分
-    if not re.search(r'## 收集记录', fixed_content, re.MULTILINE):
+    if not has_heading(fixed_content, '收集记录'):
         now = datetime.now().strftime('%Y-%m')
-        fixed_content += f"\n\n## A收集记录\n- 收集时间: {now}\n- 收集人: 自动收集\n- 完整性: 部分"
+        fixed_content += f"\n\n## 收集记录\n- 收集时间: {now}\n- 收集人: 自动收集\n- 完整性: 部分"
     
     return fixed_content 
\ No newline at end of file
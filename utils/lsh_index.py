@@ -0,0 +1,346 @@
+"""
+MinHash/LSH 候选索引
+用于在去重时快速找出可能重复的故事，避免与全部已有故事逐一比较
+"""
+
+import os
+import sys
+import json
+import base64
+from array import array
+
+# 导入配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from config.settings import MINHASH_NUM_PERM, LSH_BANDS
+from utils.shingling import get_shingles, CHAR_NGRAM_SIZE, WORD_NGRAM_SIZE
+
+INDEX_VERSION = 3
+
+_MAX_VALUE = 0xFFFFFFFF
+# 填充空桶时使用的偏移量(奇数，保证不同距离得到不同的值)
+_DENSIFY_OFFSET = 0x9E3779B1
+
+
+def compute_minhash(hashes, num_perm=MINHASH_NUM_PERM):
+    """
+    计算MinHash签名
+
+    使用单次哈希分桶(one permutation hashing)：每个片段哈希只计算一次，
+    低位决定桶号，高位参与取最小值，空桶再从右侧最近的非空桶借值填充。
+    这样签名的计算量与片段数量成正比，而不是片段数量乘以签名长度。
+
+    Args:
+        hashes: 片段哈希集合
+        num_perm: 签名长度
+
+    Returns:
+        signature: 签名数组(array('I'))，没有片段时返回None
+    """
+    if not hashes:
+        return None
+
+    bins = [_MAX_VALUE + 1] * num_perm
+    for h in hashes:
+        slot = h % num_perm
+        value = h >> 32
+        if value < bins[slot]:
+            bins[slot] = value
+
+    # 填充空桶
+    signature = array('I', [0] * num_perm)
+    nearest = None
+    distance = 0
+    for step in range(2 * num_perm - 1, -1, -1):
+        slot = step % num_perm
+        if bins[slot] <= _MAX_VALUE:
+            nearest = bins[slot]
+            distance = 0
+        else:
+            distance += 1
+        if step < num_perm:
+            signature[slot] = (nearest + distance * _DENSIFY_OFFSET) & _MAX_VALUE
+    return signature
+
+
+def estimate_jaccard(signature1, signature2):
+    """
+    根据两个签名估算Jaccard相似度
+
+    Args:
+        signature1: 第一个签名
+        signature2: 第二个签名
+
+    Returns:
+        similarity: 估算的相似度(0-1)
+    """
+    if signature1 is None or signature2 is None:
+        return 0.0
+    same = sum(1 for a, b in zip(signature1, signature2) if a == b)
+    return same / len(signature1)
+
+
+class MinHashLSHIndex:
+    """MinHash + LSH 候选索引"""
+
+    def __init__(self, num_perm=MINHASH_NUM_PERM, bands=LSH_BANDS):
+        """
+        初始化索引
+
+        Args:
+            num_perm: 签名长度
+            bands: LSH分段数，必须能整除签名长度
+        """
+        if num_perm % bands:
+            raise ValueError(f"签名长度 {num_perm} 不能被分段数 {bands} 整除")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.signatures = {}
+        self.titles = {}
+        self._buckets = [{} for _ in range(bands)]
+        self._title_keys = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    def _band_keys(self, signature):
+        """计算签名在每个分段上的桶键"""
+        rows = self.rows
+        return [hash(tuple(signature[i * rows:(i + 1) * rows])) for i in range(self.bands)]
+
+    def signature(self, text, language_code=None):
+        """
+        计算文本的签名
+
+        Args:
+            text: 故事内容
+            language_code: 语言代码(可选)
+
+        Returns:
+            signature: 签名数组，文本为空时返回None
+        """
+        return compute_minhash(get_shingles(text, language_code), self.num_perm)
+
+    def add(self, key, text, title=None, language_code=None):
+        """
+        添加故事到索引
+
+        Args:
+            key: 故事键(一般为指纹)
+            text: 故事内容
+            title: 故事标题
+            language_code: 语言代码(可选)
+        """
+        self.add_signature(key, self.signature(text, language_code), title)
+
+    def add_signature(self, key, signature, title=None):
+        """
+        使用已计算的签名添加故事
+
+        Args:
+            key: 故事键
+            signature: 签名数组(可为None)
+            title: 故事标题
+        """
+        if key in self.signatures:
+            self.remove(key)
+
+        self.signatures[key] = signature
+        if signature is not None:
+            for band, band_key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(band_key, set()).add(key)
+
+        if title:
+            self.titles[key] = title
+            self._title_keys.setdefault(title, set()).add(key)
+
+    def remove(self, key):
+        """
+        从索引中移除故事
+
+        Args:
+            key: 故事键
+        """
+        signature = self.signatures.pop(key, None)
+        if signature is not None:
+            for band, band_key in enumerate(self._band_keys(signature)):
+                bucket = self._buckets[band].get(band_key)
+                if bucket:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band][band_key]
+
+        title = self.titles.pop(key, None)
+        if title:
+            keys = self._title_keys.get(title)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._title_keys[title]
+
+    def query(self, text, title=None, language_code=None):
+        """
+        查询可能重复的候选故事
+
+        Args:
+            text: 故事内容
+            title: 故事标题，标题完全相同的故事也会作为候选返回
+            language_code: 语言代码(可选)
+
+        Returns:
+            candidates: 候选故事键集合
+        """
+        return self.query_signature(self.signature(text, language_code), title)
+
+    def query_signature(self, signature, title=None):
+        """
+        使用已计算的签名查询候选故事
+
+        Args:
+            signature: 签名数组(可为None)
+            title: 故事标题
+
+        Returns:
+            candidates: 候选故事键集合
+        """
+        candidates = set()
+        if signature is not None:
+            for band, band_key in enumerate(self._band_keys(signature)):
+                bucket = self._buckets[band].get(band_key)
+                if bucket:
+                    candidates.update(bucket)
+        if title and title in self._title_keys:
+            candidates.update(self._title_keys[title])
+        return candidates
+
+    def sync(self, fingerprints):
+        """
+        使索引与指纹字典保持一致
+
+        Args:
+            fingerprints: 指纹字典
+
+        Returns:
+            changed: 索引是否发生变化
+        """
+        stale = [key for key in self.signatures if key not in fingerprints]
+        for key in stale:
+            self.remove(key)
+
+        missing = [key for key in fingerprints if key not in self.signatures]
+        for key in missing:
+            data = fingerprints[key]
+            self.add(key, data.get('story_content', ''), data.get('title'), data.get('language_code'))
+
+        return bool(stale or missing)
+
+    def save(self, filepath):
+        """
+        保存索引到文件
+
+        Args:
+            filepath: 保存路径
+
+        Returns:
+            success: 是否保存成功
+        """
+        entries = {}
+        for key, signature in self.signatures.items():
+            entry = {}
+            if signature is not None:
+                entry['sig'] = base64.b64encode(signature.tobytes()).decode('ascii')
+            if key in self.titles:
+                entry['title'] = self.titles[key]
+            entries[key] = entry
+
+        data = {
+            'version': INDEX_VERSION,
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'shingle_sizes': [CHAR_NGRAM_SIZE, WORD_NGRAM_SIZE],
+            'entries': entries
+        }
+
+        try:
+            temp_filepath = filepath + '.tmp'
+            with open(temp_filepath, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_filepath, filepath)
+            return True
+        except Exception:
+            return False
+
+    @classmethod
+    def load(cls, filepath, num_perm=MINHASH_NUM_PERM, bands=LSH_BANDS):
+        """
+        从文件加载索引
+
+        文件不存在、损坏或参数与当前配置不一致时返回空索引，
+        调用方可通过 sync() 从指纹字典重建。
+
+        Args:
+            filepath: 索引文件路径
+            num_perm: 签名长度
+            bands: LSH分段数
+
+        Returns:
+            index: 索引实例
+        """
+        index = cls(num_perm, bands)
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return index
+
+        if (data.get('version') != INDEX_VERSION or data.get('num_perm') != num_perm
+                or data.get('bands') != bands
+                or data.get('shingle_sizes') != [CHAR_NGRAM_SIZE, WORD_NGRAM_SIZE]):
+            return index
+
+        for key, entry in data.get('entries', {}).items():
+            signature = None
+            if 'sig' in entry:
+                signature = array('I')
+                signature.frombytes(base64.b64decode(entry['sig']))
+            index.add_signature(key, signature, entry.get('title'))
+
+        return index
+
+
+def lsh_index_path(fingerprint_filepath):
+    """
+    获取指纹文件对应的索引文件路径
+
+    Args:
+        fingerprint_filepath: 指纹文件路径
+
+    Returns:
+        index_filepath: 索引文件路径
+    """
+    root, _ = os.path.splitext(fingerprint_filepath)
+    return f"{root}.lsh.json"
+
+
+def load_lsh_index(fingerprint_filepath, fingerprints=None):
+    """
+    加载指纹文件旁边的索引，并与指纹字典同步
+
+    索引发生变化时会写回文件，下次启动无需重新计算签名。
+
+    Args:
+        fingerprint_filepath: 指纹文件路径
+        fingerprints: 指纹字典(可选)
+
+    Returns:
+        index: 索引实例
+    """
+    index_filepath = lsh_index_path(fingerprint_filepath)
+    index = MinHashLSHIndex.load(index_filepath)
+    if fingerprints is not None and index.sync(fingerprints):
+        index.save(index_filepath)
+    return index
@@ -0,0 +1,144 @@
+"""
+目录扫描缓存
+按目录记录修改时间和文件列表，再次扫描时只重新读取修改时间发生变化的目录
+"""
+
+import os
+import json
+import time
+
+CACHE_VERSION = 1
+
+# 修改时间距离扫描时刻小于该值(纳秒)的目录不缓存，避免同一时间粒度内的修改被漏掉
+_RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+class DirectoryScanCache:
+    """目录扫描缓存"""
+
+    def __init__(self, filepath=None):
+        """
+        初始化缓存
+
+        Args:
+            filepath: 缓存文件路径，为None时只在内存中缓存
+        """
+        self.filepath = filepath
+        self.entries = {}
+        self.stats = {'directories': 0, 'rescanned': 0}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """从文件加载缓存"""
+        if not self.filepath:
+            return
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return
+        if data.get('version') == CACHE_VERSION:
+            self.entries = data.get('entries', {})
+
+    def save(self):
+        """
+        缓存有变化时写回文件
+
+        Returns:
+            success: 是否保存成功
+        """
+        if not self.filepath or not self._dirty:
+            return True
+        try:
+            temp_filepath = self.filepath + '.tmp'
+            with open(temp_filepath, 'w', encoding='utf-8') as f:
+                json.dump({'version': CACHE_VERSION, 'entries': self.entries}, f, ensure_ascii=False)
+            os.replace(temp_filepath, self.filepath)
+            self._dirty = False
+            return True
+        except Exception:
+            return False
+
+    def _read_directory(self, path, suffix, scan_started_ns):
+        """
+        读取目录内容
+
+        Args:
+            path: 目录路径
+            suffix: 需要记录的文件后缀
+            scan_started_ns: 本次扫描开始的时间
+
+        Returns:
+            entry: {'mtime_ns', 'files': [[文件名, 创建时间]...], 'dirs': [子目录名...]}
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        files = []
+        dirs = []
+        with os.scandir(path) as iterator:
+            for item in iterator:
+                if item.is_dir():
+                    dirs.append(item.name)
+                elif item.name.endswith(suffix) and item.is_file():
+                    files.append([item.name, item.stat().st_ctime])
+
+        files.sort()
+        dirs.sort()
+        # 刚修改过的目录下次仍需重新读取
+        if scan_started_ns - mtime_ns < _RACY_WINDOW_NS:
+            mtime_ns = None
+        return {'mtime_ns': mtime_ns, 'files': files, 'dirs': dirs}
+
+    def scan(self, root, suffix='.md'):
+        """
+        扫描目录树
+
+        修改时间未变化的目录直接使用缓存的文件列表，每个这样的目录只需一次stat。
+
+        Args:
+            root: 根目录
+            suffix: 需要列出的文件后缀
+
+        Returns:
+            directories: [(目录路径, [(文件名, 创建时间), ...]), ...]，按路径排序
+        """
+        scan_started_ns = time.time_ns()
+        self.stats = {'directories': 0, 'rescanned': 0}
+        visited = set()
+        directories = []
+        stack = [root]
+
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+            visited.add(path)
+            self.stats['directories'] += 1
+            entry = self.entries.get(path)
+            if entry is None or entry.get('suffix') != suffix or entry['mtime_ns'] != mtime_ns:
+                try:
+                    entry = self._read_directory(path, suffix, scan_started_ns)
+                except OSError:
+                    continue
+                entry['suffix'] = suffix
+                self.entries[path] = entry
+                self._dirty = True
+                self.stats['rescanned'] += 1
+
+            if entry['files']:
+                directories.append((path, [tuple(item) for item in entry['files']]))
+            for name in reversed(entry['dirs']):
+                stack.append(os.path.join(path, name))
+
+        # 清理已删除目录的缓存
+        root_prefix = os.path.join(root, '')
+        for path in list(self.entries):
+            if (path == root or path.startswith(root_prefix)) and path not in visited:
+                del self.entries[path]
+                self._dirty = True
+
+        directories.sort(key=lambda item: item[0])
+        return directories
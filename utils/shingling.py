@@ -0,0 +1,219 @@
+"""
+文本分片工具
+根据文字体系把文本切分为n-gram片段，并生成紧凑的哈希片段集合
+中文、日文等没有空格分词的文本使用字符n-gram，拉丁文字使用单词n-gram
+"""
+
+import re
+import hashlib
+from array import array
+from functools import lru_cache
+
+SCRIPT_CJK = 'cjk'
+SCRIPT_LATIN = 'latin'
+
+# 各文字体系的n-gram长度
+CHAR_NGRAM_SIZE = 3
+WORD_NGRAM_SIZE = 3
+
+# 语言代码对应的文字体系，未列出的语言自动检测
+LANGUAGE_SCRIPTS = {
+    'CN': SCRIPT_CJK,
+    'JP': SCRIPT_CJK
+}
+
+# CJK字符占比超过该值时视为CJK文本
+CJK_RATIO_THRESHOLD = 0.3
+
+# 检测文字体系时最多检查的字符数
+DETECT_SAMPLE_SIZE = 2000
+
+_CJK_PATTERN = re.compile(
+    '[\u3040-\u30ff'          # 平假名、片假名
+    '\u3400-\u4dbf'           # CJK扩展A
+    '\u4e00-\u9fff'           # CJK统一汉字
+    '\uac00-\ud7af'           # 韩文音节
+    '\uf900-\ufaff'           # CJK兼容汉字
+    '\U00020000-\U0002fa1f]'  # CJK扩展B及以后
+)
+_LETTER_PATTERN = re.compile(r'[^\W\d_]')
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def clean_text(text):
+    """
+    清理文本，移除特殊字符、多余空格等
+    
+    Args:
+        text: 原始文本
+        
+    Returns:
+        cleaned_text: 清理后的文本
+    """
+    if not text:
+        return ""
+    
+    # 移除Markdown标记
+    text = re.sub(r'#.*?\n', ' ', text)
+    text = re.sub(r'\*\*|\*|__|\||_|`', '', text)
+    
+    # 移除多余空白字符
+    text = re.sub(r'\s+', ' ', text)
+    
+    # 移除标点符号
+    text = re.sub(r'[^\w\s]', '', text)
+    
+    return text.strip().lower()
+
+
+def detect_script(text, language_code=None):
+    """
+    检测文本的文字体系
+
+    Args:
+        text: 文本
+        language_code: 语言代码(可选)，已知时直接使用对应的文字体系
+
+    Returns:
+        script: SCRIPT_CJK 或 SCRIPT_LATIN
+    """
+    if language_code in LANGUAGE_SCRIPTS:
+        return LANGUAGE_SCRIPTS[language_code]
+
+    sample = text[:DETECT_SAMPLE_SIZE]
+    letters = len(sample) - len(_LETTER_PATTERN.sub('', sample))
+    cjk = len(sample) - len(_CJK_PATTERN.sub('', sample))
+    if letters and cjk / letters >= CJK_RATIO_THRESHOLD:
+        return SCRIPT_CJK
+    return SCRIPT_LATIN
+
+
+def split_units(cleaned, script):
+    """
+    把清理后的文本切分为基本单位
+
+    Args:
+        cleaned: 经过 clean_text 处理的文本
+        script: 文字体系
+
+    Returns:
+        units: CJK文本返回字符列表，拉丁文字返回单词列表
+    """
+    if script == SCRIPT_CJK:
+        return [char for char in cleaned if not char.isspace()]
+    return cleaned.split()
+
+
+def join_units(units, script):
+    """
+    把基本单位重新拼接为文本
+
+    Args:
+        units: 单位列表
+        script: 文字体系
+
+    Returns:
+        text: 拼接后的文本
+    """
+    return ''.join(units) if script == SCRIPT_CJK else ' '.join(units)
+
+
+def _hash_shingle(shingle):
+    """计算单词片段的64位哈希"""
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _mix64(value):
+    """splitmix64 混合函数，把整数均匀映射到64位"""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def shingle_chars(chars, size):
+    """
+    把字符序列切分为字符n-gram并计算哈希
+
+    每个码位不超过21位，n-gram的码位直接拼接为整数后再混合，
+    不需要为每个片段创建字符串和调用哈希库。
+
+    Args:
+        chars: 字符列表
+        size: n-gram长度
+
+    Returns:
+        shingles: 排序去重后的哈希数组(array('Q'))
+    """
+    if not chars:
+        return array('Q')
+
+    codes = [ord(char) for char in chars]
+    if len(codes) <= size:
+        value = 0
+        for code in codes:
+            value = (value << 21) | code
+        return array('Q', [_mix64(value)])
+
+    window_mask = (1 << (21 * size)) - 1
+    value = 0
+    for code in codes[:size - 1]:
+        value = (value << 21) | code
+
+    grams = set()
+    for code in codes[size - 1:]:
+        value = ((value << 21) | code) & window_mask
+        grams.add(value)
+
+    # 内联 _mix64，避免逐个片段的函数调用
+    mixed = []
+    for value in grams:
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+        mixed.append(value ^ (value >> 31))
+    mixed.sort()
+    return array('Q', mixed)
+
+
+def shingle_units(units, size):
+    """
+    把单词序列切分为n-gram片段并计算哈希
+
+    Args:
+        units: 单词列表
+        size: n-gram长度
+
+    Returns:
+        shingles: 排序去重后的哈希数组(array('Q'))
+    """
+    if not units:
+        return array('Q')
+
+    if len(units) <= size:
+        grams = {'\x1f'.join(units)}
+    else:
+        grams = {'\x1f'.join(units[i:i + size]) for i in range(len(units) - size + 1)}
+
+    return array('Q', sorted(_hash_shingle(gram) for gram in grams))
+
+
+@lru_cache(maxsize=1024)
+def get_shingles(text, language_code=None):
+    """
+    生成文本的哈希片段集合
+
+    供MinHash/LSH候选索引计算签名；结果会被缓存，同一段文本在建立索引和查询时只切分一次。
+    返回的数组是共享的，调用方不应修改。
+
+    Args:
+        text: 原始文本
+        language_code: 语言代码(可选)
+
+    Returns:
+        shingles: 排序去重后的哈希数组(array('Q'))
+    """
+    clean = clean_text(text)
+    script = detect_script(clean, language_code)
+    if script == SCRIPT_CJK:
+        return shingle_chars(split_units(clean, script), CHAR_NGRAM_SIZE)
+    return shingle_units(split_units(clean, script), WORD_NGRAM_SIZE)
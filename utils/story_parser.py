@@ -0,0 +1,171 @@
+"""
+故事Markdown解析
+按行扫描一次，把故事拆分为标题、基本信息和各个二级标题部分，解析结果按内容缓存，
+供格式化和验证函数共用
+"""
+
+from functools import lru_cache
+from types import MappingProxyType
+
+# 解析结果缓存的故事数
+PARSE_CACHE_SIZE = 256
+
+BASIC_INFO_SECTION = '基本信息'
+
+
+def normalize_key(name):
+    """
+    把标题或基本信息的键规范化为字典键(小写、空格替换为下划线)
+
+    Args:
+        name: 原始名称
+
+    Returns:
+        key: 规范化后的键
+    """
+    return name.strip().lower().replace(' ', '_')
+
+
+class Section:
+    """故事中的一个二级标题部分"""
+
+    __slots__ = ('name', 'key', 'heading_start', 'start', 'end', '_source')
+
+    def __init__(self, source, name, heading_start, start, end):
+        """
+        Args:
+            source: 故事全文
+            name: 标题文字(不含 "## ")
+            heading_start: 标题行在全文中的起始位置
+            start: 正文起始位置(标题行之后)
+            end: 正文结束位置(下一个二级标题或全文末尾)
+        """
+        self._source = source
+        self.name = name
+        self.key = normalize_key(name)
+        self.heading_start = heading_start
+        self.start = start
+        self.end = end
+
+    @property
+    def content(self):
+        """去除首尾空白的正文"""
+        return self._source[self.start:self.end].strip()
+
+    def __repr__(self):
+        return f"Section({self.name!r}, {self.start}, {self.end})"
+
+
+class StoryDocument:
+    """解析后的故事，只读"""
+
+    __slots__ = ('source', 'title', 'sections', 'basic_info', '_by_name')
+
+    def __init__(self, source, title, sections, basic_info):
+        self.source = source
+        self.title = title
+        self.sections = tuple(sections)
+        self.basic_info = MappingProxyType(basic_info)
+        self._by_name = {}
+        for section in self.sections:
+            self._by_name.setdefault(section.name, section)
+
+    def section(self, name):
+        """
+        按标题文字查找部分
+
+        没有同名部分时，取第一个以该文字开头、其后为空白的部分，
+        如 "故事梗概 (Summary)" 也对应 "故事梗概"。
+
+        Args:
+            name: 标题文字，如 "故事梗概"
+
+        Returns:
+            section: 匹配的部分，不存在时为None
+        """
+        section = self._by_name.get(name)
+        if section is None:
+            length = len(name)
+            for candidate in self.sections:
+                if candidate.name.startswith(name) and candidate.name[length:length + 1].isspace():
+                    return candidate
+        return section
+
+    def has_section(self, name):
+        """是否包含指定标题的部分，匹配规则见 section()"""
+        return self.section(name) is not None
+
+    def section_content(self, name):
+        """
+        获取部分的正文，匹配规则见 section()
+
+        Returns:
+            content: 去除首尾空白的正文，部分不存在时为None
+        """
+        section = self.section(name)
+        return section.content if section is not None else None
+
+
+def _parse_basic_info(text):
+    """
+    解析基本信息列表 "- 键: 值"
+
+    Returns:
+        basic_info: {规范化的键: 值}
+    """
+    basic_info = {}
+    for line in text.split('\n'):
+        line = line.strip()
+        if line.startswith('-'):
+            parts = line[1:].split(':', 1)
+            if len(parts) == 2:
+                basic_info[normalize_key(parts[0])] = parts[1].strip()
+    return basic_info
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_story(content):
+    """
+    解析故事Markdown
+
+    一级标题取第一行 "# " 开头的行；二级标题为 "## " 开头的行，
+    每个部分的正文延续到下一个二级标题或全文末尾。
+
+    Args:
+        content: 故事Markdown内容
+
+    Returns:
+        document: StoryDocument，相同内容重复解析时返回缓存的结果
+    """
+    length = len(content)
+
+    # 一级标题：第一行以 "# " 开头的行
+    title = None
+    title_start = 0 if content.startswith('# ') else content.find('\n# ') + 1
+    if title_start > 0 or content.startswith('# '):
+        title_end = content.find('\n', title_start)
+        title = content[title_start + 2:title_end if title_end >= 0 else length].strip()
+
+    # 二级标题行的起始位置，用 str.find 定位，不逐行处理正文
+    heading_starts = [0] if content.startswith('## ') else []
+    position = content.find('\n## ')
+    while position >= 0:
+        heading_starts.append(position + 1)
+        position = content.find('\n## ', position + 1)
+
+    sections = []
+    for index, heading_start in enumerate(heading_starts):
+        heading_end = content.find('\n', heading_start)
+        if heading_end < 0:
+            heading_end = length
+        end = heading_starts[index + 1] if index + 1 < len(heading_starts) else length
+        name = content[heading_start + 3:heading_end].strip()
+        sections.append(Section(content, name, heading_start, min(heading_end + 1, length), end))
+
+    basic_info = {}
+    for section in sections:
+        if section.name == BASIC_INFO_SECTION:
+            basic_info = _parse_basic_info(content[section.start:section.end])
+            break
+
+    return StoryDocument(content, title, sections, basic_info)
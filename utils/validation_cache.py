@@ -0,0 +1,139 @@
+"""
+验证结果缓存
+按内容哈希保存每条验证规则的结果，规则版本变化时只有该规则的结果失效
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+# 等待其他进程释放写锁的时间(秒)
+BUSY_TIMEOUT = 5.0
+
+
+def content_hash(content):
+    """
+    计算故事内容的哈希
+
+    Args:
+        content: 故事内容
+
+    Returns:
+        digest: SHA-256十六进制摘要
+    """
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class ValidationCache:
+    """验证结果缓存，存储在SQLite文件中"""
+
+    def __init__(self, filepath=None):
+        """
+        初始化缓存
+
+        Args:
+            filepath: 缓存数据库路径，为None时只在内存中缓存
+        """
+        self.filepath = filepath
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _get_connection(self):
+        """
+        获取数据库连接；进程池fork出的工作进程会重新打开连接，不复用父进程的连接
+        """
+        if self._conn is None or self._pid != os.getpid():
+            if self.filepath:
+                directory = os.path.dirname(self.filepath)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.filepath or ':memory:', timeout=BUSY_TIMEOUT, check_same_thread=False)
+            if self.filepath:
+                conn.execute('PRAGMA journal_mode = WAL')
+                conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS validation_results (
+                    content_hash TEXT NOT NULL,
+                    rule TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (content_hash, rule)
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, digest, rule_versions):
+        """
+        读取一个内容的缓存结果
+
+        Args:
+            digest: 内容哈希
+            rule_versions: {规则名: 当前版本}
+
+        Returns:
+            results: {规则名: 结果}，只包含版本与当前版本一致的规则
+        """
+        with self._lock:
+            rows = self._get_connection().execute(
+                'SELECT rule, version, result FROM validation_results WHERE content_hash = ?', (digest,)
+            ).fetchall()
+
+        results = {}
+        for rule, version, result in rows:
+            if rule_versions.get(rule) == version:
+                results[rule] = json.loads(result)
+        self.stats['hits'] += len(results)
+        self.stats['misses'] += len(rule_versions) - len(results)
+        return results
+
+    def put(self, digest, results, rule_versions):
+        """
+        写入一个内容的验证结果，覆盖旧版本的结果
+
+        Args:
+            digest: 内容哈希
+            results: {规则名: 可JSON序列化的结果}
+            rule_versions: {规则名: 当前版本}
+
+        Returns:
+            success: 是否写入成功
+        """
+        if not results:
+            return True
+        rows = [
+            (digest, rule, rule_versions[rule], json.dumps(result, ensure_ascii=False))
+            for rule, result in results.items()
+        ]
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                with conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO validation_results (content_hash, rule, version, result) '
+                        'VALUES (?, ?, ?, ?)', rows
+                    )
+            return True
+        except sqlite3.Error:
+            return False
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._get_connection()
+            with conn:
+                conn.execute('DELETE FROM validation_results')
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None